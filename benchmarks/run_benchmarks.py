@@ -0,0 +1,446 @@
+# ============================================================
+# run_benchmarks.py
+# Microbenchmarks + regression check for the hot paths.
+#
+# Runs offline (no controller, no network, CPU-only numpy LSTM):
+#   python benchmarks/run_benchmarks.py --shared-dir model/sharedModels
+#   python benchmarks/run_benchmarks.py --update-baseline
+#   python benchmarks/run_benchmarks.py --filter inference --max-regression 0.2
+#   python benchmarks/run_benchmarks.py --repeats 5 --max-p99-regression 1.0
+#   python benchmarks/run_benchmarks.py --filter train     (LSTM training input rate)
+#
+# Each case reports ops/s, p50/p99 latency per call and peak
+# traced memory (median over --repeats runs). Results are compared
+# with benchmarks/baseline.json; the exit code is 1 when a case
+# regresses by more than --max-regression (throughput drop or p50
+# increase). p99 is too noisy to gate on by default, especially
+# against a baseline from another machine; --max-p99-regression
+# adds a p99 check with its own tolerance.
+# Cases whose dependencies are missing (ryu, shared
+# artifacts, ...) are reported as skipped.
+# ============================================================
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+MODEL_DIR = os.path.join(ROOT, "model")
+TELEMETRY_DIR = os.path.join(ROOT, "monitoring_and_telemetry")
+CONTROLLER_DIR = os.path.join(ROOT, "controller_apps")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+sys.path.insert(0, MODEL_DIR)
+sys.path.insert(0, TELEMETRY_DIR)
+
+CASES = []
+
+
+class Skip(Exception):
+    """Raised by a case setup when its dependencies are unavailable."""
+
+
+def case(name):
+    def register(setup):
+        CASES.append((name, setup))
+        return setup
+    return register
+
+
+# ---------------------------------------------------------------
+# Shared fixtures
+# ---------------------------------------------------------------
+_fixtures = {}
+
+
+def sample_rows(n=64):
+    """Rows from the bundled capture (or synthetic ones if it is missing)."""
+    if "rows" not in _fixtures:
+        path = os.path.join(MODEL_DIR, "training_data.csv")
+        if os.path.exists(path):
+            import pandas as pd
+            _fixtures["rows"] = pd.read_csv(path, nrows=2000).to_dict("records")
+        else:
+            rng = np.random.default_rng(0)
+            from feature_ring import RECORD_FIELDS
+            _fixtures["rows"] = [dict(zip(RECORD_FIELDS, rng.random(len(RECORD_FIELDS))))
+                                 for _ in range(2000)]
+    return _fixtures["rows"][:n] if n else _fixtures["rows"]
+
+
+def inference(shared_dir):
+    if not shared_dir or not os.path.isdir(shared_dir):
+        raise Skip("no shared artifacts (run model/shared_artifacts.py or pass --shared-dir)")
+    if "infer" not in _fixtures:
+        from anomaly_inference import AnomalyInference
+        _fixtures["infer"] = AnomalyInference(shared_dir=shared_dir)
+    return _fixtures["infer"]
+
+
+# ---------------------------------------------------------------
+# Cases: each setup returns a zero-argument callable (one op)
+# ---------------------------------------------------------------
+@case("features.update")
+def bench_features_update(opts):
+    # the agent's per-sample path: one raw snapshot through the feature engine
+    from feature_engine import FeatureEngine
+    engine = FeatureEngine(window=50)
+    state = {"t": 1000.0, "n": 0}
+    rng = np.random.default_rng(0)
+    cpu = rng.random(1024) * 100
+    raw = np.zeros(9)
+
+    def op():
+        state["t"] += 1.0
+        state["n"] += 37
+        n = state["n"]
+        raw[:] = (state["t"], cpu[n % 1024], 40.1, 0.05, n, n // 2, n // 10, 0, n * 1500)
+        engine.update(raw)
+    return op
+
+
+@case("features.compute_4k")
+def bench_features_compute(opts):
+    # offline rebuild: 4096 raw snapshots derived in one vectorized pass
+    from feature_engine import compute
+    rng = np.random.default_rng(0)
+    n = np.arange(4096.0) * 37
+    raw = np.column_stack([1000.0 + np.arange(4096.0), rng.random(4096) * 100,
+                           np.full(4096, 40.1), np.full(4096, 0.05),
+                           n, n // 2, n // 10, np.zeros(4096), n * 1500])
+    return lambda: compute(raw, window=50)
+
+
+@case("inference.update_lstm")
+def bench_update_lstm(opts):
+    infer = inference(opts.shared_dir)
+    from anomaly_inference import LSTM_FEATURES
+    rows = [[r[f] for f in LSTM_FEATURES] for r in sample_rows(256)]
+    for x in rows[:infer.seq_len]:
+        infer.push_lstm(x)
+    it = iter(range(1 << 62))
+    return lambda: infer.update_lstm(rows[next(it) % len(rows)])
+
+
+@case("inference.update_if")
+def bench_update_if(opts):
+    infer = inference(opts.shared_dir)
+    rows = [[r[f] for f in infer.iso_features] for r in sample_rows(256)]
+    it = iter(range(1 << 62))
+    return lambda: infer.update_if(rows[next(it) % len(rows)])
+
+
+@case("engine.run_normal")
+def bench_engine_normal(opts):
+    from diagnosis_decision_engine import MLDecisionEngine
+    engine = MLDecisionEngine()
+    lstm_output = {"lstm_anomaly": False, "error": 0.1, "reasons": []}
+    if_output = {"if_anomaly": False, "score": -0.1, "reasons": []}
+    return lambda: engine.run(lstm_output, if_output)
+
+
+@case("engine.run_anomaly")
+def bench_engine_anomaly(opts):
+    from diagnosis_decision_engine import MLDecisionEngine
+    engine = MLDecisionEngine()
+    lstm_output = {"lstm_anomaly": True, "error": 3.1,
+                   "reasons": ["Controller broadcast spike", "Packet-In burst / possible DoS", "CPU spike / overload"]}
+    if_output = {"if_anomaly": True, "score": 0.2,
+                 "reasons": ["DoS Attack (High Packet-In)", "Memory Usage", "CPU Usage"]}
+    return lambda: engine.run(lstm_output, if_output)
+
+
+@case("engine.classify_anomaly")
+def bench_classify(opts):
+    from diagnosis_decision_engine import MLDecisionEngine
+    engine = MLDecisionEngine()
+    lstm_reasons = ["Bandwidth anomaly", "RTT spike / latency anomaly", "Flow churn anomaly"]
+    if_reasons = ["Aggregate Z-Score", "Bandwidth Surge", "CPU Usage"]
+    return lambda: engine.classify_anomaly(lstm_reasons, if_reasons)
+
+
+@case("csv.append_row_pandas")
+def bench_csv_append(opts):
+    # the agent's former write path: one-row DataFrame appended per tick
+    import pandas as pd
+    from feature_ring import RECORD_FIELDS
+    path = os.path.join(opts.tmp, "append.csv")
+    pd.DataFrame(columns=RECORD_FIELDS).to_csv(path, index=False)
+    row = sample_rows(1)[0]
+    return lambda: pd.DataFrame([row], columns=RECORD_FIELDS).to_csv(path, mode='a', header=False, index=False)
+
+
+@case("csv.append_record")
+def bench_csv_append_record(opts):
+    # the agent's write path: one feature_schema record written as a CSV line
+    from feature_schema import RECORD_FIELDS
+    path = os.path.join(opts.tmp, "append_record.csv")
+    with open(path, "w") as f:
+        f.write(",".join(RECORD_FIELDS) + "\n")
+    record = np.array([float(sample_rows(1)[0][c]) for c in RECORD_FIELDS])
+    index = list(range(len(RECORD_FIELDS)))
+
+    def op():
+        with open(path, "a") as f:
+            f.write(",".join(map(repr, record[index].tolist())) + "\n")
+    return op
+
+
+@case("csv.tail_read_row")
+def bench_csv_tail(opts):
+    # the pipeline's read path: one appended row picked up by the tail reader
+    from tail_reader import CsvTailReader
+    from feature_ring import RECORD_FIELDS
+    path = os.path.join(opts.tmp, "tail.csv")
+    with open(path, "w") as f:
+        f.write(",".join(RECORD_FIELDS) + "\n")
+    reader = CsvTailReader(path, from_start=True, use_inotify=False)
+    line = ",".join(repr(float(sample_rows(1)[0][c])) for c in RECORD_FIELDS) + "\n"
+    out = open(path, "a")
+
+    def op():
+        out.write(line)
+        out.flush()
+        (columns, block), = reader.read_blocks()
+        assert len(block) == 1
+    return op
+
+
+@case("ring.publish_poll")
+def bench_ring(opts):
+    from feature_ring import FeatureRingWriter, FeatureRingReader, view_to_records, RECORD_FIELDS
+    path = os.path.join(opts.tmp, "bench.ring")
+    writer = FeatureRingWriter(path, capacity=1024)
+    reader = FeatureRingReader(path)
+    reader.poll()                     # attach at the current write position
+    values = [float(sample_rows(1)[0][c]) for c in RECORD_FIELDS]
+
+    def op():
+        writer.publish(values)
+        first, view = reader.poll()
+        records = view_to_records(view)
+        assert reader.validate(first, len(records))
+    return op
+
+
+@case("decision_log.write")
+def bench_decision_log(opts):
+    from decision_sink import DecisionLog
+    log = DecisionLog(os.path.join(opts.tmp, "decisions.json"), compress=False)
+    normal = {"anomaly": False, "type": "normal", "severity": "LOW"}
+    anomaly = {"anomaly": True, "type": "packet_in_burst", "severity": "CRITICAL",
+               "why": "LSTM reasons: [] | IF reasons: ['DoS Attack (High Packet-In)']"}
+    it = iter(range(1 << 62))
+
+    def op():
+        d = dict(anomaly if next(it) % 20 == 0 else normal)
+        d["timestamp"] = time.time()
+        log.write(d)
+    return op
+
+
+def lstm_training_module():
+    try:
+        import tensorflow  # noqa: F401
+    except ImportError:
+        raise Skip("tensorflow not installed")
+    import lstm_final
+    return lstm_final
+
+
+def training_array(n=200000):
+    """Synthetic scaled LSTM inputs, larger than the bundled capture."""
+    if "train" not in _fixtures:
+        _fixtures["train"] = np.random.default_rng(0).random((n, 8), dtype=np.float32)
+    return _fixtures["train"]
+
+
+@case("train.create_sequences")
+def bench_create_sequences(opts):
+    # whole (N, 20, 8) window set of a 200k-row capture
+    lstm_final = lstm_training_module()
+    data = training_array()
+    return lambda: lstm_final.create_sequences(data, lstm_final.SEQ_LEN)
+
+
+@case("train.input_batch")
+def bench_input_batch(opts):
+    # one op = one training batch (BATCH_SIZE windows) out of the tf.data input
+    lstm_final = lstm_training_module()
+    ds = lstm_final.make_dataset(training_array(), lstm_final.SEQ_LEN, lstm_final.BATCH_SIZE).repeat()
+    it = iter(ds)
+    return lambda: next(it)
+
+
+@case("controller.packet_in")
+def bench_packet_in(opts):
+    try:
+        from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+        from ryu.lib.packet import packet, ethernet
+        sys.path.insert(0, CONTROLLER_DIR)
+        import sh_controller
+    except ImportError as e:
+        raise Skip(f"ryu not installed ({e.name})")
+
+    class StubDatapath:
+        id = 1
+        ofproto = ofproto_v1_3
+        ofproto_parser = ofproto_v1_3_parser
+
+        def send_msg(self, msg):
+            pass
+
+    class StubWSGI:
+        def register(self, *args, **kwargs):
+            pass
+
+    class Event:
+        def __init__(self, msg):
+            self.msg = msg
+
+    app = sh_controller.SelfHealingController(wsgi=StubWSGI())
+    dp = StubDatapath()
+    pkt = packet.Packet()
+    pkt.add_protocol(ethernet.ethernet(dst="00:00:00:00:00:02", src="00:00:00:00:00:01"))
+    pkt.serialize()
+    msg = ofproto_v1_3_parser.OFPPacketIn(
+        dp, buffer_id=ofproto_v1_3.OFP_NO_BUFFER, total_len=len(pkt.data),
+        reason=ofproto_v1_3.OFPR_NO_MATCH, table_id=0, cookie=0,
+        match=ofproto_v1_3_parser.OFPMatch(in_port=1), data=bytes(pkt.data))
+    ev = Event(msg)
+    return lambda: app._packet_in_handler(ev)
+
+
+# ---------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------
+def measure(op, min_time=0.5, min_iters=200, max_iters=200000, mem_iters=200):
+    for _ in range(min(50, min_iters)):          # warm-up
+        op()
+
+    clock = time.perf_counter_ns
+    lat = []
+    start = clock()
+    deadline = start + int(min_time * 1e9)
+    while len(lat) < max_iters and (len(lat) < min_iters or clock() < deadline):
+        t = clock()
+        op()
+        lat.append(clock() - t)
+    total_s = (clock() - start) / 1e9
+
+    # peak traced allocations over a separate run (tracing slows the op down)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    for _ in range(mem_iters):
+        op()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    lat_us = np.array(lat) / 1000.0
+    return {
+        "iterations": len(lat),
+        "ops_per_s": len(lat) / total_s,
+        "p50_us": float(np.percentile(lat_us, 50)),
+        "p99_us": float(np.percentile(lat_us, 99)),
+        "peak_mem_kb": max(peak, 0) / 1024.0,
+    }
+
+
+def measure_repeated(op, repeats=1, **kwargs):
+    """Median of each metric over `repeats` runs of measure()."""
+    runs = [measure(op, **kwargs) for _ in range(max(1, repeats))]
+    r = {k: float(np.median([run[k] for run in runs])) for k in runs[0]}
+    r["iterations"] = int(r["iterations"])
+    r["repeats"] = len(runs)
+    return r
+
+
+def compare(results, baseline, max_regression, max_p99_regression=None):
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None or "ops_per_s" not in r:
+            continue
+        if r["ops_per_s"] < b["ops_per_s"] * (1.0 - max_regression):
+            regressions.append(f"{name}: ops/s {r['ops_per_s']:.0f} < baseline {b['ops_per_s']:.0f}")
+        if r["p50_us"] > b["p50_us"] * (1.0 + max_regression):
+            regressions.append(f"{name}: p50 {r['p50_us']:.1f}us > baseline {b['p50_us']:.1f}us")
+        if max_p99_regression is not None and r["p99_us"] > b["p99_us"] * (1.0 + max_p99_regression):
+            regressions.append(f"{name}: p99 {r['p99_us']:.1f}us > baseline {b['p99_us']:.1f}us")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks with regression check")
+    parser.add_argument("--filter", default=None, help="only cases whose name contains this string")
+    parser.add_argument("--shared-dir", default=os.path.join(MODEL_DIR, "sharedModels"))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed fractional throughput drop / p50 increase")
+    parser.add_argument("--max-p99-regression", type=float, default=None,
+                        help="also fail on a p99 increase above this fraction (off by default)")
+    parser.add_argument("--repeats", type=int, default=1,
+                        help="runs per case; the median of each metric is reported")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per case")
+    parser.add_argument("--json", default=None, help="also write results to this file")
+    opts = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="sdn_bench_") as tmp:
+        opts.tmp = tmp
+        for name, setup in CASES:
+            if opts.filter and opts.filter not in name:
+                continue
+            try:
+                op = setup(opts)
+            except Skip as e:
+                results[name] = {"skipped": str(e)}
+                print(f"{name:<28} SKIPPED ({e})")
+                continue
+            r = measure_repeated(op, opts.repeats, min_time=opts.min_time)
+            results[name] = r
+            print(f"{name:<28} {r['ops_per_s']:>12.0f} ops/s  p50 {r['p50_us']:>9.2f}us  "
+                  f"p99 {r['p99_us']:>9.2f}us  peak {r['peak_mem_kb']:>8.1f}KB")
+
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if opts.update_baseline:
+        baseline = {}
+        if os.path.exists(opts.baseline):
+            with open(opts.baseline) as f:
+                baseline = json.load(f).get("cases", {})
+        baseline.update({k: v for k, v in results.items() if "skipped" not in v})
+        with open(opts.baseline, "w") as f:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(),
+                       "updated": time.strftime("%Y-%m-%d"), "cases": baseline}, f, indent=2)
+        print(f"[*] Baseline written: {opts.baseline}")
+        return 0
+
+    if not os.path.exists(opts.baseline):
+        print("[*] No baseline yet (run with --update-baseline)")
+        return 0
+    with open(opts.baseline) as f:
+        baseline = json.load(f).get("cases", {})
+    regressions = compare(results, baseline, opts.max_regression, opts.max_p99_regression)
+    if regressions:
+        print("\n[-] Regressions (> {:.0%}):".format(opts.max_regression))
+        for r in regressions:
+            print("    " + r)
+        return 1
+    print("\n[*] No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
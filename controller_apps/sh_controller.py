@@ -28,6 +28,8 @@ class SelfHealingController(app_manager.RyuApp):
         self.flow_mod_count = 0
         self.port_status_count = 0  # FEATURE: Link Flaps / Status Changes
         self.start_time = time.time()
+        # LATENCY TRACE: first packet-in / port-status since the last snapshot
+        self.first_event_ts = None
         
         # Link map for topology discovery
         self.mac_to_port = {}
@@ -48,6 +50,8 @@ class SelfHealingController(app_manager.RyuApp):
     def _port_status_handler(self, ev):
         # Triggered when a link goes DOWN or UP
         self.port_status_count += 1
+        if self.first_event_ts is None:
+            self.first_event_ts = time.time()
         msg = ev.msg
         reason = msg.reason
         port_no = msg.desc.port_no
@@ -80,6 +84,8 @@ class SelfHealingController(app_manager.RyuApp):
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
         self.packet_in_count += 1  # FEATURE: Increment Packet In Count
+        if self.first_event_ts is None:
+            self.first_event_ts = time.time()
         
         msg = ev.msg
         datapath = msg.datapath
@@ -126,12 +132,17 @@ class SelfHealingControllerController(ControllerBase):
     @route('sh_features', URL, methods=['GET'])
     def get_features(self, req, **kwargs):
         # EXPOSE METRICS TO TELEMETRY AGENT
+        # snapshot_ts / first_event_ts are the origin timestamps for latency tracing
+        first_event_ts = self.sh_app.first_event_ts
+        self.sh_app.first_event_ts = None
         body = json.dumps({
             "packet_in": self.sh_app.packet_in_count,
             "packet_out": self.sh_app.packet_out_count,
             "flow_mod": self.sh_app.flow_mod_count,
             "port_status": self.sh_app.port_status_count, # NEW FEATURE
-            "uptime": time.time() - self.sh_app.start_time
+            "uptime": time.time() - self.sh_app.start_time,
+            "snapshot_ts": time.time(),
+            "first_event_ts": first_event_ts
         })
         # FIX IS HERE: Added charset='utf-8'
         return Response(content_type='application/json', body=body, charset='utf-8')
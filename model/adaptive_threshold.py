@@ -0,0 +1,206 @@
+# ============================================================
+# adaptive_threshold.py
+# Online, constant-memory anomaly thresholds.
+#
+# Each (model, stream) pair keeps P² quantile sketches (Jain &
+# Chlamtac, 1985: five markers per quantile, no sample storage)
+# over a sliding window of recent scores. Every publish_every
+# samples the tracked quantile becomes the new threshold.
+# ============================================================
+
+import os
+import json
+import math
+import time
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile p using five markers (O(1) memory)."""
+
+    __slots__ = ("p", "count", "q", "n", "np", "dn")
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.q = []                                   # marker heights
+        self.n = [0, 1, 2, 3, 4]                      # marker positions
+        self.np = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]  # desired positions
+        self.dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x):
+        self.count += 1
+
+        if self.count <= 5:
+            self.q.append(x)
+            self.q.sort()
+            return
+
+        q, n = self.q, self.n
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        for i in range(1, 4):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = self._parabolic(i, d)
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if self.count == 0:
+            return math.nan
+        if self.count <= 5:
+            idx = min(int(self.p * self.count), self.count - 1)
+            return self.q[idx]
+        return self.q[2]
+
+
+class WindowedQuantile:
+    """
+    Quantile of roughly the last `window` samples: two P² sketches in
+    rotation. The full (previous) sketch answers queries while the
+    current one fills, then they swap. Memory never grows.
+    """
+
+    __slots__ = ("p", "window", "current", "previous")
+
+    def __init__(self, p, window):
+        self.p = p
+        self.window = window
+        self.current = P2Quantile(p)
+        self.previous = None
+
+    def add(self, x):
+        self.current.add(x)
+        if self.current.count >= self.window:
+            self.previous, self.current = self.current, P2Quantile(self.p)
+
+    @property
+    def count(self):
+        return self.current.count + (self.previous.count if self.previous else 0)
+
+    def value(self):
+        # Prefer whichever sketch has seen more samples
+        if self.previous is not None and self.previous.count >= self.current.count:
+            return self.previous.value()
+        return self.current.value()
+
+
+class AdaptiveThresholds:
+    """
+    Per-model, per-stream adaptive thresholds.
+
+    Exclusion rule: a score further above the current threshold than
+    exclude_margin * (threshold - median) is treated as an incident sample
+    and not fed to the sketches, so sustained attacks cannot raise their
+    own threshold. Scores just above the threshold are still fed, so the
+    threshold can follow a genuine upward drift of the baseline.
+
+    Published thresholds are clamped to [min_factor, max_factor] x the
+    training threshold.
+    """
+
+    def __init__(self, base_thresholds, quantiles=None, window=3600,
+                 publish_every=300, min_samples=600, exclude_margin=1.0,
+                 min_factor=0.5, max_factor=3.0):
+        # base_thresholds: {"lstm": float, "if": float} from training
+        self.base = dict(base_thresholds)
+        # LSTM: mean + 3 sigma  ~ 0.9987 quantile; IF: 99th percentile
+        self.quantiles = quantiles or {"lstm": 0.9987, "if": 0.99}
+        self.window = window
+        self.publish_every = publish_every
+        self.min_samples = min_samples
+        self.exclude_margin = exclude_margin
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+
+        self.streams = {}     # (model, stream) -> state dict
+
+    def _state(self, model, stream):
+        key = (model, stream)
+        state = self.streams.get(key)
+        if state is None:
+            state = {
+                "tail": WindowedQuantile(self.quantiles[model], self.window),
+                "median": WindowedQuantile(0.5, self.window),
+                "threshold": self.base[model],
+                "seen": 0,
+                "excluded": 0,
+            }
+            self.streams[key] = state
+        return state
+
+    def threshold(self, model, stream="default"):
+        state = self.streams.get((model, stream))
+        return state["threshold"] if state else self.base[model]
+
+    def update(self, model, score, stream="default"):
+        """
+        Feeds one score. Returns the newly published threshold when this
+        sample triggered a publish, else None.
+        """
+        state = self._state(model, stream)
+        state["seen"] += 1
+
+        thr = state["threshold"]
+        median = state["median"].value()
+        if state["median"].count and score > thr + self.exclude_margin * max(thr - median, 0.0):
+            state["excluded"] += 1
+        else:
+            state["tail"].add(score)
+            state["median"].add(score)
+
+        if state["seen"] % self.publish_every or state["tail"].count < self.min_samples:
+            return None
+
+        base = self.base[model]
+        lo, hi = sorted((base * self.min_factor, base * self.max_factor))
+        state["threshold"] = min(max(state["tail"].value(), lo), hi)
+        return state["threshold"]
+
+    def reset(self, base_thresholds):
+        """Drop all sketches (e.g. after a model swap changes score scales)."""
+        self.base = dict(base_thresholds)
+        self.streams.clear()
+
+    def snapshot(self):
+        return {
+            f"{model}/{stream}": {
+                "threshold": s["threshold"],
+                "base": self.base[model],
+                "median": s["median"].value(),
+                "seen": s["seen"],
+                "excluded": s["excluded"],
+            }
+            for (model, stream), s in self.streams.items()
+        }
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"updated": time.time(), "thresholds": self.snapshot()}, f, indent=2)
+        os.replace(tmp, path)
@@ -3,25 +3,94 @@
 # Runs LSTM + Isolation Forest inference and extracts reasons
 # ============================================================
 
+from collections import deque
+
+import os
+import sys
+
 import numpy as np
 import joblib
-import tensorflow as tf
 
+from explain import top_k, labels, IFReasoner
 
-class AnomalyInference:
+# Feature order shared with the telemetry agent and the training scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "monitoring_and_telemetry"))
+from feature_schema import LSTM_FEATURES, IF_FEATURES
 
-    def __init__(self):
 
-        # -------------------------------
-        # Load LSTM model + scaler
-        # -------------------------------
-        self.lstm_model = tf.keras.models.load_model(
+class ModelBundle:
+    """
+    One loaded model version: LSTM + IF with their scalers, thresholds,
+    feature lists and the IF normal-population baseline (None for models
+    trained without one), plus the optional multi-horizon forecaster.
+    AnomalyInference scores against exactly one bundle at a time.
+    """
+
+    def __init__(self, lstm_model, lstm_scaler, lstm_threshold,
+                 if_model, if_scaler, if_threshold,
+                 lstm_features=None, if_features=None, seq_len=20, version="local",
+                 if_baseline=None, forecast_model=None, forecast_info=None):
+        self.lstm_model = lstm_model
+        self.lstm_scaler = lstm_scaler
+        self.lstm_threshold = lstm_threshold
+        self.if_model = if_model
+        self.if_scaler = if_scaler
+        self.if_threshold = if_threshold
+        self.lstm_features = lstm_features
+        self.if_features = if_features
+        self.seq_len = seq_len
+        self.version = version
+        self.if_baseline = if_baseline
+        self.forecast_model = forecast_model
+        self.forecast_info = forecast_info
+
+    @classmethod
+    def from_local(cls, shared_dir=None):
+        # shared_dir: directory written by shared_artifacts.py. Models are then
+        # memory-mapped read-only (shared across worker processes) and
+        # TensorFlow is never imported.
+        if shared_dir:
+            from shared_artifacts import SharedModels
+            shared = SharedModels(shared_dir)
+            return cls(
+                shared.lstm_model, shared.lstm_scaler, shared.lstm_threshold,
+                shared.if_model, shared.if_scaler, shared.if_threshold,
+                seq_len=shared.meta.get("seq_len", 20),
+                version=f"shared:{shared_dir}",
+                if_baseline=shared.if_baseline,
+                forecast_model=shared.forecast_model,
+                forecast_info=shared.forecast_info
+            )
+
+        import tensorflow as tf
+        lstm_model = tf.keras.models.load_model(
             "lstmModels/lstm_best_model.h5",
             custom_objects={"r2_metric": lambda y_true, y_pred: 0}
         )
-        self.lstm_scaler = joblib.load("lstmModels/lstm_scaler.pkl")
-        self.lstm_info = joblib.load("lstmModels/lstm_threshold_info.pkl")
-        self.lstm_threshold = self.lstm_info["threshold"]
+        if_info = joblib.load("ifmodels/if_threshold_info.pkl")
+
+        forecast_model = forecast_info = None
+        if os.path.exists("lstmModels/lstm_forecast_model.h5"):
+            forecast_model = tf.keras.models.load_model("lstmModels/lstm_forecast_model.h5", compile=False)
+            forecast_info = joblib.load("lstmModels/lstm_forecast_info.pkl")
+
+        return cls(
+            lstm_model,
+            joblib.load("lstmModels/lstm_scaler.pkl"),
+            joblib.load("lstmModels/lstm_threshold_info.pkl")["threshold"],
+            joblib.load("ifmodels/isolation_forest_model.pkl"),
+            joblib.load("ifmodels/if_scaler.pkl"),
+            if_info["threshold"],
+            if_features=if_info.get("features"),
+            if_baseline=if_info.get("baseline"),
+            forecast_model=forecast_model,
+            forecast_info=forecast_info
+        )
+
+
+class AnomalyInference:
+
+    def __init__(self, shared_dir=None, bundle=None):
 
         # Feature names (matching training)
         self.lstm_feature_names = [
@@ -35,16 +104,6 @@ class AnomalyInference:
             "Bandwidth anomaly"
         ]
 
-        self.seq_len = 20
-        self.buffer = []
-
-        # -------------------------------
-        # Load Isolation Forest components
-        # -------------------------------
-        self.if_model = joblib.load("ifmodels/isolation_forest_model.pkl")
-        self.if_scaler = joblib.load("ifmodels/if_scaler.pkl")
-        self.if_threshold = joblib.load("ifmodels/if_threshold_info.pkl")["threshold"]
-
         # Pretty names from IF training script
         self.pretty = {
             "if_cpu": "CPU Usage",
@@ -61,19 +120,90 @@ class AnomalyInference:
             "if_ratio_pkt_flow": "PktIn/FlowMod Imbalance"
         }
 
-        self.iso_features = list(self.pretty.keys())
+        self.iso_features = list(IF_FEATURES)
+        self.if_names = [self.pretty[f] for f in self.iso_features]
+
+        # -------------------------------
+        # Load LSTM + Isolation Forest components
+        # -------------------------------
+        self.bundle = None
+        self.previous_bundle = None
+        self.seq_len = 20
+        self.buffer = deque(maxlen=self.seq_len)
+        self.swap_models(bundle or ModelBundle.from_local(shared_dir))
+
+    # -------------------------------------------------------------------
+    # Model hot-swap (call between ticks; the rolling window is kept)
+    # -------------------------------------------------------------------
+    def swap_models(self, bundle):
+
+        # Validate and build everything first: a rejected bundle leaves the
+        # live models, window and forecaster untouched
+        if bundle.lstm_features is not None and list(bundle.lstm_features) != LSTM_FEATURES:
+            raise ValueError(f"Model {bundle.version}: LSTM feature list does not match pipeline")
+        if bundle.if_features is not None and list(bundle.if_features) != self.iso_features:
+            raise ValueError(f"Model {bundle.version}: IF feature list does not match pipeline")
+
+        # multi-horizon forecaster: same window as the LSTM (None = disabled)
+        info = bundle.forecast_info
+        forecast = bundle.forecast_model is not None and info is not None
+        if forecast and (list(info["features"]) != LSTM_FEATURES or info["seq_len"] != bundle.seq_len):
+            raise ValueError(f"Model {bundle.version}: forecaster does not match the LSTM window")
+
+        # reason tables against the bundle's normal baseline (built once per load)
+        if_reasoner = IFReasoner(self.iso_features, self.if_names,
+                                 bundle.if_scaler, bundle.if_baseline)
+
+        if bundle.seq_len != self.seq_len:
+            self.seq_len = bundle.seq_len
+            self.buffer = deque(self.buffer, maxlen=self.seq_len)
+
+        self.lstm_model = bundle.lstm_model
+        self.lstm_scaler = bundle.lstm_scaler
+        self.lstm_threshold = bundle.lstm_threshold
+        self.if_model = bundle.if_model
+        self.if_scaler = bundle.if_scaler
+        self.if_threshold = bundle.if_threshold
+        self.if_reasoner = if_reasoner
+        self.if_baseline = if_reasoner.baseline
+
+        self.forecast_model = None
+        if forecast:
+            self.forecast_model = bundle.forecast_model
+            self.horizons = np.asarray(info["horizons"])
+            self.forecast_bounds = np.asarray(info["bounds"], dtype=np.float64)
+
+        if self.bundle is not None:
+            self.previous_bundle = self.bundle
+        self.bundle = bundle
+        return self.previous_bundle
+
+    def rollback(self):
+        """Instantly return to the previously active bundle (kept in memory)."""
+        if self.previous_bundle is None:
+            return None
+        return self.swap_models(self.previous_bundle)
 
     # -------------------------------------------------------------------
     # LSTM inference for temporal anomalies
     # -------------------------------------------------------------------
     def update_lstm(self, x8_features):
 
+        self.push_lstm(x8_features)
+        return self.score_lstm()
+
+    def push_lstm(self, x8_features):
+        """Append a sample to the rolling window without running the model."""
         self.buffer.append(x8_features)
+        return len(self.buffer) >= self.seq_len
+
+    def score_lstm(self):
+        """Run the LSTM on the current window (no-op until the window is full)."""
 
         if len(self.buffer) < self.seq_len:
             return False, 0.0, []
 
-        seq = np.array(self.buffer[-self.seq_len:])
+        seq = np.array(self.buffer)
         seq_scaled = self.lstm_scaler.transform(seq)
         X = np.expand_dims(seq_scaled, axis=0)
 
@@ -85,10 +215,8 @@ class AnomalyInference:
         anomaly = error > self.lstm_threshold
 
         # feature-wise deviation
-        abs_errors = np.abs(actual - pred)
-        top_idx = np.argsort(abs_errors)[-3:][::-1]
-
-        reasons = [self.lstm_feature_names[i] for i in top_idx]
+        top_idx = top_k(np.abs(actual - pred))
+        reasons = labels(self.lstm_feature_names, top_idx)[0].tolist()
 
         return anomaly, float(error), reasons
 
@@ -110,31 +238,126 @@ class AnomalyInference:
             # artificially boost score to ensure it looks critical
             score = max(score, self.if_threshold + 0.1)
 
-        # Compute z-score deviations
-        # Simpler version: use raw deviation from mean
-        # You can enhance it by saving means/stds during training
-        z = x_scaled[0]  # approximate zscore
+        # Top deviations against the training baseline of normal rows
+        return anomaly, float(score), self.if_reasoner.reasons(x_scaled[0])
 
-        top_idx = np.argsort(np.abs(z))[-3:][::-1]
-        # Custom Diagnosis Logic for user-friendly output
-        # If Packet-In (index 3) is a top contributor, force "DoS" label
-        # even if Churn (index 9) is low (e.g. Ping Flood = 1 flow)
-        
-        reasons_refined = []
-        for i in top_idx:
-            # Index 3 is if_pkt_in (Packet-In)
-            if i == 3 and z[3] > 2: 
-                reasons_refined.append("DoS Attack (High Packet-In)")
-            
-            # Index 7 is if_link_loss (Link Failure)
-            elif i == 7 and z[7] > 0:
-                reasons_refined.append("Link Failure / Flap Detected")
-            
-            # Index 8 is Bandwidth
-            elif i == 8:
-                reasons_refined.append("Bandwidth Surge")
-            
-            else:
-                reasons_refined.append(self.pretty[self.iso_features[i]])
-                
-        return anomaly, float(score), reasons_refined
+    # -------------------------------------------------------------------
+    # Multi-horizon forecast (early warning) on the current LSTM window
+    # -------------------------------------------------------------------
+    def score_forecast(self):
+        """
+        None without a forecaster or a full window. Otherwise a dict:
+        forecast_anomaly, and for a warning the earliest crossing horizon,
+        the feature furthest above its bound, forecast value and bound.
+        """
+        if self.forecast_model is None or len(self.buffer) < self.seq_len:
+            return None
+        window = self.lstm_scaler.transform(np.array(self.buffer))[None]
+        flag, horizon, feature, value, bound = self.score_forecast_windows(window)
+        if not flag[0]:
+            return {"forecast_anomaly": False}
+        return {
+            "forecast_anomaly": True,
+            "horizon": int(horizon[0]),
+            "feature": LSTM_FEATURES[feature[0]],
+            "value": float(value[0]),
+            "bound": float(bound[0])
+        }
+
+    def score_forecast_windows(self, windows_scaled):
+        """
+        windows_scaled: (k, seq_len, 8). Returns (flag[k], horizon[k],
+        feature[k], value[k], bound[k]) in scaled units; horizon is 0 and
+        feature -1 where no forecast crosses its bound.
+        """
+        k, n_h = len(windows_scaled), len(self.horizons)
+        pred = np.asarray(self.forecast_model.predict(windows_scaled, verbose=0)).reshape(k, n_h, -1)
+        margin = pred - self.forecast_bounds
+        crossed = margin > 0
+        flag = crossed.any(axis=(1, 2))
+        first = np.argmax(crossed.any(axis=2), axis=1)          # earliest horizon
+        rows = np.arange(k)
+        feature = np.argmax(margin[rows, first], axis=1)
+        value = pred[rows, first, feature]
+        bound = self.forecast_bounds[first, feature]
+        horizon = np.where(flag, self.horizons[first], 0)
+        return flag, horizon, np.where(flag, feature, -1), value, bound
+
+    def score_forecast_batch(self, X8, batch_size=4096):
+        """
+        Per-row score_forecast() over a capture as arrays (flag, horizon,
+        feature, value, bound); the first seq_len - 1 rows have no warning.
+        """
+        n = len(X8)
+        flag = np.zeros(n, dtype=bool)
+        horizon = np.zeros(n, dtype=np.int64)
+        feature = np.full(n, -1, dtype=np.int64)
+        value = np.zeros(n)
+        bound = np.zeros(n)
+        if self.forecast_model is None or n < self.seq_len:
+            return flag, horizon, feature, value, bound
+        scaled = self.lstm_scaler.transform(np.asarray(X8, dtype=np.float64))
+        windows = np.lib.stride_tricks.sliding_window_view(scaled, self.seq_len, axis=0).transpose(0, 2, 1)
+        first = self.seq_len - 1
+        for start in range(0, len(windows), batch_size):
+            f, h, feat, v, b = self.score_forecast_windows(windows[start:start + batch_size])
+            rows = slice(first + start, first + start + len(f))
+            flag[rows], horizon[rows], feature[rows], value[rows], bound[rows] = f, h, feat, v, b
+        return flag, horizon, feature, value, bound
+
+    # -------------------------------------------------------------------
+    # Batch scoring (offline replay): same results as calling update_lstm()
+    # / update_if() row by row, starting from an empty LSTM window, up to
+    # the float32 rounding of batched LSTM predictions (see replay.py)
+    # -------------------------------------------------------------------
+    def score_lstm_batch(self, X8, batch_size=4096):
+        """
+        X8: (n, 8) rows in time order. Returns (anomaly[n], error[n], reasons[n]);
+        the first seq_len - 1 rows have no full window yet (False, 0.0, []).
+        """
+        X8 = np.asarray(X8, dtype=np.float64)
+        n = len(X8)
+        anomaly = np.zeros(n, dtype=bool)
+        error = np.zeros(n)
+        reasons = [[] for _ in range(n)]
+        if n < self.seq_len:
+            return anomaly, error, reasons
+
+        # MinMax scaling is per row, so scaling once equals scaling each window
+        scaled = self.lstm_scaler.transform(X8)
+        windows = np.lib.stride_tricks.sliding_window_view(scaled, self.seq_len, axis=0)
+        windows = windows.transpose(0, 2, 1)            # (n - seq_len + 1, seq_len, 8)
+
+        first = self.seq_len - 1
+        for start in range(0, len(windows), batch_size):
+            f, e, r = self.score_lstm_windows(windows[start:start + batch_size])
+            rows = slice(first + start, first + start + len(f))
+            anomaly[rows], error[rows], reasons[rows] = f, e, r
+
+        return anomaly, error, reasons
+
+    def score_lstm_windows(self, windows_scaled):
+        """
+        windows_scaled: (k, seq_len, 8) already-scaled windows, e.g. one per
+        stream. Same per-window result as score_lstm(), in one forward pass.
+        """
+        pred = np.asarray(self.lstm_model.predict(windows_scaled, verbose=0))
+        actual = windows_scaled[:, -1]
+        error = np.linalg.norm(actual - pred, axis=1)
+        reasons = labels(self.lstm_feature_names, top_k(np.abs(actual - pred))).tolist()
+        return error > self.lstm_threshold, error, reasons
+
+    def score_if_batch(self, X12):
+        """X12: (n, 12) rows. Returns (anomaly[n], score[n], reasons[n])."""
+        X12 = np.asarray(X12, dtype=np.float64)
+        x_scaled = self.if_scaler.transform(X12)
+        score = -self.if_model.decision_function(x_scaled)
+        anomaly = score > self.if_threshold
+
+        # same deterministic link-loss override as update_if()
+        link_loss = X12[:, 7] > 0
+        anomaly |= link_loss
+        score = np.where(link_loss, np.maximum(score, self.if_threshold + 0.1), score)
+
+        reasons = self.if_reasoner.reasons_batch(x_scaled).tolist()
+        return anomaly, score, reasons
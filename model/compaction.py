@@ -0,0 +1,98 @@
+# ============================================================
+# compaction.py
+# Idle-period compaction / deduplication of training data.
+#
+# Feature vectors are compared on a grid of `tol` (in scaled
+# units: MinMax range for the LSTM, std for the IF):
+#   dedupe_rows      IF (order-free): rows in the same grid cell
+#                    collapse into their mean, weight = count
+#   compact_windows  LSTM (time order): consecutive windows that
+#                    lie inside one run of equal rows collapse
+#                    into the first, weight = count
+# Training and thresholds honour the weights (weighted resample,
+# weighted quantiles / moments equal to the uncompacted ones up
+# to tol), and report() gives the compression ratio.
+# ============================================================
+
+import numpy as np
+
+
+def _cells(X, tol):
+    return np.floor(np.asarray(X, dtype=np.float64) / tol + 0.5).astype(np.int64)
+
+
+def dedupe_rows(X, tol=0.05):
+    """(representative rows, weights): one row per occupied grid cell."""
+    _, inverse, counts = np.unique(_cells(X, tol), axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sums = np.add.reduceat(np.asarray(X, dtype=np.float64)[order], starts, axis=0)
+    return (sums / counts[:, None]).astype(np.asarray(X).dtype), counts.astype(np.float64)
+
+
+def run_ids(X, tol=0.05):
+    """Run number of every row: consecutive rows in the same grid cell share one."""
+    cells = _cells(X, tol)
+    changed = np.any(cells[1:] != cells[:-1], axis=1)
+    return np.concatenate(([0], np.cumsum(changed)))
+
+
+def compact_windows(X, seq_len, tol=0.05):
+    """
+    Windows i -> (X[i:i+seq_len], X[i+seq_len]). A window whose rows and
+    target all lie in one run repeats its predecessor when that one does
+    too; it is dropped and counted in the weight of the first.
+    Returns (window indices, weights) in time order.
+    """
+    n_windows = len(X) - seq_len
+    if n_windows <= 0:
+        return np.arange(0), np.ones(0)
+    rid = run_ids(X, tol)
+    constant = rid[:n_windows] == rid[seq_len:seq_len + n_windows]
+    repeat = np.zeros(n_windows, dtype=bool)
+    repeat[1:] = constant[1:] & constant[:-1]
+    keep = np.flatnonzero(~repeat)
+    weights = np.diff(np.append(keep, n_windows)).astype(np.float64)
+    return keep, weights
+
+
+# -------------------------------------------------------------------
+# Weighted statistics (weights = integer counts)
+# -------------------------------------------------------------------
+def weighted_quantile(values, weights, q):
+    """np.quantile (linear) of values repeated weights times, without expanding them."""
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(values, kind="stable")
+    v, w = values[order], np.asarray(weights, dtype=np.float64)[order]
+    end = np.cumsum(w)
+    first = end - w
+    pos = np.column_stack((first, end - 1)).ravel() / max(end[-1] - 1, 1)
+    return np.interp(q, pos, np.repeat(v, 2))
+
+
+def weighted_stats(values, weights, quantiles):
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(np.average(values, weights=weights))
+    return {
+        "count": int(np.sum(weights)),
+        "mean": mean,
+        "std": float(np.sqrt(np.average((values - mean) ** 2, weights=weights))),
+        "quantiles": {str(q): float(weighted_quantile(values, weights, q)) for q in quantiles}
+    }
+
+
+def weighted_resample(X, weights, size, seed=0):
+    """Rows drawn with probability proportional to weight (~ uniform over the original rows)."""
+    rng = np.random.default_rng(seed)
+    p = np.asarray(weights, dtype=np.float64)
+    idx = rng.choice(len(X), size=size, replace=True, p=p / p.sum())
+    return X[idx]
+
+
+def report(rows_in, rows_out):
+    return {
+        "rows": int(rows_in),
+        "kept": int(rows_out),
+        "ratio": float(rows_in / rows_out) if rows_out else float("inf")
+    }
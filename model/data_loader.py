@@ -0,0 +1,123 @@
+# ============================================================
+# data_loader.py
+# Out-of-core loading of training captures.
+#
+# - Only the requested feature columns are parsed, straight to
+#   float32, chunksize rows at a time.
+# - Optional time-range filter on the timestamp column
+#   (captures are appended in time order, so reading stops at
+#   the first chunk past the end of the range).
+# - Scalers are fitted with partial_fit() chunk by chunk; the
+#   LSTM array is built already scaled; the Isolation Forest
+#   trains on a fixed-size reservoir sample of the capture.
+# ============================================================
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 100000
+
+
+def _epoch(value):
+    """Epoch seconds from a number or a date string (naive strings are UTC)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    return pd.Timestamp(value).timestamp()
+
+
+def iter_chunks(path, columns, chunksize=CHUNK_SIZE, time_range=None,
+                time_column="timestamp", dtype=np.float32):
+    """
+    Yields (rows, len(columns)) arrays of `dtype` in file order, rows with
+    missing values dropped. time_range: (start, end) epoch seconds or date
+    strings, end exclusive; either bound may be None.
+    """
+    start, end = (None, None) if time_range is None else map(_epoch, time_range)
+    filtered = start is not None or end is not None
+
+    usecols = list(columns)
+    if filtered and time_column not in usecols:
+        usecols.append(time_column)
+    dtypes = {c: dtype for c in columns if c != time_column}
+
+    reader = pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            if filtered:
+                ts = chunk[time_column].to_numpy(dtype=np.float64)
+                if end is not None and len(ts) and ts[0] >= end:
+                    break
+                mask = np.ones(len(ts), dtype=bool)
+                if start is not None:
+                    mask &= ts >= start
+                if end is not None:
+                    mask &= ts < end
+                chunk = chunk[mask]
+            chunk = chunk.dropna(subset=list(columns))
+            if len(chunk):
+                yield chunk[list(columns)].to_numpy(dtype=dtype)
+
+
+def fit_scaler(scaler, path, columns, **kwargs):
+    """Fits a scaler that supports partial_fit (MinMax / Standard) over the capture."""
+    n_rows = 0
+    for chunk in iter_chunks(path, columns, **kwargs):
+        scaler.partial_fit(chunk)
+        n_rows += len(chunk)
+    if n_rows == 0:
+        raise ValueError(f"no rows in {path} for the requested columns / time range")
+    return scaler, n_rows
+
+
+def load_array(path, columns, transform=None, **kwargs):
+    """
+    Whole capture (needed columns only) as one float32 array, each chunk
+    passed through transform (e.g. a fitted scaler's transform) first.
+    """
+    dtype = kwargs.get("dtype", np.float32)
+    parts = []
+    for chunk in iter_chunks(path, columns, **kwargs):
+        parts.append(np.asarray(transform(chunk) if transform else chunk, dtype=dtype))
+    if not parts:
+        return np.empty((0, len(columns)), dtype=dtype)
+    return np.concatenate(parts)
+
+
+class Reservoir:
+    """
+    Uniform random sample of at most `size` rows over a stream of chunks
+    (Algorithm R, vectorized per chunk). Keeps file order while the stream
+    is shorter than `size`, so small captures are used in full.
+    """
+
+    def __init__(self, size, width, seed=0, dtype=np.float32):
+        self.size = size
+        self.rows = np.empty((size, width), dtype=dtype)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, chunk):
+        n = len(chunk)
+        fill = min(max(self.size - self.seen, 0), n)
+        if fill:
+            self.rows[self.seen:self.seen + fill] = chunk[:fill]
+        if fill < n:
+            # row with stream index i replaces slot j ~ U[0, i] when j < size
+            idx = np.arange(self.seen + fill, self.seen + n)
+            slots = (self.rng.random(len(idx)) * (idx + 1)).astype(np.int64)
+            keep = slots < self.size
+            self.rows[slots[keep]] = chunk[fill:][keep]
+        self.seen += n
+
+    def sample(self):
+        return self.rows[:min(self.seen, self.size)]
+
+
+def reservoir_sample(path, columns, size, seed=0, **kwargs):
+    """(sample, rows seen) for a capture; see Reservoir."""
+    reservoir = Reservoir(size, len(columns), seed=seed, dtype=kwargs.get("dtype", np.float32))
+    for chunk in iter_chunks(path, columns, **kwargs):
+        reservoir.add(chunk)
+    return reservoir.sample(), reservoir.seen
@@ -0,0 +1,204 @@
+# ============================================================
+# decision_sink.py
+# Buffered, rotating writer for anomaly_decisions.json.
+#
+# - The log file stays open; records are serialized compactly and
+#   written in batches (every flush_every records or
+#   flush_interval seconds, whichever comes first).
+# - Normal decisions are stored as run-length records
+#   {"type": "normal", "anomaly": false, "count": N, "start": t0,
+#    "timestamp": t1} instead of one line per tick.
+# - Incident records (with an "event" key, see
+#   IncidentAggregator) are always written as they are.
+# - The active file is rotated by size or age to
+#   anomaly_decisions.<YYYYmmdd-HHMMSS>-<n>.json and the closed
+#   segment is gzipped in a background thread.
+# ============================================================
+
+import os
+import gzip
+import json
+import time
+import shutil
+import threading
+
+NORMAL_MODES = ("runs", "all", "none")
+
+
+class DecisionLog:
+
+    def __init__(self, path, normal_mode="runs", flush_every=64, flush_interval=0.5,
+                 max_bytes=16 * 1024 * 1024, max_age=3600.0, run_interval=60.0,
+                 compress=True, keep_segments=48):
+        if normal_mode not in NORMAL_MODES:
+            raise ValueError(f"normal_mode must be one of {NORMAL_MODES}, got {normal_mode!r}")
+        self.path = path
+        self.normal_mode = normal_mode
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.run_interval = run_interval      # emit long normal runs at least this often
+        self.compress = compress
+        self.keep_segments = keep_segments
+
+        self._encode = json.JSONEncoder(separators=(",", ":")).encode
+        self._lock = threading.Lock()         # write() and poll() may come from different threads
+        self._buffer = []
+        self._run = None                      # [count, start_ts, last_ts]
+        self._last_flush = time.monotonic()
+        self._compressor = None
+
+        self.records = 0                      # lines written (after run-length encoding)
+        self.decisions = 0                    # decisions received
+        self.rotations = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._open()
+
+    def _open(self):
+        self.f = open(self.path, "a", encoding="utf-8")
+        self.size = self.f.tell()
+        self.opened = time.time()
+
+    # -------------------------------------------------------------------
+    # Writing
+    # -------------------------------------------------------------------
+    def write(self, decision):
+        ts = decision.get("timestamp") or time.time()
+        with self._lock:
+            self.decisions += 1
+
+            if (not decision.get("anomaly", False) and self.normal_mode != "all"
+                    and "event" not in decision):
+                if self.normal_mode == "runs":
+                    run = self._run
+                    if run is None:
+                        self._run = [1, ts, ts]
+                    else:
+                        run[0] += 1
+                        run[2] = ts
+                        if ts - run[1] >= self.run_interval:
+                            self._end_run()
+            else:
+                self._end_run()
+                self._buffer.append(self._encode(decision))
+
+            self._maybe_flush()
+
+    def _end_run(self):
+        run = self._run
+        if run is None:
+            return
+        self._run = None
+        self._buffer.append(self._encode({
+            "type": "normal",
+            "anomaly": False,
+            "count": run[0],
+            "start": run[1],
+            "timestamp": run[2]
+        }))
+
+    def _maybe_flush(self):
+        if not self._buffer:
+            return
+        if (len(self._buffer) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            data = "\n".join(self._buffer) + "\n"
+            self.f.write(data)
+            self.f.flush()
+            self.size += len(data)
+            self.records += len(self._buffer)
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+
+        if self.size >= self.max_bytes or (self.size and time.time() - self.opened >= self.max_age):
+            self._rotate()
+
+    def poll(self):
+        """Flushes due batches while no decisions arrive (call from idle waits)."""
+        with self._lock:
+            self._maybe_flush()
+
+    def flush(self):
+        """Writes everything, including the open normal run."""
+        with self._lock:
+            self._end_run()
+            self._flush()
+
+    # -------------------------------------------------------------------
+    # Rotation
+    # -------------------------------------------------------------------
+    def _rotate(self):
+        self.f.close()
+        base, ext = os.path.splitext(self.path)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        n = 0
+        segment = f"{base}.{stamp}-{n:03d}{ext}"
+        while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+            n += 1
+            segment = f"{base}.{stamp}-{n:03d}{ext}"
+        os.replace(self.path, segment)
+        self.rotations += 1
+        self._open()
+
+        if self.compress:
+            if self._compressor is not None:
+                self._compressor.join()
+            self._compressor = threading.Thread(target=self._compress, args=(segment,), daemon=True)
+            self._compressor.start()
+        else:
+            self._prune()
+
+    def _compress(self, segment):
+        with open(segment, "rb") as src, gzip.open(segment + ".gz.tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(segment + ".gz.tmp", segment + ".gz")
+        os.remove(segment)
+        self._prune()
+
+    def segments(self):
+        """Closed segments, oldest first."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        base, ext = os.path.splitext(os.path.basename(self.path))
+        names = [n for n in os.listdir(directory)
+                 if n.startswith(base + ".") and n != os.path.basename(self.path)
+                 and (n.endswith(ext) or n.endswith(ext + ".gz"))]
+        return [os.path.join(directory, n) for n in sorted(names)]
+
+    def _prune(self):
+        if not self.keep_segments:
+            return
+        for old in self.segments()[:-self.keep_segments]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self.flush()
+        self.f.close()
+        if self._compressor is not None:
+            self._compressor.join()
+
+
+def read_decisions(path, expand_runs=False):
+    """
+    Iterates the records of one log file (plain or .gz). With expand_runs,
+    run-length normal records are yielded once per decision they stand for.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            if expand_runs and "count" in rec and not rec.get("anomaly", False):
+                for _ in range(rec["count"]):
+                    yield {"anomaly": False, "type": "normal", "timestamp": rec["timestamp"]}
+            else:
+                yield rec
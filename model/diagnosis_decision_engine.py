@@ -158,6 +158,9 @@
 #             "why_action": why
 #         }
 
+import time
+
+
 # ============================================================
 # MODEL-DRIVEN DIAGNOSIS + DECISION ENGINE
 # ============================================================
@@ -241,11 +244,35 @@ class MLDecisionEngine:
                                  "Unclassified anomaly detected",
                                  "LOW"),
 
+            # Early warnings from the multi-horizon forecaster
+            "predicted_controller_overload": ("preemptive_restart",
+                                              "Forecast: controller CPU/memory leaving normal range",
+                                              "MEDIUM"),
+
+            "predicted_link_congestion": ("switch_path",
+                                          "Forecast: latency/bandwidth heading for congestion",
+                                          "MEDIUM"),
+
+            "predicted_packet_in_storm": ("enable_rate_limit",
+                                          "Forecast: Packet-In rate building up",
+                                          "MEDIUM"),
+
             "normal": ("no_action",
                        "No anomaly detected",
                        "LOW")
         }
 
+        # ---------------------------
+        # Mapping: forecast feature → predicted anomaly type
+        # ---------------------------
+        self.forecast_to_type = {
+            "lstm_cpu": "predicted_controller_overload",
+            "lstm_mem": "predicted_controller_overload",
+            "lstm_rtt": "predicted_link_congestion",
+            "lstm_bw": "predicted_link_congestion",
+            "lstm_pkt_in": "predicted_packet_in_storm",
+        }
+
     # --------------------------------------------------------------------
     # Extract final anomaly type
     # --------------------------------------------------------------------
@@ -292,7 +319,14 @@ class MLDecisionEngine:
         lstm_flag = lstm_output.get("lstm_anomaly", False)
         if_flag = if_output.get("if_anomaly", False)
 
-        # CASE 1 — No anomaly detected
+        # CASE 1 — Nothing detected yet, but the forecast crosses a bound
+        forecast = lstm_output.get("forecast")
+        if not lstm_flag and not if_flag and forecast and forecast.get("forecast_anomaly"):
+            anomaly_type = self.forecast_to_type.get(forecast["feature"])
+            if anomaly_type is not None:
+                return self.predicted(anomaly_type, forecast)
+
+        # CASE 2 — No anomaly detected
         if not lstm_flag and not if_flag:
             return {
                 "anomaly": False,
@@ -327,3 +361,151 @@ class MLDecisionEngine:
             "severity": severity
         }
 
+    # --------------------------------------------------------------------
+    # Early warning (forecast only, nothing observed yet)
+    # --------------------------------------------------------------------
+    def predicted(self, anomaly_type, forecast):
+        action, why_action, severity = self.action_map[anomaly_type]
+        reason = (f"{forecast['feature']} forecast {forecast['value']:.3f} above bound "
+                  f"{forecast['bound']:.3f} in {forecast['horizon']} steps")
+        return {
+            "anomaly": True,
+            "type": anomaly_type,
+            "predicted": True,
+            "horizon": forecast["horizon"],
+            "matched_reason": reason,
+            "why": f"Forecast: {reason}",
+            "healing_action": action,
+            "why_action": why_action,
+            "severity": severity
+        }
+
+
+
+# ============================================================
+# INCIDENT AGGREGATION (ALERT COALESCING)
+# ============================================================
+
+class IncidentAggregator:
+    """
+    Stateful layer on top of MLDecisionEngine.run(). Consecutive anomalous
+    decisions of the same type on the same stream form one incident, and
+    observe() only returns the records worth acting on:
+
+        open      after open_after consecutive decisions of that type
+        escalate  score reached escalate_ratio x the last emitted score
+        close     after close_after ticks of that stream without the type
+                  (hysteresis), or max_idle seconds without any tick
+
+    Each record is the incident's latest decision plus event, incident_id,
+    stream_id, start, last_seen, count, peak_score and duration. Close
+    records have anomaly=False.
+    """
+
+    def __init__(self, open_after=1, close_after=5, escalate_ratio=1.5, max_idle=60.0):
+        self.open_after = open_after
+        self.close_after = close_after
+        self.escalate_ratio = escalate_ratio
+        self.max_idle = max_idle
+
+        self.incidents = {}          # stream_id -> {type: incident}
+        self.streaks = {}            # stream_id -> [type, count, start_ts] before opening
+        self.next_id = 1
+        self.last_sweep = 0.0
+
+        self.observed = 0            # decisions in
+        self.emitted = 0             # records out
+
+    def observe(self, decision, stream_id=0, score=0.0, ts=None):
+        if ts is None:
+            ts = decision.get("timestamp") or time.time()
+        self.observed += 1
+        events = []
+        current = decision["type"] if decision.get("anomaly") else None
+
+        # every open incident of this stream that did not recur this tick
+        open_here = self.incidents.get(stream_id)
+        if open_here:
+            for kind in list(open_here):
+                if kind == current:
+                    continue
+                incident = open_here[kind]
+                incident["quiet"] += 1
+                if incident["quiet"] >= self.close_after:
+                    events.append(self._close(stream_id, kind, ts))
+
+        if current is None:
+            self.streaks.pop(stream_id, None)
+        elif open_here and current in open_here:
+            incident = open_here[current]
+            incident["quiet"] = 0
+            incident["count"] += 1
+            incident["last_seen"] = ts
+            incident["decision"] = decision
+            incident["peak_score"] = max(incident["peak_score"], score)
+            if incident["emitted_score"] > 0 and score >= incident["emitted_score"] * self.escalate_ratio:
+                incident["emitted_score"] = score
+                events.append(self._record("escalate", stream_id, incident))
+        else:
+            streak = self.streaks.get(stream_id)
+            if streak is None or streak[0] != current:
+                streak = self.streaks[stream_id] = [current, 0, ts]
+            streak[1] += 1
+            if streak[1] >= self.open_after:
+                del self.streaks[stream_id]
+                events.append(self._open(stream_id, decision, score, streak[1], streak[2], ts))
+
+        if self.max_idle and ts - self.last_sweep >= 1.0:
+            events.extend(self.expire(ts))
+
+        self.emitted += len(events)
+        return events
+
+    def expire(self, now):
+        """Closes incidents of streams that stopped reporting."""
+        self.last_sweep = now
+        events = []
+        for stream_id in list(self.incidents):
+            for kind, incident in list(self.incidents[stream_id].items()):
+                if now - incident["last_seen"] >= self.max_idle:
+                    events.append(self._close(stream_id, kind, now))
+        return events
+
+    def _open(self, stream_id, decision, score, count, start, ts):
+        incident = {
+            "id": self.next_id,
+            "start": start,
+            "last_seen": ts,
+            "count": count,
+            "quiet": 0,
+            "peak_score": score,
+            "emitted_score": score,
+            "decision": decision
+        }
+        self.next_id += 1
+        self.incidents.setdefault(stream_id, {})[decision["type"]] = incident
+        return self._record("open", stream_id, incident)
+
+    def _close(self, stream_id, kind, ts):
+        incident = self.incidents[stream_id].pop(kind)
+        if not self.incidents[stream_id]:
+            del self.incidents[stream_id]
+        record = self._record("close", stream_id, incident)
+        record["anomaly"] = False
+        record["timestamp"] = ts
+        return record
+
+    @staticmethod
+    def _record(event, stream_id, incident):
+        record = dict(incident["decision"])
+        record.update({
+            "event": event,
+            "incident_id": incident["id"],
+            "stream_id": stream_id,
+            "start": incident["start"],
+            "last_seen": incident["last_seen"],
+            "count": incident["count"],
+            "peak_score": incident["peak_score"],
+            "duration": incident["last_seen"] - incident["start"]
+        })
+        return record
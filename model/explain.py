@@ -0,0 +1,241 @@
+# ============================================================
+# explain.py
+# Vectorized anomaly explanations.
+#
+# One code path for the live reasons in AnomalyInference and the
+# offline reports of training / replay: top-k deviating features,
+# z-scores against training baselines and diagnosis labels are
+# computed for all rows at once with array operations, and
+# reports are written as flat columns (JSONL / CSV / Parquet).
+#
+# Baselines: training stores per-feature statistics of the
+# normal population (mean / std in scaled units, raw median and
+# percentile table). Inference turns them into per-feature
+# arrays once per model load (IFReasoner), so a tick costs one
+# subtract, one multiply and a 12-element sort.
+# ============================================================
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from compaction import weighted_quantile
+
+BASELINE_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+# IF features with a dedicated reason once they are above their normal
+# range: (label, z bound used when the model has no stored baseline).
+# Bandwidth always reports a surge (-inf bound).
+IF_HIGH_LABELS = {
+    "if_pkt_in": ("DoS Attack (High Packet-In)", 2.0),
+    "if_link_loss": ("Link Failure / Flap Detected", 0.0),
+    "if_bw": ("Bandwidth Surge", -np.inf),
+}
+HIGH_PERCENTILE = "99"
+
+# IF diagnosis rules on z-scores (feature order of the IF model):
+# (label, mask function). Several rules may match one row.
+DIAGNOSIS_RULES = [
+    ("Possible DoS / High Packet-In + Churn", lambda z: (z[:, 3] > 2) & (z[:, 9] > 2)),
+    ("RTT Spike / Link Degradation", lambda z: (z[:, 2] > 2) | (z[:, 7] > 2)),
+    ("Flow Table Saturation", lambda z: z[:, 6] > 2),
+    ("Controller Slow Response", lambda z: (z[:, 5] < -2) & (z[:, 3] > 2)),
+    ("High Bandwidth Surge", lambda z: z[:, 8] > 2),
+    ("Controller CPU/Mem Overload", lambda z: (z[:, 0] > 2) | (z[:, 1] > 2)),
+]
+DEFAULT_DIAGNOSIS = "General Structural Outlier"
+
+# LSTM per-feature reason (feature order of the LSTM model)
+LSTM_REASONS = [
+    "CPU spike / overload",
+    "Memory leak or sudden increase",
+    "RTT spike / latency anomaly",
+    "Packet-In burst / possible DoS",
+    "Controller broadcast spike",
+    "Controller slow to install rules",
+    "Flow churn anomaly",
+    "Sudden traffic surge/drop",
+]
+
+
+def top_k(values, k=3):
+    """
+    (n, k) column indices of the k largest values per row, largest first.
+    Same order (ties included) as np.argsort(row)[-k:][::-1] on each row.
+    """
+    values = np.atleast_2d(values)
+    return np.argsort(values, axis=1)[:, -k:][:, ::-1]
+
+
+def labels(names, idx):
+    """names[idx] for an (n, k) index array, as an object array of strings."""
+    return np.asarray(names, dtype=object)[idx]
+
+
+def if_reason_labels(z, top_idx, names, high_labels, high_z):
+    """
+    Live IF reasons: feature name of each top deviation, or its high label
+    when the z-score is above that feature's bound (see IFReasoner).
+    """
+    z = np.atleast_2d(z)
+    zk = np.take_along_axis(z, top_idx, axis=1)
+    high = zk > np.asarray(high_z)[top_idx]
+    return np.where(high, labels(high_labels, top_idx), labels(names, top_idx))
+
+
+def diagnose(z):
+    """Diagnosis label per row (rules joined with ' | ')."""
+    z = np.atleast_2d(z)
+    masks = np.column_stack([rule(z) for _, rule in DIAGNOSIS_RULES])
+    codes = masks @ (1 << np.arange(len(DIAGNOSIS_RULES)))
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    text = np.array([
+        " | ".join(label for b, (label, _) in enumerate(DIAGNOSIS_RULES) if code >> b & 1)
+        or DEFAULT_DIAGNOSIS
+        for code in uniq
+    ], dtype=object)
+    return text[inverse.ravel()]
+
+
+# -------------------------------------------------------------------
+# Training baselines
+# -------------------------------------------------------------------
+def normal_baseline(X, X_scaled, weights=None, percentiles=BASELINE_PERCENTILES):
+    """
+    Statistics of the normal rows, stored with the model:
+    mean / std of the scaled features (z-scores), raw median and a raw
+    percentile table {"1": array, ..., "99": array}. Weights are row counts.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    X_scaled = np.asarray(X_scaled, dtype=np.float64)
+    w = np.ones(len(X)) if weights is None else np.asarray(weights, dtype=np.float64)
+    mean = np.average(X_scaled, axis=0, weights=w)
+    std = np.sqrt(np.average((X_scaled - mean) ** 2, axis=0, weights=w)) + 1e-6
+    table = np.array([weighted_quantile(col, w, np.asarray(percentiles) / 100) for col in X.T]).T
+    return {
+        "mean": mean,
+        "std": std,
+        "median": np.array([weighted_quantile(col, w, 0.5) for col in X.T]),
+        "percentiles": {str(p): row for p, row in zip(percentiles, table)},
+        "count": float(w.sum()),
+    }
+
+
+class IFReasoner:
+    """
+    Per-model lookup tables for the live IF reasons.
+
+    z = (x_scaled - mean) * inv_std against the stored normal baseline (or
+    the scaler's own standardization when there is none). Features listed in
+    IF_HIGH_LABELS switch to their high label above the z of the normal
+    99th percentile. reasons() reuses preallocated buffers per tick.
+    """
+
+    def __init__(self, features, names, scaler, baseline=None):
+        n = len(features)
+        self.names = list(names)
+        self.baseline = baseline or {"mean": 0.0, "std": 1.0}
+        self.mean = np.broadcast_to(np.asarray(self.baseline["mean"], dtype=np.float64), (n,)).copy()
+        self.inv_std = 1.0 / np.broadcast_to(np.asarray(self.baseline["std"], dtype=np.float64), (n,))
+
+        high_p = None
+        if baseline is not None and HIGH_PERCENTILE in baseline.get("percentiles", {}):
+            p = np.asarray(baseline["percentiles"][HIGH_PERCENTILE], dtype=np.float64)
+            high_p = (np.asarray(scaler.transform(p[None]))[0] - self.mean) * self.inv_std
+
+        self.high_labels = list(self.names)
+        self.high_z = np.full(n, np.inf)
+        for i, feature in enumerate(features):
+            if feature in IF_HIGH_LABELS:
+                label, default = IF_HIGH_LABELS[feature]
+                self.high_labels[i] = label
+                self.high_z[i] = default if high_p is None or np.isinf(default) else high_p[i]
+
+        self._z = np.empty(n)
+        self._abs = np.empty(n)
+
+    def zscores(self, X_scaled):
+        return (np.asarray(X_scaled) - self.mean) * self.inv_std
+
+    def reasons(self, x_scaled, k=3):
+        """Top-k reasons for one scaled row."""
+        z = self._z
+        np.subtract(x_scaled, self.mean, out=z)
+        np.multiply(z, self.inv_std, out=z)
+        np.abs(z, out=self._abs)
+        return [self.high_labels[i] if z[i] > self.high_z[i] else self.names[i]
+                for i in np.argsort(self._abs)[-k:][::-1].tolist()]
+
+    def reasons_batch(self, X_scaled, k=3):
+        """Top-k reasons for every scaled row (same labels as reasons())."""
+        z = self.zscores(X_scaled)
+        return if_reason_labels(z, top_k(np.abs(z), k), self.names, self.high_labels, self.high_z)
+
+
+# -------------------------------------------------------------------
+# Reports
+# -------------------------------------------------------------------
+def if_report(rows, X, X_scaled, baseline, names, scores=None, k=3):
+    """
+    rows: row ids; X / X_scaled: (n, 12) raw and scaled features of those
+    rows; baseline: {"mean": scaled means, "std": scaled stds, "median":
+    raw medians} of normal training rows ("median" optional).
+    """
+    z = (np.asarray(X_scaled) - baseline["mean"]) / baseline["std"]
+    idx = top_k(np.abs(z), k)
+    X = np.asarray(X)
+    cols = {"row": np.asarray(rows)}
+    if scores is not None:
+        cols["score"] = np.asarray(scores)
+    feature = labels(names, idx)
+    value = np.take_along_axis(X, idx, axis=1)
+    median = np.asarray(baseline["median"])[idx] if "median" in baseline else None
+    zk = np.take_along_axis(z, idx, axis=1)
+    for j in range(idx.shape[1]):
+        cols[f"top{j + 1}_feature"] = feature[:, j]
+        cols[f"top{j + 1}_value"] = value[:, j]
+        if median is not None:
+            cols[f"top{j + 1}_median"] = median[:, j]
+        cols[f"top{j + 1}_z"] = zk[:, j]
+    cols["diagnosis"] = diagnose(z)
+    return pd.DataFrame(cols)
+
+
+def lstm_report(rows, actual, pred, names, errors=None, k=3):
+    """rows: window ids; actual / pred: (n, 8) scaled targets and predictions."""
+    actual, pred = np.asarray(actual), np.asarray(pred)
+    diff = actual - pred
+    idx = top_k(np.abs(diff), k)
+    cols = {"row": np.asarray(rows)}
+    cols["error"] = np.linalg.norm(diff, axis=1) if errors is None else np.asarray(errors)
+    feature = labels(names, idx)
+    reason = labels(LSTM_REASONS, idx)
+    a = np.take_along_axis(actual, idx, axis=1)
+    p = np.take_along_axis(pred, idx, axis=1)
+    for j in range(idx.shape[1]):
+        cols[f"top{j + 1}_feature"] = feature[:, j]
+        cols[f"top{j + 1}_actual"] = a[:, j]
+        cols[f"top{j + 1}_pred"] = p[:, j]
+        cols[f"top{j + 1}_diff"] = a[:, j] - p[:, j]
+        cols[f"top{j + 1}_reason"] = reason[:, j]
+    return pd.DataFrame(cols)
+
+
+def write_report(frame, path):
+    """Writes by extension: .jsonl (one record per line), .csv or .parquet."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith(".jsonl"):
+        frame.to_json(path, orient="records", lines=True)
+    elif path.endswith(".csv"):
+        frame.to_csv(path, index=False)
+    elif path.endswith(".parquet"):
+        frame.to_parquet(path, index=False)
+    else:
+        raise ValueError(f"unsupported report format: {path}")
+    return path
+
+
+def summarize_report(frame, column, n=10):
+    """Most frequent values of one report column, e.g. diagnosis or top1_feature."""
+    return frame[column].value_counts().head(n).to_dict()
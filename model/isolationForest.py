@@ -1,62 +1,89 @@
 
 import os
+import sys
+import argparse
 import numpy as np
-import pandas as pd
 import joblib
 
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 
+from data_loader import iter_chunks, Reservoir, CHUNK_SIZE
+from compaction import dedupe_rows, weighted_quantile, weighted_stats, weighted_resample, report
+from explain import normal_baseline, if_report, write_report, summarize_report
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "monitoring_and_telemetry"))
+from feature_schema import IF_FEATURES
+
 # ==============================
 # 0. CONFIG
 # ==============================
 SEED = 42
 np.random.seed(SEED)
 
-DATA_PATH = "training_data.csv"
+DATA_PATH = "training_data.csv"   # --data overrides
 ARTIFACTS_DIR = "ifmodels"      # <<<<<< SAVING HERE
+EXPLANATIONS_PATH = f"{ARTIFACTS_DIR}/if_explanations.jsonl"   # .jsonl / .csv / .parquet
+
+# Out-of-core loading: the capture is read in chunks; the scaler sees every
+# row, the forest trains on a uniform sample of at most IF_SAMPLE_SIZE rows
+IF_SAMPLE_SIZE = 200000
+TIME_RANGE = None               # e.g. ("2025-01-01", "2025-02-01"), end exclusive
+
+# Idle / duplicate compaction: rows within COMPACT_TOL std of each other
+# collapse into one weighted sample (None = score every row)
+COMPACT_TOL = 0.05
+N_ESTIMATORS = 300
+
+parser = argparse.ArgumentParser(description="Train the Isolation Forest")
+parser.add_argument("--data", default=DATA_PATH, help="training capture")
+DATA_PATH = parser.parse_args().data
 
 os.makedirs(ARTIFACTS_DIR, exist_ok=True)
 
 # ==============================
 # 1. LOAD DATA
 # ==============================
-df = pd.read_csv(DATA_PATH)
-
-iso_features = [
-    "if_cpu",
-    "if_mem",
-    "if_rtt",
-    "if_pkt_in",
-    "if_pkt_out",
-    "if_flow_mod",
-    "if_table_occ",
-    "if_link_loss",
-    "if_bw",
-    "if_churn",
-    "if_zscore_avg",
-    "if_ratio_pkt_flow"
-]
+iso_features = IF_FEATURES      # feature_schema order
 
-df_iso = df[iso_features].copy().dropna()
-X = df_iso.values.astype(float)
+# One pass: streaming scaler fit over all rows + reservoir sample for training
+scaler = StandardScaler()
+reservoir = Reservoir(IF_SAMPLE_SIZE, len(iso_features), seed=SEED)
+for chunk in iter_chunks(DATA_PATH, iso_features, chunksize=CHUNK_SIZE, time_range=TIME_RANGE):
+    scaler.partial_fit(chunk)
+    reservoir.add(chunk)
+X = reservoir.sample()
 
-print("Dataset loaded:", X.shape)
+print(f"Dataset loaded: {reservoir.seen} rows, training sample: {X.shape}")
 
 # ==============================
 # 2. SCALING
 # ==============================
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+X_scaled = scaler.transform(X)
 
 joblib.dump(scaler, f"{ARTIFACTS_DIR}/if_scaler.pkl")
 print("Scaler saved to:", f"{ARTIFACTS_DIR}/if_scaler.pkl")
 
+# ==============================
+# 2b. COMPACTION
+# ==============================
+# Every later step works on the weighted rows; with COMPACT_TOL = None all
+# weights are 1 and the results equal the plain computations
+n_sample = len(X_scaled)
+if COMPACT_TOL:
+    X_scaled, weights = dedupe_rows(X_scaled, COMPACT_TOL)
+    X = scaler.inverse_transform(X_scaled)
+else:
+    weights = np.ones(n_sample)
+compaction = report(n_sample, len(X_scaled))
+print(f"Compaction: {compaction['rows']} -> {compaction['kept']} rows "
+      f"(ratio {compaction['ratio']:.2f}x)")
+
 # ==============================
 # 3. TRAIN ISOLATION FOREST
 # ==============================
 iso_forest = IsolationForest(
-    n_estimators=300,
+    n_estimators=N_ESTIMATORS,
     contamination="auto",
     max_features=1.0,
     n_jobs=-1,
@@ -64,7 +91,12 @@ iso_forest = IsolationForest(
 )
 
 print("\nTraining Isolation Forest...")
-iso_forest.fit(X_scaled)
+if COMPACT_TOL:
+    # each tree subsamples 256 rows: a weighted draw of that many rows per
+    # tree has the distribution of the uncompacted data
+    iso_forest.fit(weighted_resample(X_scaled, weights, min(n_sample, N_ESTIMATORS * 256), seed=SEED))
+else:
+    iso_forest.fit(X_scaled)
 
 joblib.dump(iso_forest, f"{ARTIFACTS_DIR}/isolation_forest_model.pkl")
 print("Model saved to:", f"{ARTIFACTS_DIR}/isolation_forest_model.pkl")
@@ -75,29 +107,27 @@ print("Model saved to:", f"{ARTIFACTS_DIR}/isolation_forest_model.pkl")
 scores = iso_forest.decision_function(X_scaled)
 anomaly_scores = -scores
 
-threshold = float(np.percentile(anomaly_scores, 99))
+threshold = float(weighted_quantile(anomaly_scores, weights, 0.99))
 custom_labels = (anomaly_scores >= threshold).astype(int)
 
 print("\nThreshold (99th percentile):", threshold)
-print("Detected anomalies:", custom_labels.sum())
-
-joblib.dump({
-    "threshold": threshold,
-    "scores": anomaly_scores,
-    "features": iso_features
-}, f"{ARTIFACTS_DIR}/if_threshold_info.pkl")
-print("Threshold info saved.")
+print("Detected anomalies:", int(weights[custom_labels == 1].sum()))
 
 # ==============================
-# 5. ANALYSIS BASELINES
+# 5. NORMAL BASELINES (saved with the threshold; inference
+#    computes its z-scores and reasons against them)
 # ==============================
 normal_mask = custom_labels == 0
-normal_scaled = X_scaled[normal_mask]
-normal_unscaled = X[normal_mask]
+baseline = normal_baseline(X[normal_mask], X_scaled[normal_mask], weights[normal_mask])
 
-median_unscaled = np.median(normal_unscaled, axis=0)
-means_scaled = normal_scaled.mean(axis=0)
-stds_scaled = normal_scaled.std(axis=0) + 1e-6
+joblib.dump({
+    "threshold": threshold,
+    "score_stats": weighted_stats(anomaly_scores, weights, (0.5, 0.9, 0.99, 0.999)),
+    "features": iso_features,
+    "compaction": compaction,
+    "baseline": baseline
+}, f"{ARTIFACTS_DIR}/if_threshold_info.pkl")
+print("Threshold info + normal baselines saved.")
 
 pretty = {
     "if_cpu": "CPU Usage",
@@ -114,55 +144,25 @@ pretty = {
     "if_ratio_pkt_flow": "PktIn/FlowMod Ratio"
 }
 
-def diagnose(z):
-    msg = []
-    if z[3] > 2 and z[9] > 2: msg.append("Possible DoS / High Packet-In + Churn")
-    if z[2] > 2 or z[7] > 2: msg.append("RTT Spike / Link Degradation")
-    if z[6] > 2: msg.append("Flow Table Saturation")
-    if z[5] < -2 and z[3] > 2: msg.append("Controller Slow Response")
-    if z[8] > 2: msg.append("High Bandwidth Surge")
-    if z[0] > 2 or z[1] > 2: msg.append("Controller CPU/Mem Overload")
-    return " | ".join(msg) if msg else "General Structural Outlier"
-
 # ==============================
 # 6. ANOMALY EXPLANATIONS
 # ==============================
+anom_idx = np.flatnonzero(custom_labels)
+explanations = if_report(
+    anom_idx, X[anom_idx], X_scaled[anom_idx],
+    baseline,
+    [pretty[c] for c in iso_features], scores=anomaly_scores[anom_idx]
+)
+explanations.insert(2, "weight", weights[anom_idx])
+write_report(explanations, EXPLANATIONS_PATH)
+
 print("\n==============================")
 print(" ANOMALY EXPLANATIONS")
-print("==============================\n")
-
-for idx, is_anom in enumerate(custom_labels):
-    if not is_anom:
-        continue
-
-    row_scaled = X_scaled[idx]
-    row_unscaled = X[idx]
-
-    zscores = (row_scaled - means_scaled) / stds_scaled
-    top3 = np.argsort(np.abs(zscores))[-3:][::-1]
-
-    print(f"\n⚠️ Anomaly at index {idx} (score = {anomaly_scores[idx]:.4f})")
-
-    for f_idx in top3:
-        col = iso_features[f_idx]
-        name = pretty[col]
-
-        actual = row_unscaled[f_idx]
-        median = median_unscaled[f_idx]
-        diff = actual - median
-        z = zscores[f_idx]
-
-        direction = "HIGH" if z > 0 else "LOW"
-        severity = "VERY " if abs(z) > 3 else ""
-
-        print(f"  • {name}:")
-        print(f"      - Actual value     : {actual:.4f}")
-        print(f"      - Median normal    : {median:.4f}")
-        print(f"      - Difference       : {diff:+.4f}")
-        print(f"      - Deviation        : {severity}{direction} ({z:.2f}σ)\n")
-
-    print("  → Diagnosis:", diagnose(zscores))
-    print("-" * 50)
+print("==============================")
+print(f"{len(explanations)} anomalous rows -> {EXPLANATIONS_PATH}")
+print("Diagnoses:", summarize_report(explanations, "diagnosis"))
+print("Top deviating features:", summarize_report(explanations, "top1_feature"))
+print(explanations.nlargest(5, "score").to_string(index=False, max_colwidth=40))
 
 print("\n✅ Isolation Forest + Detailed Explanations COMPLETE")
 print("All files saved inside: ifmodels/")
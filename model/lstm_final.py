@@ -5,15 +5,23 @@
 # This behavior is normal and expected for forecasting-based anomaly detection.
 
 import os
+import sys
+import argparse
 import numpy as np
-import pandas as pd
 import joblib
 import tensorflow as tf
 
 from sklearn.preprocessing import MinMaxScaler
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import LSTM, Dense, Dropout
-from tensorflow.keras.callbacks import ModelCheckpoint
+from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
+
+from data_loader import fit_scaler, load_array, CHUNK_SIZE
+from compaction import compact_windows, weighted_stats, weighted_quantile, report
+from explain import lstm_report, write_report, summarize_report
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "monitoring_and_telemetry"))
+from feature_schema import LSTM_FEATURES
 
 # ==============================
 # 0. Reproducibility
@@ -30,9 +38,20 @@ ARTIFACTS_DIR = "lstmModels"   # <-- save everything here
 
 SEQ_LEN = 20
 BATCH_SIZE = 64
-EPOCHS = 100   # full training, no early stopping
-
-os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+EPOCHS = 100   # full training by default
+EARLY_STOPPING = None   # patience in epochs on val_loss (None = train all EPOCHS)
+TIME_RANGE = None   # e.g. ("2025-01-01", "2025-02-01"), end exclusive
+# Idle-run compaction: windows lying entirely inside one run of rows within
+# COMPACT_TOL (scaled units) of each other train once, weighted by their
+# count (None = train on every window)
+COMPACT_TOL = 0.05
+# Multi-horizon forecaster (early warning): a second model predicts the rows
+# HORIZONS steps ahead from the same window. At inference a forecast of a
+# FORECAST_WATCH feature above the FORECAST_BOUND_Q quantile of its forecasts
+# on validation data raises a predicted_* anomaly (None = no forecaster)
+HORIZONS = (1, 5, 10)
+FORECAST_WATCH = ["lstm_cpu", "lstm_mem", "lstm_rtt", "lstm_pkt_in", "lstm_bw"]
+FORECAST_BOUND_Q = 0.999
 
 # ==============================
 # 2. R² Metric (optional but useful)
@@ -45,13 +64,14 @@ def r2_metric(y_true, y_pred):
 # ==============================
 # 3. Build LSTM model
 # ==============================
-def build_lstm_model(seq_len: int, num_features: int):
+def build_lstm_model(seq_len: int, num_features: int, units=(64, 32), dropout=0.2, outputs=None):
     model = Sequential()
-    model.add(LSTM(64, input_shape=(seq_len, num_features), return_sequences=True))
-    model.add(Dropout(0.2))
-    model.add(LSTM(32, return_sequences=False))
-    model.add(Dropout(0.2))
-    model.add(Dense(num_features))  # predict all 8 features at t+1
+    model.add(LSTM(units[0], input_shape=(seq_len, num_features), return_sequences=len(units) > 1))
+    model.add(Dropout(dropout))
+    for i, n in enumerate(units[1:], start=2):
+        model.add(LSTM(n, return_sequences=i < len(units)))
+        model.add(Dropout(dropout))
+    model.add(Dense(outputs or num_features))  # predict all 8 features at t+1 (or per horizon)
 
     model.compile(
         loss="mse",
@@ -64,43 +84,139 @@ def build_lstm_model(seq_len: int, num_features: int):
 # 4. Create sequences
 # ==============================
 def create_sequences(data_array, seq_len=20):
-    X, y = [], []
-    for i in range(len(data_array) - seq_len):
-        X.append(data_array[i:i+seq_len])
-        y.append(data_array[i+seq_len])
-    return np.array(X), np.array(y)
+    """
+    X[i] = data[i:i+seq_len], y[i] = data[i+seq_len], as read-only strided
+    views of data_array (no copy: memory stays the size of the raw data).
+    """
+    data_array = np.asarray(data_array)
+    X = np.lib.stride_tricks.sliding_window_view(data_array[:-1], seq_len, axis=0)
+    X = X.transpose(0, 2, 1)                 # (n - seq_len, seq_len, features)
+    y = data_array[seq_len:]
+    return X, y
+
+
+def horizon_targets(data_array, seq_len, horizons):
+    """(n_windows, len(horizons), features): row seq_len - 1 + h of every window."""
+    n_windows = len(data_array) - seq_len - max(horizons) + 1
+    return np.stack([data_array[seq_len - 1 + h:seq_len - 1 + h + n_windows] for h in horizons], axis=1)
+
+
+def make_dataset(data_array, seq_len=20, batch_size=64, start=0, stop=None,
+                 indices=None, weights=None, horizons=None):
+    """
+    Streaming tf.data input over windows [start, stop) in time order (or
+    the given window indices): each batch gathers its windows from the raw
+    (n, features) tensor on the fly, so Keras never materializes the
+    (N, seq_len, features) array. weights become per-window sample weights.
+    horizons: targets are the rows h steps past each window, flattened to
+    len(horizons) * features (default: the next row only).
+    """
+    if indices is None:
+        n_windows = len(data_array) - seq_len - (max(horizons) - 1 if horizons else 0)
+        stop = n_windows if stop is None else min(stop, n_windows)
+        indices = np.arange(start, stop)
+    data = tf.constant(data_array)
+    offsets = tf.range(seq_len, dtype=tf.int64)
+    if horizons:
+        target_offsets = tf.constant([seq_len - 1 + h for h in horizons], dtype=tf.int64)
+        n_targets = len(horizons) * data_array.shape[1]
+
+    def gather(idx, *w):
+        if horizons:
+            y = tf.reshape(tf.gather(data, idx[:, None] + target_offsets), (-1, n_targets))
+        else:
+            y = tf.gather(data, idx + seq_len)
+        return (tf.gather(data, idx[:, None] + offsets), y) + w
+
+    slices = (np.asarray(indices, dtype=np.int64),)
+    if weights is not None:
+        slices += (np.asarray(weights, dtype=np.float32),)
+    return (tf.data.Dataset.from_tensor_slices(slices)
+            .batch(batch_size)
+            .map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE))
+
+def train_forecaster(data_scaled, split, lstm_features, epochs, early_stopping):
+    """
+    Multi-horizon model on the same windows: predicts HORIZONS steps ahead,
+    then learns per-horizon upper bounds of the watched features from its
+    validation forecasts. Saves lstm_forecast_model.h5 + lstm_forecast_info.pkl.
+    """
+    n_h, n_f = len(HORIZONS), data_scaled.shape[1]
+    # a window repeats its predecessor only if every target row is in the run too
+    span = SEQ_LEN + max(HORIZONS) - 1
+    if COMPACT_TOL:
+        windows, weights = compact_windows(data_scaled, span, COMPACT_TOL)
+    else:
+        windows = np.arange(len(data_scaled) - span)
+        weights = np.ones(len(windows))
+    train = windows < split
+    val_windows, val_weights = windows[~train], weights[~train]
+
+    model = build_lstm_model(SEQ_LEN, n_f, outputs=n_h * n_f)
+    callbacks = []
+    if early_stopping:
+        callbacks.append(EarlyStopping(monitor="val_loss", patience=early_stopping,
+                                       restore_best_weights=True, verbose=1))
+    val_ds = make_dataset(data_scaled, SEQ_LEN, BATCH_SIZE, indices=val_windows,
+                          weights=val_weights, horizons=HORIZONS)
+    print(f"\n🚀 Training the t+{'/t+'.join(map(str, HORIZONS))} forecaster...\n")
+    model.fit(
+        make_dataset(data_scaled, SEQ_LEN, BATCH_SIZE, indices=windows[train],
+                     weights=weights[train], horizons=HORIZONS),
+        validation_data=val_ds,
+        epochs=epochs,
+        callbacks=callbacks,
+        shuffle=False
+    )
+    model_path = os.path.join(ARTIFACTS_DIR, "lstm_forecast_model.h5")
+    model.save(model_path)
+
+    forecast = model.predict(val_ds).reshape(-1, n_h, n_f)
+    target = horizon_targets(data_scaled, SEQ_LEN, HORIZONS)[val_windows]
+    mae = np.average(np.abs(forecast - target).mean(axis=2), axis=0, weights=val_weights)
+    for h, err in zip(HORIZONS, mae):
+        print(f"Forecast MAE t+{h}: {err:.5f}")
+
+    bounds = np.full((n_h, n_f), np.inf)
+    for f in (lstm_features.index(name) for name in FORECAST_WATCH):
+        for j in range(n_h):
+            bounds[j, f] = weighted_quantile(forecast[:, j, f], val_weights, FORECAST_BOUND_Q)
+
+    info_path = os.path.join(ARTIFACTS_DIR, "lstm_forecast_info.pkl")
+    joblib.dump(
+        {
+            "horizons": list(HORIZONS),
+            "seq_len": SEQ_LEN,
+            "features": lstm_features,
+            "watch": FORECAST_WATCH,
+            "bound_quantile": FORECAST_BOUND_Q,
+            "bounds": bounds,
+            "val_mae": mae
+        },
+        info_path
+    )
+    print(f"Forecaster saved to: {model_path}, bounds to: {info_path}")
+
 
 # ==============================
 # 5. Main training flow
 # ==============================
-def main():
+def main(epochs=EPOCHS, early_stopping=EARLY_STOPPING, data_path=DATA_PATH):
 
-    # ------------------------------
-    # 5.1 Load Data
-    # ------------------------------
-    df = pd.read_csv(DATA_PATH)
-
-    lstm_features = [
-        "lstm_cpu",
-        "lstm_mem",
-        "lstm_rtt",
-        "lstm_pkt_in",
-        "lstm_pkt_out",
-        "lstm_flow_mod",
-        "lstm_flows_sec",
-        "lstm_bw"
-    ]
-
-    df = df[lstm_features]
-    df = df.dropna()
-
-    data = df.astype(float).values
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
 
     # ------------------------------
-    # 5.2 Scale data
+    # 5.1 Load Data + 5.2 Scale data
     # ------------------------------
-    scaler = MinMaxScaler()
-    data_scaled = scaler.fit_transform(data)
+    # Read in chunks (needed columns only, float32): the scaler is fitted
+    # with partial_fit, then the capture is loaded already scaled
+    lstm_features = LSTM_FEATURES          # feature_schema order
+
+    load_kwargs = {"chunksize": CHUNK_SIZE, "time_range": TIME_RANGE}
+    scaler, n_rows = fit_scaler(MinMaxScaler(), data_path, lstm_features, **load_kwargs)
+    data_scaled = load_array(data_path, lstm_features, transform=scaler.transform, **load_kwargs)
+    print("Dataset loaded:", data_scaled.shape)
 
     scaler_path = os.path.join(ARTIFACTS_DIR, "lstm_scaler.pkl")
     joblib.dump(scaler, scaler_path)
@@ -109,19 +225,31 @@ def main():
     # ------------------------------
     # 5.3 Prepare sequences
     # ------------------------------
+    # Windows are strided views / built per batch by tf.data, never copied
     X, y = create_sequences(data_scaled, SEQ_LEN)
-    print("X shape:", X.shape)
+    print("X shape:", X.shape, f"(view over {data_scaled.nbytes / 1e6:.1f} MB of raw data)")
     print("y shape:", y.shape)
 
     # ------------------------------
     # 5.4 Time-based split
     # ------------------------------
     split = int(0.8 * len(X))
-    X_train, X_val = X[:split], X[split:]
-    y_train, y_val = y[:split], y[split:]
-
-    print("Train samples:", X_train.shape[0])
-    print("Val samples:", X_val.shape[0])
+    if COMPACT_TOL:
+        windows, weights = compact_windows(data_scaled, SEQ_LEN, COMPACT_TOL)
+    else:
+        windows, weights = np.arange(len(X)), np.ones(len(X))
+    compaction = report(len(X), len(windows))
+    print(f"Compaction: {compaction['rows']} -> {compaction['kept']} windows "
+          f"(ratio {compaction['ratio']:.2f}x)")
+
+    train = windows < split
+    val_windows, val_weights = windows[~train], weights[~train]
+    train_ds = make_dataset(data_scaled, SEQ_LEN, BATCH_SIZE, indices=windows[train], weights=weights[train])
+    val_ds = make_dataset(data_scaled, SEQ_LEN, BATCH_SIZE, indices=val_windows, weights=val_weights)
+    y_val = y[val_windows]
+
+    print("Train samples:", int(train.sum()), f"(weight {weights[train].sum():.0f})")
+    print("Val samples:", len(val_windows), f"(weight {val_weights.sum():.0f})")
 
     # ------------------------------
     # 5.5 Build and train model (FULL training)
@@ -138,14 +266,19 @@ def main():
         verbose=1
     )
 
-    print("\n🚀 Training for all epochs (no early stopping)...\n")
+    callbacks = [checkpoint]
+    if early_stopping:
+        callbacks.append(EarlyStopping(monitor="val_loss", patience=early_stopping,
+                                       restore_best_weights=True, verbose=1))
+        print(f"\n🚀 Training for up to {epochs} epochs (early stopping, patience {early_stopping})...\n")
+    else:
+        print("\n🚀 Training for all epochs (no early stopping)...\n")
 
     history = model.fit(
-        X_train, y_train,
-        validation_data=(X_val, y_val),
-        epochs=EPOCHS,
-        batch_size=BATCH_SIZE,
-        callbacks=[checkpoint],
+        train_ds,
+        validation_data=val_ds,
+        epochs=epochs,
+        callbacks=callbacks,
         shuffle=False
     )
 
@@ -158,27 +291,34 @@ def main():
     # ------------------------------
     # 5.6 Compute L2 prediction errors
     # ------------------------------
-    y_val_pred = model.predict(X_val)
+    y_val_pred = model.predict(val_ds)
 
     l2_errors = np.linalg.norm(y_val - y_val_pred, axis=1)
 
     print("\nPrediction L2 error stats:")
     print("min:", float(np.min(l2_errors)))
     print("max:", float(np.max(l2_errors)))
-    print("mean:", float(np.mean(l2_errors)))
+    print("mean:", float(np.average(l2_errors, weights=val_weights)))
 
-    threshold = float(np.mean(l2_errors) + 3 * np.std(l2_errors))
+    error_stats = weighted_stats(l2_errors, val_weights, (0.5, 0.9, 0.99, 0.9987))
+    threshold = float(error_stats["mean"] + 3 * error_stats["std"])
     print("Suggested anomaly threshold:", threshold)
 
     anomaly_labels = (l2_errors > threshold).astype(int)
-    print("Number of anomalies in val set:", int(anomaly_labels.sum()))
+    print("Number of anomalies in val set:", int(val_weights[anomaly_labels == 1].sum()))
 
     # ------------------------------
-    # 5.7 Save threshold + errors
+    # 5.7 Save threshold + error summary
     # ------------------------------
+    # Only a fixed-size summary is kept (not every validation error); the
+    # live pipeline tracks the error distribution with streaming sketches.
     thr_file = os.path.join(ARTIFACTS_DIR, "lstm_threshold_info.pkl")
     joblib.dump(
-        {"threshold": threshold, "val_l2_errors": l2_errors},
+        {
+            "threshold": threshold,
+            "val_error_stats": error_stats,
+            "compaction": compaction
+        },
         thr_file
     )
     print(f"Threshold info saved to: {thr_file}\n")
@@ -197,57 +337,36 @@ def main():
         "Bandwidth"
     ]
 
+    anom = np.flatnonzero(anomaly_labels)
+    explanations = lstm_report(val_windows[anom], y_val[anom], y_val_pred[anom],
+                               feature_names, errors=l2_errors[anom])
+    explanations.insert(2, "weight", val_weights[anom])
+    explanations_path = os.path.join(ARTIFACTS_DIR, "lstm_explanations.jsonl")
+    write_report(explanations, explanations_path)
+
     print("\n==============================")
     print(" LSTM ANOMALY EXPLANATIONS")
-    print("==============================\n")
-
-    # helper to infer reason from feature & diff
-    def reason(feature, diff):
-        if feature == "CPU Usage":
-            return "CPU spike / overload"
-        if feature == "Memory Usage":
-            return "Memory leak or sudden increase"
-        if feature == "RTT (Latency)":
-            return "RTT spike / latency anomaly"
-        if feature == "Packet-In Rate":
-            return "Packet-In burst / possible DoS"
-        if feature == "Packet-Out Rate":
-            return "Controller broadcast spike"
-        if feature == "Flow-Mod Rate":
-            return "Controller slow to install rules"
-        if feature == "Flows per second":
-            return "Flow churn anomaly"
-        if feature == "Bandwidth":
-            return "Sudden traffic surge/drop"
-        return "General temporal deviation"
-
-    # per-feature absolute errors
-    abs_errors = np.abs(y_val - y_val_pred)
-
-    for idx, is_anom in enumerate(anomaly_labels):
-        if not is_anom:
-            continue
-
-        print(f"\n⚠️ Anomaly at validation index {idx}  (L2 error = {l2_errors[idx]:.4f})")
-
-        errors = abs_errors[idx]
-        top3_idx = np.argsort(errors)[-3:][::-1]
-
-        for f_idx in top3_idx:
-            fname = feature_names[f_idx]
-            actual = y_val[idx][f_idx]
-            pred = y_val_pred[idx][f_idx]
-            diff = actual - pred
-
-            print(f"  • {fname}:")
-            print(f"      - Actual value   : {actual:.5f}")
-            print(f"      - Predicted value: {pred:.5f}")
-            print(f"      - Difference     : {diff:+.5f}")
-            print(f"      - Reason         : {reason(fname, diff)}\n")
+    print("==============================")
+    print(f"{len(explanations)} anomalous windows -> {explanations_path}")
+    print("Top deviating features:", summarize_report(explanations, "top1_feature"))
+    print("Reasons:", summarize_report(explanations, "top1_reason"))
+    print(explanations.nlargest(5, "error").to_string(index=False, max_colwidth=40))
+
+    # ==============================
+    # 5.9 Multi-horizon forecaster (early warning)
+    # ==============================
+    if HORIZONS:
+        train_forecaster(data_scaled, split, lstm_features, epochs, early_stopping)
 
     print("\n✅ LSTM training + anomaly explanation complete.")
     print("All artifacts saved in:", ARTIFACTS_DIR)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the LSTM forecaster")
+    parser.add_argument("--data", default=DATA_PATH, help="training capture")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--early-stopping", type=int, default=EARLY_STOPPING, metavar="PATIENCE",
+                        help="stop after PATIENCE epochs without val_loss improvement")
+    args = parser.parse_args()
+    main(epochs=args.epochs, early_stopping=args.early_stopping, data_path=args.data)
@@ -0,0 +1,383 @@
+# ============================================================
+# model_registry.py
+# Versioned model registry + background watcher for hot-swapping
+# models into the realtime pipeline without a restart.
+#
+# Layout (relative to model/):
+#   registry/
+#     CURRENT                   <- active version id (one line)
+#     history.json              <- activation history (for rollback)
+#     versions/<version>/
+#         manifest.json         <- thresholds, features, checksums
+#         lstm_best_model.h5, lstm_scaler.pkl, lstm_threshold_info.pkl
+#         isolation_forest_model.pkl, if_scaler.pkl, if_threshold_info.pkl
+#         lstm_forecast_model.h5, lstm_forecast_info.pkl  (optional)
+#
+# Usage (from model/):
+#   python model_registry.py publish [--version V] [--activate]
+#   python model_registry.py activate V
+#   python model_registry.py rollback
+#   python model_registry.py list
+# ============================================================
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+
+import joblib
+
+from anomaly_inference import ModelBundle, LSTM_FEATURES
+
+REGISTRY_DIR = "registry"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+HISTORY_FILE = "history.json"
+
+LSTM_ARTIFACTS = {
+    "model": "lstm_best_model.h5",
+    "scaler": "lstm_scaler.pkl",
+    "info": "lstm_threshold_info.pkl",
+}
+IF_ARTIFACTS = {
+    "model": "isolation_forest_model.pkl",
+    "scaler": "if_scaler.pkl",
+    "info": "if_threshold_info.pkl",
+}
+# Multi-horizon forecaster (lstm_final.py): published when present in lstm_dir
+FORECAST_ARTIFACTS = {
+    "model": "lstm_forecast_model.h5",
+    "info": "lstm_forecast_info.pkl",
+}
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class ModelRegistry:
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.versions_dir = os.path.join(root, "versions")
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+    # -------------------------------------------------------------------
+    # Publishing
+    # -------------------------------------------------------------------
+    def publish(self, version=None, lstm_dir="lstmModels", if_dir="ifmodels",
+                seq_len=20, activate=False):
+
+        version = version or time.strftime("v%Y%m%d-%H%M%S")
+        final_dir = self.version_dir(version)
+        if os.path.exists(final_dir):
+            raise ValueError(f"Version already exists: {version}")
+
+        # Stage in a temp dir and rename, so watchers never see half a version
+        staging = f"{final_dir}.staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        checksums = {}
+        for src_dir, names in ((lstm_dir, LSTM_ARTIFACTS), (if_dir, IF_ARTIFACTS)):
+            for name in names.values():
+                dst = os.path.join(staging, name)
+                shutil.copy2(os.path.join(src_dir, name), dst)
+                checksums[name] = sha256_file(dst)
+
+        forecast = all(os.path.exists(os.path.join(lstm_dir, name))
+                       for name in FORECAST_ARTIFACTS.values())
+        if forecast:
+            for name in FORECAST_ARTIFACTS.values():
+                dst = os.path.join(staging, name)
+                shutil.copy2(os.path.join(lstm_dir, name), dst)
+                checksums[name] = sha256_file(dst)
+
+        lstm_info = joblib.load(os.path.join(staging, LSTM_ARTIFACTS["info"]))
+        if_info = joblib.load(os.path.join(staging, IF_ARTIFACTS["info"]))
+
+        manifest = {
+            "version": version,
+            "created": time.time(),
+            "seq_len": seq_len,
+            "lstm": {
+                **LSTM_ARTIFACTS,
+                "threshold": float(lstm_info["threshold"]),
+                "features": LSTM_FEATURES,
+            },
+            "if": {
+                **IF_ARTIFACTS,
+                "threshold": float(if_info["threshold"]),
+                "features": list(if_info["features"]),
+            },
+            "forecast": dict(FORECAST_ARTIFACTS) if forecast else None,
+            "checksums": checksums,
+        }
+        _write_atomic(os.path.join(staging, MANIFEST_FILE), json.dumps(manifest, indent=2))
+        os.rename(staging, final_dir)
+
+        if activate:
+            self.activate(version)
+        return manifest
+
+    # -------------------------------------------------------------------
+    # Lookup / activation
+    # -------------------------------------------------------------------
+    def version_dir(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def versions(self):
+        found = []
+        for name in os.listdir(self.versions_dir):
+            if os.path.exists(os.path.join(self.version_dir(name), MANIFEST_FILE)):
+                found.append(name)
+        return sorted(found)
+
+    def manifest(self, version):
+        with open(os.path.join(self.version_dir(version), MANIFEST_FILE), "r") as f:
+            return json.load(f)
+
+    def stamp(self, version):
+        """(mtime_ns, sha256) of the version's manifest; None if it is missing."""
+        path = os.path.join(self.version_dir(version), MANIFEST_FILE)
+        try:
+            return os.stat(path).st_mtime_ns, sha256_file(path)
+        except OSError:
+            return None
+
+    def current(self):
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def history(self):
+        try:
+            with open(os.path.join(self.root, HISTORY_FILE), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def activate(self, version):
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version: {version}")
+
+        history = self.history()
+        if not history or history[-1] != version:
+            history.append(version)
+        _write_atomic(os.path.join(self.root, HISTORY_FILE), json.dumps(history))
+        _write_atomic(os.path.join(self.root, CURRENT_FILE), version + "\n")
+
+    def rollback(self):
+        """Re-activate the version that was active before the current one."""
+        history = self.history()
+        if len(history) < 2:
+            raise ValueError("No previous version to roll back to")
+
+        history.pop()
+        _write_atomic(os.path.join(self.root, HISTORY_FILE), json.dumps(history))
+        _write_atomic(os.path.join(self.root, CURRENT_FILE), history[-1] + "\n")
+        return history[-1]
+
+    # -------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------
+    def verify(self, version):
+        vdir = self.version_dir(version)
+        for name, digest in self.manifest(version)["checksums"].items():
+            if sha256_file(os.path.join(vdir, name)) != digest:
+                raise ValueError(f"Checksum mismatch in {version}: {name}")
+
+    def load_bundle(self, version):
+        import tensorflow as tf
+
+        self.verify(version)
+        manifest = self.manifest(version)
+        vdir = self.version_dir(version)
+        lstm, iso = manifest["lstm"], manifest["if"]
+
+        lstm_model = tf.keras.models.load_model(
+            os.path.join(vdir, lstm["model"]),
+            custom_objects={"r2_metric": lambda y_true, y_pred: 0}
+        )
+
+        forecast_model = forecast_info = None
+        forecast = manifest.get("forecast")
+        if forecast:
+            forecast_model = tf.keras.models.load_model(os.path.join(vdir, forecast["model"]), compile=False)
+            forecast_info = joblib.load(os.path.join(vdir, forecast["info"]))
+
+        return ModelBundle(
+            lstm_model,
+            joblib.load(os.path.join(vdir, lstm["scaler"])),
+            lstm["threshold"],
+            joblib.load(os.path.join(vdir, iso["model"])),
+            joblib.load(os.path.join(vdir, iso["scaler"])),
+            iso["threshold"],
+            lstm_features=lstm["features"],
+            if_features=iso["features"],
+            seq_len=manifest.get("seq_len", 20),
+            version=version,
+            if_baseline=joblib.load(os.path.join(vdir, iso["info"])).get("baseline"),
+            forecast_model=forecast_model,
+            forecast_info=forecast_info
+        )
+
+
+class RegistryWatcher:
+    """
+    Watches registry/CURRENT from a daemon thread and loads newly activated
+    versions in the background. The pipeline calls poll() between ticks and
+    swaps the returned bundle in, so inference never waits on a load.
+
+    Recently loaded bundles stay cached, so rolling back to one of them is
+    an instant swap with no disk or TensorFlow work.
+
+    A version that failed is skipped until its manifest changes (re-published)
+    or, for load errors (disk, TensorFlow), until retry_interval has passed.
+    """
+
+    def __init__(self, registry, interval=2.0, cache_size=2, retry_interval=60.0):
+        self.registry = registry
+        self.interval = interval
+        self.cache_size = cache_size
+        self.retry_interval = retry_interval
+        self.cache = {}          # version -> ModelBundle (most recent last)
+        self.active_version = None
+        self.failed = {}         # version -> (manifest stamp, error message, retry time or None)
+
+        self._lock = threading.Lock()
+        self._pending = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load_current(self):
+        """Synchronous initial load (startup only)."""
+        version = self.registry.current()
+        if version is None:
+            return None
+        bundle = self._get(version)
+        self.active_version = version
+        return bundle
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="registry-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self):
+        """Returns a newly activated bundle once, or None."""
+        with self._lock:
+            bundle, self._pending = self._pending, None
+        return bundle
+
+    def accept(self, bundle):
+        self.active_version = bundle.version
+
+    def reject(self, bundle, error):
+        """Called when the pipeline refuses a bundle (e.g. feature mismatch)."""
+        self._fail(bundle.version, error)
+        with self._lock:
+            self.cache.pop(bundle.version, None)
+
+    def _fail(self, version, error, retry_after=None):
+        stamp = self.registry.stamp(version)
+        retry_at = time.time() + retry_after if retry_after is not None else None
+        with self._lock:
+            self.failed[version] = (stamp, str(error), retry_at)
+
+    def _skip_failed(self, version):
+        """True while a failed version should not be loaded again."""
+        with self._lock:
+            entry = self.failed.get(version)
+        if entry is None:
+            return False
+        stamp, _, retry_at = entry
+        if stamp == self.registry.stamp(version) and (retry_at is None or time.time() < retry_at):
+            return True
+        with self._lock:
+            self.failed.pop(version, None)
+        return False
+
+    def _get(self, version):
+        # the cache is shared with reject() on the pipeline thread; the load
+        # itself runs outside the lock so poll() never waits on disk
+        with self._lock:
+            bundle = self.cache.pop(version, None)
+        if bundle is None:
+            bundle = self.registry.load_bundle(version)
+        with self._lock:
+            self.cache[version] = bundle
+            while len(self.cache) > self.cache_size:
+                self.cache.pop(next(iter(self.cache)))
+        return bundle
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            version = self.registry.current()
+            with self._lock:
+                pending = self._pending
+            if version is None or version == self.active_version or self._skip_failed(version):
+                continue
+            if pending is not None and pending.version == version:
+                continue
+            try:
+                bundle = self._get(version)
+            except Exception as e:
+                self._fail(version, e, retry_after=self.retry_interval)
+                print(f"[-] Model version {version} rejected: {e}")
+                continue
+            with self._lock:
+                self._pending = bundle
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Versioned model registry")
+    parser.add_argument("--root", default=REGISTRY_DIR)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_pub = sub.add_parser("publish", help="publish lstmModels/ + ifmodels/ as a new version")
+    p_pub.add_argument("--version")
+    p_pub.add_argument("--activate", action="store_true")
+
+    p_act = sub.add_parser("activate", help="make a version current")
+    p_act.add_argument("version")
+
+    sub.add_parser("rollback", help="re-activate the previous version")
+    sub.add_parser("list", help="list versions")
+
+    args = parser.parse_args()
+    registry = ModelRegistry(args.root)
+
+    if args.cmd == "publish":
+        manifest = registry.publish(args.version, activate=args.activate)
+        print(f"Published {manifest['version']}" + (" (active)" if args.activate else ""))
+    elif args.cmd == "activate":
+        registry.activate(args.version)
+        print(f"Active version: {args.version}")
+    elif args.cmd == "rollback":
+        print(f"Rolled back to: {registry.rollback()}")
+    else:
+        current = registry.current()
+        for v in registry.versions():
+            print(("* " if v == current else "  ") + v)
@@ -0,0 +1,191 @@
+# ============================================================
+# online_forest.py
+# Background incremental Isolation Forest retraining.
+#
+# Recent *normal* rows (final decision = normal) are kept in a
+# fixed-size sliding sample. Every `interval` seconds a child
+# process fits `trees_per_round` new trees on that sample; when it
+# finishes, the new trees replace the oldest ones of the live
+# forest and the new FlatForest is published with a single
+# reference swap between ticks. Inference never waits on training.
+#
+# The child is a plain subprocess running this file:
+#   python online_forest.py fit ROWS.npy OUT.npz --trees K --seed S
+# ============================================================
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+from shared_artifacts import FlatForest
+
+
+class SlidingSample:
+    """Ring buffer of the most recent `capacity` rows (fixed memory)."""
+
+    def __init__(self, capacity, num_features):
+        self.rows = np.zeros((capacity, num_features), dtype=np.float64)
+        self.capacity = capacity
+        self.count = 0
+
+    def add(self, row):
+        self.rows[self.count % self.capacity] = row
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def snapshot(self):
+        return self.rows[:len(self)].copy()
+
+
+class OnlineForestTrainer:
+
+    def __init__(self, infer, capacity=4096, trees_per_round=30, interval=600.0,
+                 max_samples=256, min_rows=1024, work_dir=None):
+        self.infer = infer
+        self.sample = SlidingSample(capacity, len(infer.iso_features))
+        self.trees_per_round = trees_per_round
+        self.interval = interval
+        self.max_samples = max_samples
+        self.min_rows = max(min_rows, max_samples)
+        self._own_work_dir = work_dir is None    # removed again by close()
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="online_if_")
+
+        self.forest = None
+        self.next_slot = 0          # oldest tree position (round-robin)
+        self.rounds = 0             # published rounds
+        self.attempts = 0           # started rounds; seeds the child, so a retry draws new trees
+        self.last_start = time.time()
+        self._job = None            # (Popen, out_path, forest it was started for)
+        self._adopt()
+
+    def _adopt(self):
+        # The live model must be a FlatForest so individual trees can be replaced
+        if not isinstance(self.infer.if_model, FlatForest):
+            self.infer.if_model = FlatForest.from_sklearn(self.infer.if_model)
+        self.forest = self.infer.if_model
+        self.next_slot = 0
+
+    # -------------------------------------------------------------------
+    # Called from the pipeline loop
+    # -------------------------------------------------------------------
+    def observe(self, x12_features, is_normal):
+        if is_normal:
+            self.sample.add(x12_features)
+
+    def step(self):
+        """Non-blocking: publishes finished rounds and starts due ones."""
+
+        # Model replaced externally (e.g. registry hot-swap): start over
+        if self.infer.if_model is not self.forest:
+            self._cancel()
+            self._adopt()
+
+        if self._job is not None and self._job[0].poll() is not None:
+            self._finish()
+
+        if (self._job is None and len(self.sample) >= self.min_rows
+                and time.time() - self.last_start >= self.interval):
+            self._start()
+
+    def close(self):
+        self._cancel()
+        if self._own_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    # -------------------------------------------------------------------
+    # Background round
+    # -------------------------------------------------------------------
+    def _start(self):
+        rows_path = os.path.join(self.work_dir, "rows.npy")
+        out_path = os.path.join(self.work_dir, f"round_{self.attempts}.npz")
+        np.save(rows_path, self.infer.if_scaler.transform(self.sample.snapshot()))
+
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "fit", rows_path, out_path,
+             "--trees", str(self.trees_per_round),
+             "--max-samples", str(self.max_samples),
+             "--seed", str(self.attempts)],
+            stdout=subprocess.DEVNULL
+        )
+        self._job = (proc, out_path, self.forest)
+        self.attempts += 1
+        self.last_start = time.time()
+
+    def _finish(self):
+        proc, out_path, started_for = self._job
+        self._job = None
+
+        if proc.returncode != 0 or started_for is not self.forest:
+            print(f"[-] Online IF round {self.rounds} discarded (exit {proc.returncode})")
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            return
+
+        with np.load(out_path) as f:
+            new = FlatForest(f["forest_feature"], f["forest_threshold"],
+                             f["forest_left"], f["forest_right"],
+                             f["forest_leaf_depth"], f["forest_roots"],
+                             self.forest.offset_, self.forest.path_norm, int(f["max_depth"]))
+        os.remove(out_path)
+
+        trees = [self.forest.tree_arrays(i) for i in range(self.forest.n_trees)]
+        for i in range(new.n_trees):
+            trees[(self.next_slot + i) % len(trees)] = new.tree_arrays(i)
+        self.next_slot = (self.next_slot + new.n_trees) % len(trees)
+
+        # Publish: one reference swap, picked up by the next update_if() call
+        self.forest = FlatForest.from_trees(trees, self.forest.offset_, self.forest.path_norm)
+        self.infer.if_model = self.forest
+        self.rounds += 1
+        print(f"[*] Online IF round {self.rounds}: replaced {new.n_trees} oldest trees")
+
+    def _cancel(self):
+        if self._job is not None:
+            self._job[0].kill()
+            self._job[0].wait()
+            self._job = None
+
+
+# ==============================
+# Child process: fit K trees
+# ==============================
+def fit_trees(rows_path, out_path, n_trees, max_samples, seed):
+    from sklearn.ensemble import IsolationForest
+    from shared_artifacts import flatten_forest
+
+    X = np.load(rows_path)
+    forest = IsolationForest(
+        n_estimators=n_trees,
+        max_samples=min(max_samples, len(X)),
+        contamination="auto",
+        max_features=1.0,
+        n_jobs=1,
+        random_state=seed
+    ).fit(X)
+
+    arrays, meta = flatten_forest(forest)
+    tmp = out_path + ".tmp.npz"
+    np.savez(tmp, max_depth=meta["max_depth"], **arrays)
+    os.replace(tmp, out_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online Isolation Forest worker")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_fit = sub.add_parser("fit", help="fit K trees on scaled rows (.npy) and write flattened arrays")
+    p_fit.add_argument("rows")
+    p_fit.add_argument("out")
+    p_fit.add_argument("--trees", type=int, default=30)
+    p_fit.add_argument("--max-samples", type=int, default=256)
+    p_fit.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fit_trees(args.rows, args.out, args.trees, args.max_samples, args.seed)
@@ -0,0 +1,475 @@
+# ============================================================
+# replay.py
+# Offline replay / backtesting over a telemetry capture.
+#
+# Streams a capture (training_data.csv or any CSV with the same
+# columns) through the production AnomalyInference +
+# MLDecisionEngine code as fast as possible:
+#   batch   vectorized scoring (sliding LSTM windows, whole-array
+#           IF), equivalent to the live loop with fixed thresholds
+#           up to float32 rounding: batched LSTM predictions differ
+#           from one-window ones in the last digits (relative error
+#           ~1e-6), which can reorder near-tied LSTM reasons and
+#           with them a decision type (1 of the first 3000 rows of
+#           training_data.csv)
+#   stream  row-by-row through the live methods (supports the
+#           cascade gate), for exact per-tick latency
+#
+# Outputs per-row decisions, a detection timeline (incidents),
+# per-anomaly explanations (JSONL), rows/s and per-stage
+# latency percentiles. With a multi-horizon forecaster in the
+# bundle, predicted_* warnings are replayed too and their lead
+# time over the LSTM / IF detections is reported.
+#
+#   python replay.py run training_data.csv --shared-dir sharedModels --out replay_out
+#   python replay.py compare training_data.csv --registry registry --a v1 --b v2
+# ============================================================
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from anomaly_inference import AnomalyInference, LSTM_FEATURES
+from diagnosis_decision_engine import MLDecisionEngine, IncidentAggregator
+from explain import if_report, write_report
+
+SEVERITY_ORDER = {"LOW": 0, "MEDIUM": 1, "HIGH": 2, "CRITICAL": 3}
+
+
+class StageTimer:
+    """Per-stage wall time; each sample is the cost per row of one call."""
+
+    def __init__(self):
+        self.samples = {}
+        self.totals = {}
+
+    def add(self, stage, seconds, rows=1):
+        self.samples.setdefault(stage, []).append(seconds / max(rows, 1))
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+
+    def report(self):
+        out = {}
+        for stage, samples in self.samples.items():
+            us = np.array(samples) * 1e6
+            out[stage] = {
+                "total_s": self.totals[stage],
+                "calls": len(samples),
+                "p50_us_per_row": float(np.percentile(us, 50)),
+                "p99_us_per_row": float(np.percentile(us, 99)),
+            }
+        return out
+
+
+def load_capture(path, limit=None):
+    return pd.read_csv(path, nrows=limit)
+
+
+def load_inference(shared_dir=None, registry=None, version=None):
+    if registry:
+        from model_registry import ModelRegistry
+        reg = ModelRegistry(registry)
+        return AnomalyInference(bundle=reg.load_bundle(version or reg.current()))
+    return AnomalyInference(shared_dir=shared_dir)
+
+
+class ReplayEngine:
+
+    def __init__(self, infer, engine=None, batch_size=4096, forecast=True):
+        self.infer = infer
+        self.engine = engine or MLDecisionEngine()
+        self.batch_size = batch_size
+        self.forecast = forecast and infer.forecast_model is not None
+
+    def run(self, df, mode="batch", cascade_kwargs=None):
+        timer = StageTimer()
+        t0 = time.perf_counter()
+        X8 = df[LSTM_FEATURES].to_numpy(dtype=np.float64)
+        X12 = df[self.infer.iso_features].to_numpy(dtype=np.float64)
+        timer.add("features", time.perf_counter() - t0, len(df))
+
+        if mode == "batch":
+            cols = self._run_batch(X8, X12, timer)
+        elif mode == "stream":
+            cols = self._run_stream(X8, X12, timer, cascade_kwargs)
+        else:
+            raise ValueError(f"unknown replay mode {mode!r}")
+        elapsed = time.perf_counter() - t0
+
+        lstm_reasons = cols.pop("lstm_reasons")
+        frame = pd.DataFrame({"timestamp": df["timestamp"].to_numpy(), **cols})
+        return {
+            "frame": frame,
+            "lstm_reasons": lstm_reasons,
+            "forecast_lookback": int(max(self.infer.horizons)) if self.forecast else 0,
+            "rows": len(frame),
+            "elapsed_s": elapsed,
+            "rows_per_s": len(frame) / max(elapsed, 1e-9),
+            "stages": timer.report(),
+        }
+
+    # -------------------------------------------------------------------
+    # Vectorized
+    # -------------------------------------------------------------------
+    def _run_batch(self, X8, X12, timer):
+        n = len(X8)
+        infer, bs = self.infer, self.batch_size
+
+        t = time.perf_counter()
+        lstm_flag, lstm_error, lstm_reasons = infer.score_lstm_batch(X8, batch_size=bs)
+        timer.add("lstm", time.perf_counter() - t, n)
+
+        if_flag = np.zeros(n, dtype=bool)
+        if_score = np.zeros(n)
+        if_reasons = []
+        for start in range(0, n, bs):
+            t = time.perf_counter()
+            f, s, r = infer.score_if_batch(X12[start:start + bs])
+            if_flag[start:start + bs], if_score[start:start + bs] = f, s
+            if_reasons.extend(r)
+            timer.add("if", time.perf_counter() - t, len(f))
+
+        fc_flag, fc_horizon = np.zeros(n, dtype=bool), np.zeros(n, dtype=np.int64)
+        if self.forecast:
+            t = time.perf_counter()
+            fc_flag, fc_horizon, fc_feature, fc_value, fc_bound = infer.score_forecast_batch(X8, batch_size=bs)
+            timer.add("forecast", time.perf_counter() - t, n)
+
+        # Decision engine is per tick (pure Python); normal ticks share one result
+        t = time.perf_counter()
+        decisions = [None] * n
+        normal = self.engine.run({"lstm_anomaly": False}, {"if_anomaly": False})
+        for i in range(n):
+            if lstm_flag[i] or if_flag[i] or fc_flag[i]:
+                lstm_output = {"lstm_anomaly": lstm_flag[i], "error": lstm_error[i], "reasons": lstm_reasons[i]}
+                if fc_flag[i]:
+                    lstm_output["forecast"] = {
+                        "forecast_anomaly": True,
+                        "horizon": int(fc_horizon[i]),
+                        "feature": LSTM_FEATURES[fc_feature[i]],
+                        "value": float(fc_value[i]),
+                        "bound": float(fc_bound[i])
+                    }
+                decisions[i] = self.engine.run(
+                    lstm_output,
+                    {"if_anomaly": if_flag[i], "score": if_score[i], "reasons": if_reasons[i]})
+            else:
+                decisions[i] = normal
+        timer.add("decision", time.perf_counter() - t, n)
+
+        return self._columns(lstm_flag, lstm_error, if_flag, if_score, decisions, lstm_reasons,
+                             fc_flag, fc_horizon)
+
+    # -------------------------------------------------------------------
+    # Row by row (live code path)
+    # -------------------------------------------------------------------
+    def _run_stream(self, X8, X12, timer, cascade_kwargs=None):
+        n = len(X8)
+        infer = self.infer
+        cascade = None
+        if cascade_kwargs is not None:
+            from cascade import CascadeScorer
+            cascade = CascadeScorer(infer, **cascade_kwargs)
+
+        lstm_flag = np.zeros(n, dtype=bool)
+        lstm_error = np.zeros(n)
+        if_flag = np.zeros(n, dtype=bool)
+        if_score = np.zeros(n)
+        fc_flag = np.zeros(n, dtype=bool)
+        fc_horizon = np.zeros(n, dtype=np.int64)
+        lstm_reasons = [None] * n
+        decisions = [None] * n
+        clock = time.perf_counter
+
+        for i in range(n):
+            x8, x12 = list(X8[i]), list(X12[i])
+            if cascade is not None:
+                t = clock()
+                lstm_output, if_output = cascade.score(x8, x12)
+                timer.add("cascade", clock() - t)
+            else:
+                t = clock()
+                f, e, r = infer.update_lstm(x8)
+                t1 = clock()
+                lstm_output = {"lstm_anomaly": f, "error": e, "reasons": r}
+                f, s, r = infer.update_if(x12)
+                t2 = clock()
+                if_output = {"if_anomaly": f, "score": s, "reasons": r}
+                timer.add("lstm", t1 - t)
+                timer.add("if", t2 - t1)
+
+            # forecaster only on ticks where the LSTM ran (as in the pipeline)
+            if self.forecast and not lstm_output.get("skipped"):
+                t = clock()
+                lstm_output["forecast"] = infer.score_forecast()
+                timer.add("forecast", clock() - t)
+                fc = lstm_output["forecast"]
+                if fc and fc["forecast_anomaly"]:
+                    fc_flag[i], fc_horizon[i] = True, fc["horizon"]
+
+            t = clock()
+            decisions[i] = self.engine.run(lstm_output, if_output)
+            timer.add("decision", clock() - t)
+
+            lstm_flag[i], lstm_error[i] = lstm_output["lstm_anomaly"], lstm_output["error"]
+            if_flag[i], if_score[i] = if_output["if_anomaly"], if_output["score"]
+            lstm_reasons[i] = lstm_output["reasons"]
+
+        return self._columns(lstm_flag, lstm_error, if_flag, if_score, decisions, lstm_reasons,
+                             fc_flag, fc_horizon)
+
+    def _columns(self, lstm_flag, lstm_error, if_flag, if_score, decisions, lstm_reasons,
+                 fc_flag, fc_horizon):
+        cols = {
+            "lstm_reasons": lstm_reasons,
+            "lstm_anomaly": lstm_flag,
+            "lstm_error": lstm_error,
+            "if_anomaly": if_flag,
+            "if_score": if_score,
+        }
+        if self.forecast:
+            cols["forecast_anomaly"] = fc_flag
+            cols["forecast_horizon"] = fc_horizon
+        return {
+            **cols,
+            "anomaly": np.array([d["anomaly"] for d in decisions], dtype=bool),
+            "type": [d["type"] for d in decisions],
+            "severity": [d["severity"] for d in decisions],
+            "healing_action": [d["healing_action"] for d in decisions],
+        }
+
+
+    # -------------------------------------------------------------------
+    # Explanations (anomalous rows only, vectorized)
+    # -------------------------------------------------------------------
+    def explain(self, df, result):
+        """
+        One record per anomalous row: decision, the top IF deviations with
+        their z-scores / diagnosis (same labels as the live reasons) and the
+        LSTM reasons of that tick.
+        """
+        infer, frame = self.infer, result["frame"]
+        rows = np.flatnonzero(frame["anomaly"].to_numpy())
+        X12 = df[infer.iso_features].to_numpy(dtype=np.float64)[rows]
+        report = if_report(rows, X12, infer.if_scaler.transform(X12), infer.if_baseline,
+                           infer.if_names, scores=frame["if_score"].to_numpy()[rows])
+        report = report.rename(columns=lambda c: f"if_{c}" if c.startswith("top") else c)
+        report.insert(1, "timestamp", frame["timestamp"].to_numpy()[rows])
+        for col in ("type", "severity", "lstm_error"):
+            report[col] = frame[col].to_numpy()[rows]
+        reasons = [result["lstm_reasons"][i] or [] for i in rows]
+        for j in range(3):
+            report[f"lstm_top{j + 1}"] = [r[j] if len(r) > j else None for r in reasons]
+        return report
+
+
+# ==============================
+# Detection timeline
+# ==============================
+def timeline(frame, merge_gap=0):
+    """
+    Groups anomalous rows into incidents: runs of anomalies separated by at
+    most merge_gap normal rows. One entry per incident, in time order.
+    """
+    idx = np.flatnonzero(frame["anomaly"].to_numpy())
+    if len(idx) == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(idx) > merge_gap + 1)
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(idx) - 1]))
+
+    ts = frame["timestamp"].to_numpy()
+    types = frame["type"].to_numpy()
+    severity = frame["severity"].to_numpy()
+
+    incidents = []
+    for s, e in zip(starts, ends):
+        rows = idx[s:e + 1]
+        kinds, counts = np.unique(types[rows], return_counts=True)
+        incidents.append({
+            "start_row": int(rows[0]),
+            "end_row": int(rows[-1]),
+            "start": float(ts[rows[0]]),
+            "end": float(ts[rows[-1]]),
+            "anomalous_rows": int(len(rows)),
+            "type": str(kinds[np.argmax(counts)]),
+            "types": {str(k): int(c) for k, c in zip(kinds, counts)},
+            "max_severity": max(severity[rows], key=lambda v: SEVERITY_ORDER.get(v, 0)),
+        })
+    return incidents
+
+
+def incident_records(frame, **kwargs):
+    """Records the live IncidentAggregator would emit (opens + closes) for the capture."""
+    agg = IncidentAggregator(**kwargs)
+    for ts, anomaly, kind in zip(frame["timestamp"], frame["anomaly"], frame["type"]):
+        agg.observe({"anomaly": bool(anomaly), "type": kind}, ts=float(ts))
+    return agg.emitted
+
+
+def forecast_lead(frame, lookback, merge_gap=0):
+    """
+    Early warning of the forecaster over the detectors. Detector incidents
+    are runs of LSTM / IF flags (merge_gap as in timeline()); an incident is
+    forewarned when a forecast warning fires in the `lookback` rows before
+    its start (not inside the previous incident), and its lead is the
+    distance from the first such warning. Warnings with no detector flag in
+    the next `lookback` rows are false warnings.
+    """
+    det = (frame["lstm_anomaly"] | frame["if_anomaly"]).to_numpy()
+    warn = frame["forecast_anomaly"].to_numpy()
+    ts = frame["timestamp"].to_numpy(dtype=np.float64)
+    idx = np.flatnonzero(det)
+
+    leads, lead_s = [], []
+    if len(idx):
+        breaks = np.flatnonzero(np.diff(idx) > merge_gap + 1)
+        starts = idx[np.concatenate(([0], breaks + 1))]
+        prev_ends = np.concatenate(([-1], idx[breaks]))
+        for s, prev in zip(starts, prev_ends):
+            lo = max(s - lookback, prev + 1)
+            hit = np.flatnonzero(warn[lo:s])
+            if len(hit):
+                first = lo + hit[0]
+                leads.append(s - first)
+                lead_s.append(ts[s] - ts[first])
+        n_incidents = len(starts)
+    else:
+        n_incidents = 0
+
+    # rows to the next detector flag (at or after each warning)
+    warn_rows = np.flatnonzero(warn & ~det)
+    ahead = np.append(idx, np.iinfo(np.int64).max)[np.searchsorted(idx, warn_rows)] - warn_rows
+
+    return {
+        "lookback_rows": int(lookback),
+        "warning_rows": int(warn.sum()),
+        "detector_incidents": int(n_incidents),
+        "forewarned": len(leads),
+        "forewarned_ratio": len(leads) / n_incidents if n_incidents else 0.0,
+        "lead_rows_mean": float(np.mean(leads)) if leads else 0.0,
+        "lead_rows_median": float(np.median(leads)) if leads else 0.0,
+        "lead_s_mean": float(np.mean(lead_s)) if lead_s else 0.0,
+        "false_warning_rows": int((ahead > lookback).sum()),
+    }
+
+
+def summarize(result, merge_gap=0):
+    frame = result["frame"]
+    incidents = timeline(frame, merge_gap)
+    summary = {
+        "rows": result["rows"],
+        "elapsed_s": result["elapsed_s"],
+        "rows_per_s": result["rows_per_s"],
+        "anomalous_rows": int(frame["anomaly"].sum()),
+        "lstm_flags": int(frame["lstm_anomaly"].sum()),
+        "if_flags": int(frame["if_anomaly"].sum()),
+        "incidents": len(incidents),
+        "incident_records": incident_records(frame),
+        "types": {str(k): int(v) for k, v in frame.loc[frame["anomaly"], "type"].value_counts().items()},
+        "stages": result["stages"],
+    }
+    if "forecast_anomaly" in frame:
+        summary["forecast"] = forecast_lead(frame, result["forecast_lookback"], merge_gap)
+    return summary, incidents
+
+
+def write_outputs(result, out_dir, merge_gap=0):
+    os.makedirs(out_dir, exist_ok=True)
+    summary, incidents = summarize(result, merge_gap)
+    result["frame"].to_csv(os.path.join(out_dir, "decisions.csv"), index=False)
+    with open(os.path.join(out_dir, "timeline.json"), "w") as f:
+        json.dump(incidents, f, indent=2)
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    if "explanations" in result:
+        write_report(result["explanations"], os.path.join(out_dir, "explanations.jsonl"))
+    return summary
+
+
+# ==============================
+# Model version comparison
+# ==============================
+def compare(frame_a, frame_b):
+    a, b = frame_a["anomaly"].to_numpy(), frame_b["anomaly"].to_numpy()
+    both = a & b
+    same_type = both & (frame_a["type"].to_numpy() == frame_b["type"].to_numpy())
+    return {
+        "rows": int(len(a)),
+        "anomalous_a": int(a.sum()),
+        "anomalous_b": int(b.sum()),
+        "agreement": float((a == b).mean()) if len(a) else 1.0,
+        "only_a": int((a & ~b).sum()),
+        "only_b": int((b & ~a).sum()),
+        "same_type_when_both": float(same_type.sum() / both.sum()) if both.any() else 1.0,
+        "incidents_a": len(timeline(frame_a)),
+        "incidents_b": len(timeline(frame_b)),
+    }
+
+
+def _print_summary(summary):
+    print("\n========== REPLAY SUMMARY ==========")
+    for k, v in summary.items():
+        if k == "stages":
+            continue
+        print(f"{k:<16}: {v:.2f}" if isinstance(v, float) else f"{k:<16}: {v}")
+    print("\nStage            total_s    p50 us/row   p99 us/row")
+    for stage, s in summary["stages"].items():
+        print(f"{stage:<14} {s['total_s']:>9.3f} {s['p50_us_per_row']:>12.2f} {s['p99_us_per_row']:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline replay / backtesting of the inference + decision stack")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="replay a capture and write decisions / timeline / summary")
+    p_run.add_argument("capture")
+    p_run.add_argument("--out", default="replay_out")
+    p_run.add_argument("--mode", choices=["batch", "stream"], default="batch")
+    p_run.add_argument("--cascade", action="store_true", help="stream mode: score through the cascade gate")
+    p_run.add_argument("--no-forecast", action="store_true", help="ignore the bundle's forecaster")
+
+    p_cmp = sub.add_parser("compare", help="replay one capture against two model versions")
+    p_cmp.add_argument("capture")
+    p_cmp.add_argument("--a", required=True, help="registry version (or shared dir with --shared)")
+    p_cmp.add_argument("--b", required=True)
+    p_cmp.add_argument("--shared", action="store_true", help="--a / --b are shared artifact directories")
+
+    p_run.add_argument("--shared-dir", default=None)
+    p_run.add_argument("--version", default=None, help="registry version (default: CURRENT)")
+
+    for p in (p_run, p_cmp):
+        p.add_argument("--registry", default=None)
+        p.add_argument("--limit", type=int, default=None)
+        p.add_argument("--batch-size", type=int, default=4096)
+        p.add_argument("--merge-gap", type=int, default=0, help="normal rows allowed inside one incident")
+    args = parser.parse_args()
+
+    df = load_capture(args.capture, args.limit)
+
+    if args.cmd == "run":
+        infer = load_inference(args.shared_dir, args.registry, args.version)
+        replay = ReplayEngine(infer, batch_size=args.batch_size, forecast=not args.no_forecast)
+        result = replay.run(df, mode=args.mode, cascade_kwargs={} if args.cascade else None)
+        result["explanations"] = replay.explain(df, result)
+        summary = write_outputs(result, args.out, args.merge_gap)
+        _print_summary(summary)
+        print(f"\n[*] Wrote {args.out}/decisions.csv, timeline.json, summary.json, explanations.jsonl")
+    else:
+        frames = []
+        for ref in (args.a, args.b):
+            if args.shared:
+                infer = load_inference(shared_dir=ref)
+            else:
+                infer = load_inference(registry=args.registry or "registry", version=ref)
+            result = ReplayEngine(infer, batch_size=args.batch_size).run(df)
+            print(f"[*] {ref}: {result['rows_per_s']:.0f} rows/s")
+            frames.append(result["frame"])
+
+        print("\n========== MODEL COMPARISON ==========")
+        for k, v in compare(*frames).items():
+            print(f"{k:<20}: {v:.4f}" if isinstance(v, float) else f"{k:<20}: {v}")
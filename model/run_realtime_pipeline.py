@@ -1,10 +1,18 @@
 import time
-import pandas as pd
+from collections import deque
+import numpy as np
 from anomaly_inference import AnomalyInference
-from diagnosis_decision_engine import MLDecisionEngine
+from diagnosis_decision_engine import MLDecisionEngine, IncidentAggregator
+from model_registry import ModelRegistry, RegistryWatcher
+from cascade import CascadeScorer
+from adaptive_threshold import AdaptiveThresholds
+from online_forest import OnlineForestTrainer
+from tail_reader import CsvTailReader
+from decision_sink import DecisionLog
 import yaml
 
 import os
+import sys
 
 # ---------------- LOAD CONFIG ----------------
 # Resolve paths relative to this script
@@ -20,110 +28,345 @@ TELEMETRY_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "../monitoring_and_tel
 CSV_FILENAME = config['telemetry']['csv_path']
 CSV_PATH = os.path.join(TELEMETRY_ROOT, CSV_FILENAME)
 POLL_INTERVAL = config['controller']['poll_interval']
+PIPELINE_CFG = config.get('pipeline', {})
 
-# ---------------- INIT MODELS ----------------
-infer = AnomalyInference()
-engine = MLDecisionEngine()
-
-print("[*] Real-Time Anomaly Pipeline Started")
-
-last_timestamp = None
-
-while True:
-    try:
-        # Read last row only (efficient)
-        df = pd.read_csv(CSV_PATH)
-
-        if df.empty:
-            time.sleep(1)
-            continue
-
-        row = df.iloc[-1]
-
-        # Avoid reprocessing same data
-        if last_timestamp == row['timestamp']:
-            time.sleep(1)
-            continue
-
-        last_timestamp = row['timestamp']
-
-        # ---------------- BUILD FEATURE VECTORS ----------------
-
-        x8 = [
-            row['lstm_cpu'],
-            row['lstm_mem'],
-            row['lstm_rtt'],
-            row['lstm_pkt_in'],
-            row['lstm_pkt_out'],
-            row['lstm_flow_mod'],
-            row['lstm_flows_sec'],
-            row['lstm_bw']
-        ]
-
-        x12 = [
-            row['if_cpu'],
-            row['if_mem'],
-            row['if_rtt'],
-            row['if_pkt_in'],
-            row['if_pkt_out'],
-            row['if_flow_mod'],
-            row['if_table_occ'],
-            row['if_link_loss'],
-            row['if_bw'],
-            row['if_churn'],
-            row['if_zscore_avg'],
-            row['if_ratio_pkt_flow']
-        ]
-
-        # ---------------- LSTM INFERENCE ----------------
-        lstm_flag, lstm_error, lstm_reasons = infer.update_lstm(x8)
+# Shared-memory feature ring lives with the telemetry agent (producer side)
+sys.path.insert(0, TELEMETRY_ROOT)
+from feature_ring import FeatureRingReader, view_to_records
+from feature_schema import WIDTH, TIMESTAMP, LSTM, IF, TRACE, T_INGEST, STREAM_ID, to_records
+from latency_trace import LatencyTracer, TRACE_FIELDS
 
+THRESHOLD_FILE = os.path.join(TELEMETRY_ROOT, 'logs', 'adaptive_thresholds.json')
+
+
+class RealtimePipeline:
+    """
+    Per-tick building blocks of the realtime pipeline. run() drives them in
+    a single loop; staged_pipeline.run_staged() drives the same methods as
+    asyncio stages connected by bounded queues.
+    """
+
+    def __init__(self):
+
+        # ---------------- INIT MODELS ----------------
+        # With a registry configured, the active version is loaded from it and newly
+        # activated versions are hot-swapped between ticks (LSTM window is kept).
+        registry_dir = PIPELINE_CFG.get('registry_dir') or None
+        shared_dir = PIPELINE_CFG.get('shared_model_dir') or None
+        self.watcher = None
+
+        if registry_dir:
+            registry = ModelRegistry(registry_dir)
+            self.watcher = RegistryWatcher(registry, interval=PIPELINE_CFG.get('registry_poll_interval', 2.0))
+            bundle = self.watcher.load_current()
+            self.infer = AnomalyInference(shared_dir=shared_dir, bundle=bundle)
+            self.watcher.accept(self.infer.bundle)
+            self.watcher.start()
+            print(f"[*] Model registry: {registry_dir} (active: {self.infer.bundle.version})")
+        else:
+            self.infer = AnomalyInference(shared_dir=shared_dir)
+        self.engine = MLDecisionEngine()
+
+        # Multi-horizon forecaster: predicted_* early warnings from the same window
+        # (score_forecast() returns None while the active bundle has none, so a
+        # hot-swapped version with or without a forecaster takes effect as is)
+        self.forecast = PIPELINE_CFG.get('forecast', True)
+        if self.forecast and self.infer.forecast_model is not None:
+            print(f"[*] Forecasting enabled (horizons {list(self.infer.horizons)})")
+
+        # Cascade mode: run the LSTM only when the z-score / IF gate asks for it
+        self.cascade = None
+        if PIPELINE_CFG.get('cascade', False):
+            self.cascade = CascadeScorer(
+                self.infer,
+                z=PIPELINE_CFG.get('cascade_z', 4.0),
+                if_margin=PIPELINE_CFG.get('cascade_if_margin', 0.05),
+                force_every=PIPELINE_CFG.get('cascade_force_every', 30),
+                gate_if=PIPELINE_CFG.get('cascade_gate_if', False)
+            )
+            print("[*] Cascade scoring enabled")
+
+        # Adaptive thresholds: streaming quantile sketches of recent scores
+        self.thresholds = None
+        if PIPELINE_CFG.get('adaptive_thresholds', False):
+            self.thresholds = AdaptiveThresholds(
+                {"lstm": self.infer.lstm_threshold, "if": self.infer.if_threshold},
+                window=PIPELINE_CFG.get('threshold_window', 3600),
+                publish_every=PIPELINE_CFG.get('threshold_publish_every', 300)
+            )
+            print("[*] Adaptive thresholds enabled")
+
+        # Online IF retraining: refit a few trees at a time on recent normal rows
+        self.online_forest = None
+        if PIPELINE_CFG.get('online_if', False):
+            self.online_forest = OnlineForestTrainer(
+                self.infer,
+                capacity=PIPELINE_CFG.get('online_if_capacity', 4096),
+                trees_per_round=PIPELINE_CFG.get('online_if_trees', 30),
+                interval=PIPELINE_CFG.get('online_if_interval', 600)
+            )
+            print("[*] Online Isolation Forest retraining enabled")
+
+        self.ring = None
+        self.tail = None
+        if PIPELINE_CFG.get('source', 'csv') == 'ring':
+            self.ring = FeatureRingReader(config['telemetry']['ring_path'])
+            print(f"[*] Reading features from ring: {config['telemetry']['ring_path']}")
+        else:
+            self.tail = CsvTailReader(CSV_PATH)
+        self.pending_rows = deque()
+
+        # Decision log for the Self-Healing layer: buffered, rotating, normal
+        # ticks stored as run-length records
+        self.decision_log = DecisionLog(
+            os.path.join(TELEMETRY_ROOT, PIPELINE_CFG.get('decision_log', 'logs/anomaly_decisions.json')),
+            normal_mode=PIPELINE_CFG.get('decision_log_normal', 'runs'),
+            flush_interval=PIPELINE_CFG.get('decision_log_flush_interval', 0.5),
+            max_bytes=int(PIPELINE_CFG.get('decision_log_max_mb', 16) * 1024 * 1024),
+            max_age=PIPELINE_CFG.get('decision_log_max_age', 3600),
+            compress=PIPELINE_CFG.get('decision_log_compress', True),
+            keep_segments=PIPELINE_CFG.get('decision_log_keep', 48)
+        )
+
+        # Incident aggregation: anomalous ticks are coalesced per stream and
+        # type; only open / escalate / close records reach the decision log
+        self.incidents = None
+        if PIPELINE_CFG.get('incidents', True):
+            self.incidents = IncidentAggregator(
+                open_after=PIPELINE_CFG.get('incident_open_after', 1),
+                close_after=PIPELINE_CFG.get('incident_close_after', 5),
+                escalate_ratio=PIPELINE_CFG.get('incident_escalate_ratio', 1.5),
+                max_idle=PIPELINE_CFG.get('incident_max_idle', 60)
+            )
+
+        # End-to-end latency tracing (controller event -> decision)
+        self.tracer = None
+        if config['telemetry'].get('trace_enabled', False):
+            self.tracer = LatencyTracer(
+                slo_ms=PIPELINE_CFG.get('trace_slo_ms'),
+                export_path=os.path.join(TELEMETRY_ROOT, 'logs', 'latency_trace.json'),
+                export_interval=PIPELINE_CFG.get('trace_export_interval', 10)
+            )
+            print("[*] Latency tracing enabled")
+
+    # ---------------- MODEL HOT-SWAP (between ticks) ----------------
+    def hot_swap(self):
+        if self.watcher is None:
+            return
+        new_bundle = self.watcher.poll()
+        if new_bundle is None:
+            return
+        try:
+            self.infer.swap_models(new_bundle)
+            self.watcher.accept(new_bundle)
+            if self.thresholds is not None:
+                self.thresholds.reset({"lstm": self.infer.lstm_threshold, "if": self.infer.if_threshold})
+            print(f"[*] Swapped to model version {new_bundle.version}")
+        except ValueError as e:
+            self.watcher.reject(new_bundle, e)
+            print(f"[-] Model swap refused: {e}")
+
+    # ---------------- INGEST (ring or tail-follow CSV) ----------------
+    # Only records / bytes appended since the last read are consumed;
+    # every new row is returned in order (no gaps in the LSTM window).
+    # Rows come back as one (n, feature_schema.WIDTH) array; each row is a
+    # view into it.
+    def read_rows(self):
+        if self.ring is not None:
+            # Records are copied straight out of shared memory, then
+            # validated against overwrite by a lapping writer
+            first_seq, view = self.ring.poll()
+            if view is None:
+                return np.empty((0, WIDTH))
+            rows = view_to_records(view)
+            if not self.ring.validate(first_seq, len(view)):
+                return np.empty((0, WIDTH))
+        else:
+            blocks = [to_records(block, columns) for columns, block in self.tail.read_blocks()]
+            rows = blocks[0] if len(blocks) == 1 else np.concatenate(blocks or [np.empty((0, WIDTH))])
+
+        if self.tracer is not None:
+            rows[:, T_INGEST] = time.time()
+        return rows
+
+    def wait_source(self, timeout):
+        self.decision_log.poll()
+        (self.ring or self.tail).wait(timeout)
+
+    # ---------------- BUILD FEATURE VECTORS ----------------
+    # LSTM / IF inputs are views of the record (feature_schema layout)
+    @staticmethod
+    def build_vectors(row):
+        return row[LSTM], row[IF]
+
+    @staticmethod
+    def stream_id(row):
+        # switch / feed of a multi-stream source (0 for single-stream captures)
+        return int(row[STREAM_ID])
+
+    # ---------------- MODEL INFERENCE ----------------
+    # score_lstm() and score_if() touch disjoint model state, so the staged
+    # runner may execute them concurrently in separate threads.
+    def score_lstm(self, x8):
+        lstm_flag, lstm_error, lstm_reasons = self.infer.update_lstm(x8)
         lstm_output = {
             "lstm_anomaly": lstm_flag,
             "error": lstm_error,
             "reasons": lstm_reasons
         }
+        if self.forecast:
+            lstm_output["forecast"] = self.infer.score_forecast()
+        return lstm_output
 
-        # ---------------- IF INFERENCE ----------------
-        if_flag, if_score, if_reasons = infer.update_if(x12)
-
-        if_output = {
+    def score_if(self, x12):
+        if_flag, if_score, if_reasons = self.infer.update_if(x12)
+        return {
             "if_anomaly": if_flag,
             "score": if_score,
             "reasons": if_reasons
         }
 
-        # ---------------- DECISION ENGINE ----------------
-        decision = engine.run(lstm_output, if_output)
-        
-        # ---------------- LOGGING TO FILE ----------------
-        # Save for Self-Healing Layer
+    def score(self, x8, x12):
+        if self.cascade is not None:
+            # Cheap gate decides whether this tick needs the full LSTM
+            # (the forecaster only runs on ticks where the LSTM ran)
+            lstm_output, if_output = self.cascade.score(x8, x12)
+            if self.forecast and not lstm_output.get("skipped"):
+                lstm_output["forecast"] = self.infer.score_forecast()
+            return lstm_output, if_output
+        return self.score_lstm(x8), self.score_if(x12)
+
+    # ---------------- ADAPTIVE THRESHOLDS ----------------
+    def update_thresholds(self, lstm_output, if_output):
+        if self.thresholds is None:
+            return
+        infer = self.infer
+        published = False
+        lstm_ran = len(infer.buffer) >= infer.seq_len and not lstm_output.get("skipped", False)
+        if lstm_ran:
+            new_thr = self.thresholds.update("lstm", lstm_output["error"])
+            if new_thr is not None:
+                infer.lstm_threshold = new_thr
+                published = True
+        if not if_output.get("skipped", False):
+            new_thr = self.thresholds.update("if", if_output["score"])
+            if new_thr is not None:
+                infer.if_threshold = new_thr
+                published = True
+        if published:
+            self.thresholds.save(THRESHOLD_FILE)
+
+    # ---------------- DECISION ENGINE ----------------
+    def decide(self, lstm_output, if_output, x12):
+        decision = self.engine.run(lstm_output, if_output)
+
+        # ---------------- ONLINE IF RETRAINING ----------------
+        if self.online_forest is not None:
+            self.online_forest.observe(x12, not decision['anomaly'])
+            self.online_forest.step()
+        return decision
+
+    # ---------------- LATENCY TRACE ----------------
+    def trace(self, row, decision, t_infer_start, t_infer_end):
+        if self.tracer is None:
+            return
+        # NaN = not traced by the source
+        trace = {f: (v if v == v else None) for f, v in zip(TRACE_FIELDS, row[TRACE].tolist())}
+        t_ingest = float(row[T_INGEST])
+        trace['t_ingest'] = t_ingest if t_ingest == t_ingest else None
+        trace['t_infer_start'] = t_infer_start
+        trace['t_infer_end'] = t_infer_end
+        trace['t_decision'] = time.time()
+        self.tracer.record(trace)
+        if decision['anomaly']:
+            # per-incident time-to-detect in the decision log
+            decision['trace'] = {k: v for k, v in trace.items() if v is not None and v == v}
+
+    # ---------------- LOGGING TO FILE ----------------
+    def incident_score(self, lstm_output, if_output):
+        # Peak / escalation score of an incident: the larger model score
+        # relative to its threshold
+        infer = self.infer
+        ratios = [if_output['score'] / infer.if_threshold if infer.if_threshold > 0 else 0.0]
+        if not lstm_output.get('skipped') and infer.lstm_threshold > 0:
+            ratios.append(lstm_output['error'] / infer.lstm_threshold)
+        return max(ratios)
+
+    def log_decision(self, decision, score=0.0, stream_id=0):
+        # Save for Self-Healing Layer (monitoring_and_telemetry/logs/anomaly_decisions.json)
         decision['timestamp'] = time.time()
-        
-        # Path: monitoring_and_telemetry/logs/anomaly_decisions.json
-        log_dir = os.path.join(script_dir, '..', 'monitoring_and_telemetry', 'logs')
-        log_file = os.path.join(log_dir, 'anomaly_decisions.json')
-        
-        # Ensure dir exists
-        os.makedirs(log_dir, exist_ok=True)
-        
-        # Append as one JSON object per line (JSONL format)
-        with open(log_file, 'a') as f:
-            f.write(json.dumps(decision) + "\n")
-
-        # ---------------- LIVE OUTPUT ----------------
+        if self.incidents is None:
+            self.decision_log.write(decision)
+            return
+        for record in self.incidents.observe(decision, stream_id, score):
+            self.decision_log.write(record)
+        if not decision['anomaly']:
+            self.decision_log.write(decision)
+
+    # ---------------- LIVE OUTPUT ----------------
+    @staticmethod
+    def print_live(row, lstm_output, if_output, decision):
         print("\n================ LIVE DECISION ================")
-        print(f"Time           : {row['timestamp']}")
-        print(f"LSTM Anomaly   : {lstm_flag} | Error: {lstm_error:.4f}")
-        print(f"IF Anomaly     : {if_flag} | Score: {if_score:.4f}")
+        print(f"Time           : {row[TIMESTAMP]}")
+        lstm_note = " (gated off)" if lstm_output.get("skipped") else ""
+        print(f"LSTM Anomaly   : {lstm_output['lstm_anomaly']} | Error: {lstm_output['error']:.4f}{lstm_note}")
+        print(f"IF Anomaly     : {if_output['if_anomaly']} | Score: {if_output['score']:.4f}")
         print("Final Decision:", decision)
 
-        time.sleep(POLL_INTERVAL)
+    # ---------------- SINGLE-LOOP MODE ----------------
+    def process(self, row):
+        x8, x12 = self.build_vectors(row)
+        t_infer_start = time.time()
+        lstm_output, if_output = self.score(x8, x12)
+        t_infer_end = time.time()
+        self.update_thresholds(lstm_output, if_output)
+        decision = self.decide(lstm_output, if_output, x12)
+        self.trace(row, decision, t_infer_start, t_infer_end)
+        decision["stream_id"] = self.stream_id(row)
+        self.log_decision(decision, self.incident_score(lstm_output, if_output), decision["stream_id"])
+        self.print_live(row, lstm_output, if_output, decision)
+
+    def run(self):
+        while True:
+            try:
+                self.hot_swap()
+
+                if not self.pending_rows:
+                    self.pending_rows.extend(self.read_rows())
+                    if not self.pending_rows:
+                        self.wait_source(POLL_INTERVAL)
+                        continue
+
+                self.process(self.pending_rows.popleft())
+
+            except KeyboardInterrupt:
+                print("\nStopping real-time pipeline...")
+                self.close()
+                break
+
+            except Exception as e:
+                print("Error:", e)
+                time.sleep(1)
+
+    def close(self):
+        if self.online_forest is not None:
+            self.online_forest.close()
+        (self.ring or self.tail).close()
+        self.decision_log.close()
+        if self.tracer is not None:
+            self.tracer.export()
+
 
-    except KeyboardInterrupt:
-        print("\nStopping real-time pipeline...")
-        break
+if __name__ == "__main__":
+    pipeline = RealtimePipeline()
+    print("[*] Real-Time Anomaly Pipeline Started")
 
-    except Exception as e:
-        print("Error:", e)
-        time.sleep(1)
+    if PIPELINE_CFG.get('mode', 'loop') == 'staged':
+        from staged_pipeline import run_staged
+        run_staged(pipeline, PIPELINE_CFG, POLL_INTERVAL,
+                   stats_path=os.path.join(TELEMETRY_ROOT, 'logs', 'pipeline_stats.json'))
+    elif PIPELINE_CFG.get('mode', 'loop') == 'sharded':
+        from sharded_pipeline import run_sharded
+        run_sharded(pipeline, PIPELINE_CFG, POLL_INTERVAL)
+    else:
+        pipeline.run()
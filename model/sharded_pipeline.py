@@ -0,0 +1,449 @@
+# ============================================================
+# sharded_pipeline.py
+# Process-sharded inference, partitioned by stream id (one stream
+# per datapath / controller feed).
+#
+# - The dispatcher maps stream ids onto N worker processes with
+#   rendezvous (highest-random-weight) hashing: adding a worker
+#   moves only the streams that now hash to it (~1/N of them).
+# - Each worker owns the LSTM windows of its streams and scores
+#   micro-batches locally (one LSTM forward pass for all streams
+#   of a batch, whole-array IF), then runs the decision engine.
+# - Every record gets a global sequence number; worker results
+#   are merged back into one output stream in submit order.
+# - add_worker() rebalances live: windows of the moved streams
+#   are handed from the old owner to the new one before any of
+#   their new records are routed there.
+#
+#   python sharded_pipeline.py bench --shared-dir sharedModels --workers 1 2 4
+# ============================================================
+
+import os
+import sys
+import time
+import heapq
+import queue
+import hashlib
+import argparse
+import multiprocessing as mp
+from collections import deque
+
+import numpy as np
+
+
+def rendezvous_owner(stream_id, worker_ids):
+    """Worker with the highest hash(stream, worker) owns the stream."""
+    def weight(w):
+        digest = hashlib.blake2b(f"{stream_id}:{w}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+    return max(worker_ids, key=weight)
+
+
+# -------------------------------------------------------------------
+# Worker process
+# -------------------------------------------------------------------
+def score_batch(infer, engine, windows, batch):
+    """
+    batch: list of (seq, stream_id, x8, x12) in submit order. Returns
+    [(seq, lstm_output, if_output, decision)] with the same per-row results
+    as the single-loop pipeline running each stream on its own.
+    """
+    n = len(batch)
+    seq_len = infer.seq_len
+    if_flags, if_scores, if_reasons = infer.score_if_batch([r[3] for r in batch])
+
+    lstm_flags = np.zeros(n, dtype=bool)
+    lstm_errors = np.zeros(n)
+    lstm_reasons = [[] for _ in range(n)]
+
+    # A stream can occur several times in one batch; each round appends at
+    # most one row per stream, so every row is scored on its own window.
+    pending = list(range(n))
+    while pending:
+        this_round, later, seen = [], [], set()
+        for i in pending:
+            sid = batch[i][1]
+            (later if sid in seen else this_round).append(i)
+            seen.add(sid)
+        pending = later
+
+        ready, wins = [], []
+        for i in this_round:
+            sid = batch[i][1]
+            window = windows.get(sid)
+            if window is None:
+                window = windows[sid] = deque(maxlen=seq_len)
+            window.append(batch[i][2])
+            if len(window) >= seq_len:
+                ready.append(i)
+                wins.append(window)
+        if ready:
+            seqs = np.array(wins, dtype=np.float64)            # (k, seq_len, 8)
+            scaled = infer.lstm_scaler.transform(seqs.reshape(-1, seqs.shape[2])).reshape(seqs.shape)
+            flags, errors, reasons = infer.score_lstm_windows(scaled)
+            for j, i in enumerate(ready):
+                lstm_flags[i], lstm_errors[i], lstm_reasons[i] = flags[j], errors[j], reasons[j]
+
+    out = []
+    for i, rec in enumerate(batch):
+        lstm_output = {
+            "lstm_anomaly": bool(lstm_flags[i]),
+            "error": float(lstm_errors[i]),
+            "reasons": lstm_reasons[i]
+        }
+        if_output = {
+            "if_anomaly": bool(if_flags[i]),
+            "score": float(if_scores[i]),
+            "reasons": if_reasons[i]
+        }
+        out.append((rec[0], lstm_output, if_output, engine.run(lstm_output, if_output)))
+    return out
+
+
+def _worker_main(worker_id, shared_dir, inbox, outbox):
+    # heavy imports only in the child (spawned processes start clean)
+    from anomaly_inference import AnomalyInference
+    from diagnosis_decision_engine import MLDecisionEngine
+
+    infer = AnomalyInference(shared_dir=shared_dir)
+    engine = MLDecisionEngine()
+    windows = {}                               # stream_id -> deque of x8 rows
+    outbox.put(("ready", worker_id, infer.seq_len))
+
+    while True:
+        kind, payload = inbox.get()
+        if kind == "batch":
+            outbox.put(("results", worker_id, score_batch(infer, engine, windows, payload)))
+        elif kind == "export":
+            moved = {sid: list(windows.pop(sid)) for sid in payload if sid in windows}
+            outbox.put(("windows", worker_id, moved))
+        elif kind == "import":
+            for sid, rows in payload.items():
+                windows[sid] = deque(rows, maxlen=infer.seq_len)
+        elif kind == "stop":
+            break
+
+
+# -------------------------------------------------------------------
+# Dispatcher
+# -------------------------------------------------------------------
+class ShardedPipeline:
+    """
+    submit() records, read them back in order with poll() / drain().
+    Not thread-safe: one thread drives the dispatcher.
+    """
+
+    def __init__(self, n_workers=None, shared_dir=None, batch_size=64, max_in_flight=8):
+        self.shared_dir = shared_dir
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight     # unanswered batches per worker (backpressure)
+        self.ctx = mp.get_context("spawn")
+        self.outbox = self.ctx.Queue()
+
+        self.workers = {}                      # worker_id -> (process, inbox)
+        self.owner = {}                        # stream_id -> worker_id
+        self.batches = {}                      # worker_id -> records not sent yet
+        self.in_flight = {}                    # worker_id -> batches sent, not answered
+
+        self.next_seq = 0                      # next sequence number to assign
+        self.emit_seq = 0                      # next sequence number to emit
+        self.meta = {}                         # seq -> (stream_id, worker_id, meta)
+        self.done = []                         # heap of (seq, result) waiting for order
+        self._replies = []                     # control replies (export / ready)
+
+        self.n_initial = n_workers or os.cpu_count() or 1
+
+    def start(self):
+        for _ in range(self.n_initial):
+            self._spawn()
+        self._wait_ready(list(self.workers))
+        return self
+
+    def _spawn(self):
+        worker_id = len(self.workers)
+        inbox = self.ctx.Queue()
+        proc = self.ctx.Process(target=_worker_main, name=f"shard-{worker_id}",
+                                args=(worker_id, self.shared_dir, inbox, self.outbox), daemon=True)
+        proc.start()
+        self.workers[worker_id] = (proc, inbox)
+        self.batches[worker_id] = []
+        self.in_flight[worker_id] = 0
+        return worker_id
+
+    def _wait_ready(self, worker_ids):
+        for worker_id in worker_ids:
+            self._wait_reply("ready", worker_id)
+
+    # -------------------------------------------------------------------
+    # Routing
+    # -------------------------------------------------------------------
+    def route(self, stream_id):
+        worker_id = self.owner.get(stream_id)
+        if worker_id is None:
+            worker_id = self.owner[stream_id] = rendezvous_owner(stream_id, list(self.workers))
+        return worker_id
+
+    def submit(self, stream_id, x8, x12, meta=None):
+        seq = self.next_seq
+        self.next_seq += 1
+        worker_id = self.route(stream_id)
+        self.meta[seq] = (stream_id, worker_id, meta)
+
+        batch = self.batches[worker_id]
+        batch.append((seq, stream_id, x8, x12))
+        if len(batch) >= self.batch_size:
+            self._send(worker_id)
+        return seq
+
+    def _send(self, worker_id):
+        batch = self.batches[worker_id]
+        if not batch:
+            return
+        while self.in_flight[worker_id] >= self.max_in_flight:
+            self._receive(timeout=1.0)
+        self.batches[worker_id] = []
+        self.in_flight[worker_id] += 1
+        self.workers[worker_id][1].put(("batch", batch))
+
+    def flush(self):
+        """Sends partially filled batches."""
+        for worker_id in self.workers:
+            self._send(worker_id)
+
+    @property
+    def pending(self):
+        return self.next_seq - self.emit_seq
+
+    # -------------------------------------------------------------------
+    # Ordered merge
+    # -------------------------------------------------------------------
+    def _receive(self, timeout):
+        """Handles one message from the workers; False if none arrived."""
+        try:
+            kind, worker_id, payload = self.outbox.get(timeout=timeout) if timeout else self.outbox.get_nowait()
+        except queue.Empty:
+            self._check_alive()
+            return False
+        if kind == "results":
+            self.in_flight[worker_id] -= 1
+            now = time.time()
+            for seq, lstm_output, if_output, decision in payload:
+                heapq.heappush(self.done, (seq, lstm_output, if_output, decision, now))
+        else:
+            self._replies.append((kind, worker_id, payload))
+        return True
+
+    def _wait_reply(self, kind, worker_id):
+        while True:
+            for reply in self._replies:
+                if reply[0] == kind and reply[1] == worker_id:
+                    self._replies.remove(reply)
+                    return reply[2]
+            self._receive(timeout=1.0)
+
+    def _check_alive(self):
+        for worker_id, (proc, _) in self.workers.items():
+            if not proc.is_alive():
+                raise RuntimeError(f"shard worker {worker_id} exited (code {proc.exitcode})")
+
+    def _ordered(self):
+        out = []
+        while self.done and self.done[0][0] == self.emit_seq:
+            seq, lstm_output, if_output, decision, t_done = heapq.heappop(self.done)
+            stream_id, worker_id, meta = self.meta.pop(seq)
+            out.append({
+                "seq": seq,
+                "stream_id": stream_id,
+                "worker": worker_id,
+                "lstm": lstm_output,
+                "if": if_output,
+                "decision": decision,
+                "t_done": t_done,
+                "meta": meta
+            })
+            self.emit_seq += 1
+        return out
+
+    def poll(self, timeout=0.0):
+        """Results that are next in order; waits up to timeout for the first message."""
+        if self._receive(timeout):
+            while self._receive(0):
+                pass
+        return self._ordered()
+
+    def drain(self):
+        """Flushes and waits until every submitted record has a result."""
+        self.flush()
+        out = self._ordered()
+        while self.pending:
+            self._receive(timeout=1.0)
+            out.extend(self._ordered())
+        return out
+
+    # -------------------------------------------------------------------
+    # Rebalancing
+    # -------------------------------------------------------------------
+    def add_worker(self):
+        """
+        Starts one more worker and moves the streams that now hash to it,
+        together with their LSTM windows. Returns (worker_id, moved streams).
+        """
+        new_id = self._spawn()
+        self._wait_ready([new_id])
+
+        worker_ids = list(self.workers)
+        moved = {}
+        for stream_id, old_id in self.owner.items():
+            if rendezvous_owner(stream_id, worker_ids) == new_id:
+                moved.setdefault(old_id, []).append(stream_id)
+
+        # Queued records of the moved streams must reach the old owner first;
+        # inboxes are FIFO, so its export reply reflects all of them.
+        self.flush()
+        for old_id, streams in moved.items():
+            self.workers[old_id][1].put(("export", streams))
+        for old_id, streams in moved.items():
+            windows = self._wait_reply("windows", old_id)
+            self.workers[new_id][1].put(("import", windows))
+            for stream_id in streams:
+                self.owner[stream_id] = new_id
+
+        return new_id, sum(len(s) for s in moved.values())
+
+    def close(self):
+        for proc, inbox in self.workers.values():
+            if proc.is_alive():
+                inbox.put(("stop", None))
+        for proc, _ in self.workers.values():
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+
+
+# -------------------------------------------------------------------
+# Realtime mode (pipeline.mode: "sharded")
+# -------------------------------------------------------------------
+def run_sharded(pipeline, cfg, poll_interval):
+    """
+    Drives a RealtimePipeline's source and sinks with the scoring sharded
+    across processes. Rows are partitioned by their stream_id column (0 when
+    absent). Cascade, adaptive thresholds, online IF retraining and registry
+    hot-swap apply to the single-process modes only.
+    """
+    from feature_schema import STREAM_ID
+
+    sharded = ShardedPipeline(
+        n_workers=cfg.get('shard_workers') or None,
+        shared_dir=cfg.get('shared_model_dir') or None,
+        batch_size=cfg.get('shard_batch_size', 64)
+    ).start()
+    print(f"[*] Sharded scoring: {len(sharded.workers)} worker processes")
+
+    def emit(results):
+        for res in results:
+            row, t_submit = res["meta"]
+            decision = res["decision"]
+            decision["stream_id"] = res["stream_id"]
+            pipeline.trace(row, decision, t_submit, res["t_done"])
+            pipeline.log_decision(decision, pipeline.incident_score(res["lstm"], res["if"]), res["stream_id"])
+            if decision["anomaly"]:
+                pipeline.print_live(row, res["lstm"], res["if"], decision)
+
+    try:
+        while True:
+            rows = pipeline.read_rows()
+            if len(rows):
+                t_submit = time.time()
+                for row in rows:
+                    x8, x12 = pipeline.build_vectors(row)
+                    sharded.submit(int(row[STREAM_ID]), x8, x12, meta=(row, t_submit))
+                sharded.flush()
+                emit(sharded.poll())
+            elif sharded.pending:
+                emit(sharded.poll(timeout=min(poll_interval, 0.05)))
+                pipeline.decision_log.poll()
+            else:
+                pipeline.wait_source(poll_interval)
+    except KeyboardInterrupt:
+        print("\nStopping real-time pipeline...")
+    finally:
+        emit(sharded.drain())
+        sharded.close()
+        pipeline.close()
+
+
+# -------------------------------------------------------------------
+# Scaling benchmark
+# -------------------------------------------------------------------
+def _bench_rows(n_streams, n_ticks, seed):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "monitoring_and_telemetry"))
+    from load_generator import SwitchFleet, FeatureStream, Incident
+    from feature_schema import LSTM, IF
+
+    incidents = [Incident.parse(f"dos:{n_ticks // 3}:{max(n_ticks // 10, 1)}:0.2"),
+                 Incident.parse(f"link_flap:{n_ticks // 2}:{max(n_ticks // 20, 1)}:0.1")]
+    fleet = SwitchFleet(n_switches=n_streams, n_controllers=max(n_streams // 16, 1),
+                        incidents=incidents, seed=seed)
+    stream = FeatureStream(fleet, seed=seed)
+    ticks = [stream.tick(t, float(t)) for t in range(1, n_ticks + 1)]
+    # one row per stream per tick, interleaved like a live feed
+    return [(sid, row[LSTM].tolist(), row[IF].tolist())
+            for rows in ticks for sid, row in enumerate(rows)]
+
+
+def bench(args):
+    records = _bench_rows(args.streams, args.ticks, args.seed)
+    print(f"{len(records)} records, {args.streams} streams, cpus: {len(os.sched_getaffinity(0))}")
+
+    reference = None
+    for n_workers in args.workers:
+        sharded = ShardedPipeline(n_workers=n_workers, shared_dir=args.shared_dir,
+                                  batch_size=args.batch_size).start()
+        try:
+            t0 = time.perf_counter()
+            results = []
+            rebalanced = None
+            for i, (sid, x8, x12) in enumerate(records):
+                if args.add_worker_at and i == int(len(records) * args.add_worker_at):
+                    rebalanced = sharded.add_worker()
+                sharded.submit(sid, x8, x12)
+                if i % 1024 == 0:
+                    results.extend(sharded.poll())
+            results.extend(sharded.drain())
+            elapsed = time.perf_counter() - t0
+        finally:
+            sharded.close()
+
+        assert [r["seq"] for r in results] == list(range(len(records))), "results out of order"
+        summary = (np.array([r["lstm"]["error"] for r in results]),
+                   [r["decision"]["type"] for r in results])
+        if reference is None:
+            reference = summary
+            match = "reference"
+        else:
+            same_type = np.mean([a == b for a, b in zip(reference[1], summary[1])])
+            max_diff = float(np.max(np.abs(reference[0] - summary[0])))
+            match = f"types {same_type:.2%}, max lstm error diff {max_diff:.2e}"
+
+        note = f", added worker {rebalanced[0]} ({rebalanced[1]} streams moved)" if rebalanced else ""
+        anomalies = sum(r["decision"]["anomaly"] for r in results)
+        print(f"workers={n_workers}: {len(records) / elapsed:,.0f} rows/s, "
+              f"{anomalies} anomalies, {match}{note}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process-sharded inference (scaling benchmark)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_bench = sub.add_parser("bench", help="score synthetic multi-switch telemetry with 1..N workers")
+    p_bench.add_argument("--shared-dir", default=None)
+    p_bench.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p_bench.add_argument("--streams", type=int, default=64)
+    p_bench.add_argument("--ticks", type=int, default=200)
+    p_bench.add_argument("--batch-size", type=int, default=64)
+    p_bench.add_argument("--add-worker-at", type=float, default=None,
+                         help="fraction of the run after which one worker is added")
+    p_bench.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    bench(args)
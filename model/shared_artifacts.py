@@ -0,0 +1,429 @@
+# ============================================================
+# shared_artifacts.py
+# Exports the trained LSTM + Isolation Forest as flat .npy arrays
+# that many inference worker processes can memory-map read-only
+# (np.load(..., mmap_mode="r")) and share through the page cache.
+#
+# Usage (from model/):
+#   python shared_artifacts.py            -> writes sharedModels/
+#   python shared_artifacts.py --out DIR
+# ============================================================
+
+import os
+import json
+import argparse
+import numpy as np
+import joblib
+
+SHARED_DIR = "sharedModels"
+META_FILE = "meta.json"
+
+EULER_GAMMA = 0.5772156649015329
+
+
+# ==============================
+# 1. Isolation Forest (flattened)
+# ==============================
+def average_path_length(n):
+    """Expected path length of an unsuccessful BST search (same as sklearn)."""
+    n = np.asarray(n, dtype=np.float64)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + EULER_GAMMA) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+def flatten_forest(iso_forest):
+    """
+    Packs every tree of a fitted sklearn IsolationForest into shared node arrays.
+
+    Leaves loop back onto themselves (left = right = node, threshold = +inf), so
+    scoring is a fixed number of branch-free steps over all trees at once.
+    leaf_depth holds depth(leaf) + c(n_node_samples), i.e. the path length sklearn
+    adds up per tree.
+    """
+    features, thresholds, lefts, rights, leaf_depths, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for tree, feat_subset in zip(iso_forest.estimators_, iso_forest.estimators_features_):
+        t = tree.tree_
+        n = t.node_count
+        left = t.children_left.astype(np.int32)
+        right = t.children_right.astype(np.int32)
+        is_leaf = left == -1
+
+        depth = np.zeros(n, dtype=np.float64)
+        for node in range(n):
+            if not is_leaf[node]:
+                depth[left[node]] = depth[node] + 1
+                depth[right[node]] = depth[node] + 1
+
+        own = np.arange(n, dtype=np.int32)
+        feat = np.where(is_leaf, 0, np.asarray(feat_subset)[np.maximum(t.feature, 0)])
+        features.append(feat.astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, t.threshold))
+        lefts.append(np.where(is_leaf, own, left) + offset)
+        rights.append(np.where(is_leaf, own, right) + offset)
+        leaf_depths.append(np.where(is_leaf, depth + average_path_length(t.n_node_samples), 0.0))
+        roots.append(offset)
+
+        offset += n
+        max_depth = max(max_depth, int(t.max_depth))
+
+    arrays = {
+        "forest_feature": np.concatenate(features).astype(np.int32),
+        "forest_threshold": np.concatenate(thresholds).astype(np.float64),
+        "forest_left": np.concatenate(lefts).astype(np.int32),
+        "forest_right": np.concatenate(rights).astype(np.int32),
+        "forest_leaf_depth": np.concatenate(leaf_depths).astype(np.float64),
+        "forest_roots": np.asarray(roots, dtype=np.int32),
+    }
+    meta = {
+        "offset": float(iso_forest.offset_),
+        "path_norm": float(average_path_length([iso_forest.max_samples_])[0]),
+        "max_depth": max_depth,
+    }
+    return arrays, meta
+
+
+class FlatForest:
+    """
+    Isolation Forest scorer over flattened (optionally memory-mapped) node arrays.
+    Mirrors IsolationForest.decision_function so it can stand in for the sklearn model.
+    """
+
+    def __init__(self, feature, threshold, left, right, leaf_depth, roots,
+                 offset, path_norm, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_depth = leaf_depth
+        self.roots = roots
+        self.offset_ = offset
+        self.path_norm = path_norm
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, iso_forest):
+        arrays, meta = flatten_forest(iso_forest)
+        return cls(
+            arrays["forest_feature"], arrays["forest_threshold"],
+            arrays["forest_left"], arrays["forest_right"],
+            arrays["forest_leaf_depth"], arrays["forest_roots"],
+            meta["offset"], meta["path_norm"], meta["max_depth"]
+        )
+
+    @classmethod
+    def from_trees(cls, trees, offset, path_norm):
+        """Packs a list of tree_arrays() dicts back into one forest."""
+        arrays = {k: [] for k in ("feature", "threshold", "left", "right", "leaf_depth")}
+        roots = []
+        base = 0
+        max_depth = 0
+        for tree in trees:
+            for k in arrays:
+                arr = tree[k]
+                arrays[k].append(arr + base if k in ("left", "right") else arr)
+            roots.append(base)
+            base += len(tree["feature"])
+            max_depth = max(max_depth, tree["max_depth"])
+
+        return cls(
+            np.concatenate(arrays["feature"]).astype(np.int32),
+            np.concatenate(arrays["threshold"]).astype(np.float64),
+            np.concatenate(arrays["left"]).astype(np.int32),
+            np.concatenate(arrays["right"]).astype(np.int32),
+            np.concatenate(arrays["leaf_depth"]).astype(np.float64),
+            np.asarray(roots, dtype=np.int32),
+            offset, path_norm, max_depth
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def tree_arrays(self, i):
+        """Node arrays of tree i with tree-local child indices."""
+        start = int(self.roots[i])
+        end = int(self.roots[i + 1]) if i + 1 < self.n_trees else len(self.feature)
+        left = np.asarray(self.left[start:end]) - start
+        right = np.asarray(self.right[start:end]) - start
+
+        # depth of the deepest leaf = number of steps needed to reach it
+        depth = np.zeros(end - start, dtype=np.int32)
+        for node in range(end - start):
+            if left[node] != node:
+                depth[left[node]] = depth[node] + 1
+                depth[right[node]] = depth[node] + 1
+
+        return {
+            "feature": np.asarray(self.feature[start:end]),
+            "threshold": np.asarray(self.threshold[start:end]),
+            "left": left,
+            "right": right,
+            "leaf_depth": np.asarray(self.leaf_depth[start:end]),
+            "max_depth": int(depth.max()),
+        }
+
+    def mean_path_length(self, X):
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.leaf_depth[node].mean(axis=1)
+
+    def score_samples(self, X):
+        return -np.power(2.0, -self.mean_path_length(X) / self.path_norm)
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+
+# ==============================
+# 2. Scalers (array-backed)
+# ==============================
+class ArrayMinMaxScaler:
+    """transform() of a fitted MinMaxScaler from its min_/scale_ arrays."""
+
+    def __init__(self, min_, scale_):
+        self.min_ = min_
+        self.scale_ = scale_
+
+    def transform(self, X):
+        return np.asarray(X, dtype=np.float64) * self.scale_ + self.min_
+
+
+class ArrayStandardScaler:
+    """transform() of a fitted StandardScaler from its mean_/scale_ arrays."""
+
+    def __init__(self, mean_, scale_):
+        self.mean_ = mean_
+        self.scale_ = scale_
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+# ==============================
+# 3. LSTM (NumPy forward pass)
+# ==============================
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class NumpyLSTM:
+    """
+    Inference-only forward pass of the stacked LSTM -> Dense model built by
+    lstm_final.build_lstm_model (Keras gate order i, f, c, o; dropout is a no-op).
+    """
+
+    def __init__(self, layers, dense_kernel, dense_bias):
+        # layers: list of (kernel, recurrent_kernel, bias)
+        self.layers = layers
+        self.dense_kernel = dense_kernel
+        self.dense_bias = dense_bias
+
+    def predict(self, X, verbose=0):
+        h_seq = np.asarray(X, dtype=np.float32)
+        batch, steps = h_seq.shape[0], h_seq.shape[1]
+
+        for kernel, recurrent, bias in self.layers:
+            units = recurrent.shape[0]
+            h = np.zeros((batch, units), dtype=np.float32)
+            c = np.zeros((batch, units), dtype=np.float32)
+            # input projection for every timestep in one matmul
+            x_proj = h_seq @ kernel + bias
+            outputs = np.empty((batch, steps, units), dtype=np.float32)
+
+            for t in range(steps):
+                z = x_proj[:, t] + h @ recurrent
+                i = _sigmoid(z[:, :units])
+                f = _sigmoid(z[:, units:2 * units])
+                g = np.tanh(z[:, 2 * units:3 * units])
+                o = _sigmoid(z[:, 3 * units:])
+                c = f * c + i * g
+                h = o * np.tanh(c)
+                outputs[:, t] = h
+
+            h_seq = outputs
+
+        return h_seq[:, -1] @ self.dense_kernel + self.dense_bias
+
+
+# ==============================
+# 4. Export / load
+# ==============================
+def export_shared(out_dir=SHARED_DIR,
+                  lstm_model_path="lstmModels/lstm_best_model.h5",
+                  lstm_scaler_path="lstmModels/lstm_scaler.pkl",
+                  lstm_info_path="lstmModels/lstm_threshold_info.pkl",
+                  if_model_path="ifmodels/isolation_forest_model.pkl",
+                  if_scaler_path="ifmodels/if_scaler.pkl",
+                  if_info_path="ifmodels/if_threshold_info.pkl",
+                  forecast_model_path="lstmModels/lstm_forecast_model.h5",
+                  forecast_info_path="lstmModels/lstm_forecast_info.pkl"):
+
+    import tensorflow as tf
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    def save(name, arr):
+        np.save(os.path.join(out_dir, f"{name}.npy"), np.ascontiguousarray(arr))
+
+    # ------------------------------
+    # LSTM weights
+    # ------------------------------
+    model = tf.keras.models.load_model(
+        lstm_model_path,
+        custom_objects={"r2_metric": lambda y_true, y_pred: 0}
+    )
+    def save_lstm(model, prefix, dense_prefix):
+        lstm_layers = [l for l in model.layers if isinstance(l, tf.keras.layers.LSTM)]
+        for i, layer in enumerate(lstm_layers):
+            kernel, recurrent, bias = layer.get_weights()
+            save(f"{prefix}_{i}_kernel", kernel.astype(np.float32))
+            save(f"{prefix}_{i}_recurrent", recurrent.astype(np.float32))
+            save(f"{prefix}_{i}_bias", bias.astype(np.float32))
+
+        dense_kernel, dense_bias = model.layers[-1].get_weights()
+        save(f"{dense_prefix}_kernel", dense_kernel.astype(np.float32))
+        save(f"{dense_prefix}_bias", dense_bias.astype(np.float32))
+        return len(lstm_layers)
+
+    n_lstm_layers = save_lstm(model, "lstm", "dense")
+
+    lstm_scaler = joblib.load(lstm_scaler_path)
+    save("lstm_scaler_min", lstm_scaler.min_)
+    save("lstm_scaler_scale", lstm_scaler.scale_)
+
+    # ------------------------------
+    # Isolation Forest
+    # ------------------------------
+    arrays, forest_meta = flatten_forest(joblib.load(if_model_path))
+    for name, arr in arrays.items():
+        save(name, arr)
+
+    if_scaler = joblib.load(if_scaler_path)
+    save("if_scaler_mean", if_scaler.mean_)
+    save("if_scaler_scale", if_scaler.scale_)
+
+    if_info = joblib.load(if_info_path)
+    meta = {
+        "lstm_layers": n_lstm_layers,
+        "seq_len": int(model.input_shape[1]),
+        "lstm_threshold": float(joblib.load(lstm_info_path)["threshold"]),
+        "if_threshold": float(if_info["threshold"]),
+        "forest": forest_meta,
+    }
+    # normal-population baseline for the IF reasons (small: kept in the meta file)
+    if "baseline" in if_info:
+        meta["if_baseline"] = _baseline_to_json(if_info["baseline"])
+
+    # optional multi-horizon forecaster (same window, predicted_* warnings)
+    if os.path.exists(forecast_model_path) and os.path.exists(forecast_info_path):
+        forecaster = tf.keras.models.load_model(forecast_model_path, compile=False)
+        info = joblib.load(forecast_info_path)
+        meta["forecast"] = {
+            "layers": save_lstm(forecaster, "forecast", "forecast_dense"),
+            **_forecast_info_to_json(info),
+        }
+    with open(os.path.join(out_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    return meta
+
+
+def _forecast_info_to_json(info):
+    return {
+        "horizons": [int(h) for h in info["horizons"]],
+        "seq_len": int(info["seq_len"]),
+        "features": list(info["features"]),
+        "watch": list(info["watch"]),
+        "bound_quantile": float(info["bound_quantile"]),
+        # JSON has no inf: unwatched bounds are stored as null
+        "bounds": [[None if np.isinf(b) else float(b) for b in row] for row in info["bounds"]],
+    }
+
+
+def _forecast_info_from_json(meta):
+    info = dict(meta)
+    info["bounds"] = np.array([[np.inf if b is None else b for b in row] for row in meta["bounds"]])
+    return info
+
+
+def _baseline_to_json(baseline):
+    return {k: ({p: np.asarray(v).tolist() for p, v in val.items()} if isinstance(val, dict)
+                else np.asarray(val).tolist())
+            for k, val in baseline.items()}
+
+
+def _baseline_from_json(baseline):
+    return {k: ({p: np.asarray(v) for p, v in val.items()} if isinstance(val, dict)
+                else np.asarray(val))
+            for k, val in baseline.items()}
+
+
+class SharedModels:
+    """
+    Read-only, memory-mapped view of an exported sharedModels/ directory.
+    Every worker that loads the same directory shares the same physical pages.
+    """
+
+    def __init__(self, shared_dir=SHARED_DIR, mmap_mode="r"):
+        self.shared_dir = shared_dir
+
+        with open(os.path.join(shared_dir, META_FILE), "r") as f:
+            self.meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(shared_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        self.lstm_model = NumpyLSTM(
+            [(load(f"lstm_{i}_kernel"), load(f"lstm_{i}_recurrent"), load(f"lstm_{i}_bias"))
+             for i in range(self.meta["lstm_layers"])],
+            load("dense_kernel"),
+            load("dense_bias")
+        )
+        self.lstm_scaler = ArrayMinMaxScaler(load("lstm_scaler_min"), load("lstm_scaler_scale"))
+        self.lstm_threshold = self.meta["lstm_threshold"]
+
+        forest = self.meta["forest"]
+        self.if_model = FlatForest(
+            load("forest_feature"), load("forest_threshold"),
+            load("forest_left"), load("forest_right"),
+            load("forest_leaf_depth"), load("forest_roots"),
+            forest["offset"], forest["path_norm"], forest["max_depth"]
+        )
+        self.if_scaler = ArrayStandardScaler(load("if_scaler_mean"), load("if_scaler_scale"))
+        self.if_threshold = self.meta["if_threshold"]
+        self.if_baseline = (_baseline_from_json(self.meta["if_baseline"])
+                            if "if_baseline" in self.meta else None)
+
+        self.forecast_model = None
+        self.forecast_info = None
+        if "forecast" in self.meta:
+            self.forecast_model = NumpyLSTM(
+                [(load(f"forecast_{i}_kernel"), load(f"forecast_{i}_recurrent"), load(f"forecast_{i}_bias"))
+                 for i in range(self.meta["forecast"]["layers"])],
+                load("forecast_dense_kernel"),
+                load("forecast_dense_bias")
+            )
+            self.forecast_info = _forecast_info_from_json(self.meta["forecast"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export models as memory-mappable .npy arrays")
+    parser.add_argument("--out", default=SHARED_DIR, help="output directory")
+    args = parser.parse_args()
+
+    meta = export_shared(args.out)
+    print(f"Shared artifacts exported to: {args.out}")
+    print(json.dumps(meta, indent=2))
@@ -0,0 +1,334 @@
+# ============================================================
+# staged_pipeline.py
+# Staged asyncio runner for the realtime pipeline.
+#
+#   ingest -> features -> scoring (LSTM || IF) -> decision -> sinks
+#
+# Stages are connected by bounded queues. When a queue is full,
+# its policy decides what happens to the incoming item:
+#   block        wait for space (backpressure on the previous stage)
+#   drop_newest  discard the incoming item
+#   drop_oldest  discard the oldest queued item, enqueue the new one
+#   coalesce     merge the incoming item into the newest queued one
+# Model scoring runs in executor threads (one per model, so the
+# LSTM window is always fed in order). Queue depth, drops and
+# per-stage latency are written to logs/pipeline_stats.json.
+# ============================================================
+
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+POLICIES = ("block", "drop_newest", "drop_oldest", "coalesce")
+
+
+class LatencyStats:
+    """Count + percentiles over the last `window` latency samples (seconds)."""
+
+    def __init__(self, window=1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def snapshot(self):
+        if not self.samples:
+            return {"count": self.count}
+        ms = np.array(self.samples) * 1000.0
+        return {
+            "count": self.count,
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max()),
+        }
+
+
+class BoundedQueue:
+    """
+    Single-event-loop FIFO with a fixed capacity and a full-queue policy.
+    merge(old, new) is required for "coalesce" and returns the item kept.
+    """
+
+    def __init__(self, name, maxsize=64, policy="block", merge=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Queue {name}: unknown policy {policy!r} (expected one of {POLICIES})")
+        if policy == "coalesce" and merge is None:
+            raise ValueError(f"Queue {name}: coalesce policy needs a merge function")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.merge = merge
+
+        self.items = deque()                 # (enqueue time, item)
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.wait = LatencyStats()           # time spent queued
+
+    async def put(self, item):
+        """Returns False if the item was dropped."""
+        while len(self.items) >= self.maxsize:
+            if self.policy == "block":
+                self._not_full.clear()
+                await self._not_full.wait()
+            elif self.policy == "drop_newest":
+                self.dropped += 1
+                return False
+            elif self.policy == "drop_oldest":
+                self.items.popleft()
+                self.dropped += 1
+            else:
+                t_enq, last = self.items[-1]
+                self.items[-1] = (t_enq, self.merge(last, item))
+                self.coalesced += 1
+                return True
+
+        self.items.append((time.perf_counter(), item))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self.items))
+        self._not_empty.set()
+        return True
+
+    async def get(self):
+        while not self.items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        t_enq, item = self.items.popleft()
+        self._not_full.set()
+        self.wait.add(time.perf_counter() - t_enq)
+        return item
+
+    def snapshot(self):
+        return {
+            "depth": len(self.items),
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "policy": self.policy,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "wait": self.wait.snapshot(),
+        }
+
+
+def coalesce_features(old, new):
+    """
+    Keep the newest tick for scoring, but carry the x8 vectors of the ticks
+    it replaces: they are pushed into the LSTM window before scoring, so the
+    window keeps its full history even when only the latest tick is scored.
+    """
+    new["skipped_x8"] = old.get("skipped_x8", []) + [old["x8"]] + new.get("skipped_x8", [])
+    return new
+
+
+class StagedPipeline:
+    """Drives a RealtimePipeline's per-tick methods as asyncio stages."""
+
+    def __init__(self, pipeline, queue_size=64, policies=None, poll_interval=1.0,
+                 stats_path=None, stats_interval=10.0):
+        self.p = pipeline
+        self.poll_interval = poll_interval
+        self.stats_path = stats_path
+        self.stats_interval = stats_interval
+
+        policies = {"features": "block", "score": "coalesce",
+                    "decision": "block", "sink": "block", **(policies or {})}
+        self.queues = {
+            "features": BoundedQueue("features", queue_size, policies["features"],
+                                     merge=lambda old, new: new),
+            "score": BoundedQueue("score", queue_size, policies["score"], merge=coalesce_features),
+            "decision": BoundedQueue("decision", queue_size, policies["decision"],
+                                     merge=lambda old, new: new),
+            "sink": BoundedQueue("sink", queue_size, policies["sink"],
+                                 merge=lambda old, new: new),
+        }
+        self.stages = {name: LatencyStats() for name in
+                       ("ingest", "features", "score", "decision", "sink")}
+        self.errors = {name: 0 for name in self.stages}
+        self.end_to_end = LatencyStats()
+
+        # One thread per model keeps each model's calls strictly ordered
+        self.lstm_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lstm")
+        self.if_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="if")
+        self.io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="io")
+
+    # -------------------------------------------------------------------
+    # Stages
+    # -------------------------------------------------------------------
+    async def _ingest(self):
+        loop = asyncio.get_running_loop()
+        out = self.queues["features"]
+        while True:
+            t0 = time.perf_counter()
+            try:
+                rows = self.p.read_rows()
+            except Exception as e:
+                self.errors["ingest"] += 1
+                print(f"[-] Stage ingest error: {e}")
+                rows = []
+            if not len(rows):
+                # blocking wait (inotify / ring spin) off the event loop
+                await loop.run_in_executor(self.io_pool, self.p.wait_source, self.poll_interval)
+                continue
+            self.stages["ingest"].add(time.perf_counter() - t0)
+            for row in rows:
+                await out.put({"row": row, "t_ingest": time.perf_counter()})
+
+    async def _features(self, item):
+        item["x8"], item["x12"] = self.p.build_vectors(item["row"])
+        return item
+
+    def _score_lstm(self, skipped, x8):
+        for x in skipped:
+            self.p.infer.push_lstm(x)
+        return self.p.score_lstm(x8)
+
+    def _score_cascade(self, skipped, x8, x12):
+        for x in skipped:
+            self.p.infer.push_lstm(x)
+        return self.p.score(x8, x12)
+
+    async def _score(self, item):
+        loop = asyncio.get_running_loop()
+        # No scoring call is in flight here, so models can be swapped safely
+        self.p.hot_swap()
+
+        skipped = item.pop("skipped_x8", [])
+        item["coalesced"] = len(skipped)
+        item["t_infer_start"] = time.time()
+        if self.p.cascade is not None:
+            # the cascade gate needs the IF result first: one ordered call
+            lstm_output, if_output = await loop.run_in_executor(
+                self.lstm_pool, self._score_cascade, skipped, item["x8"], item["x12"])
+        else:
+            lstm_output, if_output = await asyncio.gather(
+                loop.run_in_executor(self.lstm_pool, self._score_lstm, skipped, item["x8"]),
+                loop.run_in_executor(self.if_pool, self.p.score_if, item["x12"])
+            )
+        item["t_infer_end"] = time.time()
+        self.p.update_thresholds(lstm_output, if_output)
+        item["lstm_output"], item["if_output"] = lstm_output, if_output
+        return item
+
+    async def _decision(self, item):
+        item["decision"] = self.p.decide(item["lstm_output"], item["if_output"], item["x12"])
+        self.p.trace(item["row"], item["decision"], item["t_infer_start"], item["t_infer_end"])
+        return item
+
+    def _emit(self, item):
+        decision = item["decision"]
+        decision["stream_id"] = self.p.stream_id(item["row"])
+        self.p.log_decision(decision, self.p.incident_score(item["lstm_output"], item["if_output"]),
+                            decision["stream_id"])
+        self.p.print_live(item["row"], item["lstm_output"], item["if_output"], item["decision"])
+
+    async def _sink(self, item):
+        await asyncio.get_running_loop().run_in_executor(self.io_pool, self._emit, item)
+        self.end_to_end.add(time.perf_counter() - item["t_ingest"])
+
+    async def _run_stage(self, name, inq, handler, outq=None):
+        while True:
+            item = await inq.get()
+            t0 = time.perf_counter()
+            try:
+                result = await handler(item)
+            except Exception as e:
+                self.errors[name] += 1
+                print(f"[-] Stage {name} error: {e}")
+                continue
+            self.stages[name].add(time.perf_counter() - t0)
+            if outq is not None:
+                await outq.put(result)
+
+    # -------------------------------------------------------------------
+    # Stats
+    # -------------------------------------------------------------------
+    def snapshot(self):
+        return {
+            "updated": time.time(),
+            "queues": {name: q.snapshot() for name, q in self.queues.items()},
+            "stages": {name: {**s.snapshot(), "errors": self.errors[name]}
+                       for name, s in self.stages.items()},
+            "end_to_end": self.end_to_end.snapshot(),
+        }
+
+    def save_stats(self):
+        if not self.stats_path:
+            return
+        os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+        tmp = f"{self.stats_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, self.stats_path)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.save_stats()
+            depths = " ".join(f"{n}={len(q.items)}" for n, q in self.queues.items())
+            lost = sum(q.dropped for q in self.queues.values())
+            merged = sum(q.coalesced for q in self.queues.values())
+            print(f"[*] Queues: {depths} | dropped={lost} coalesced={merged}")
+
+    # -------------------------------------------------------------------
+    # Entry point
+    # -------------------------------------------------------------------
+    async def run(self):
+        q = self.queues
+        tasks = [
+            asyncio.create_task(self._ingest()),
+            asyncio.create_task(self._run_stage("features", q["features"], self._features, q["score"])),
+            asyncio.create_task(self._run_stage("score", q["score"], self._score, q["decision"])),
+            asyncio.create_task(self._run_stage("decision", q["decision"], self._decision, q["sink"])),
+            asyncio.create_task(self._run_stage("sink", q["sink"], self._sink)),
+            asyncio.create_task(self._report()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    def close(self):
+        for pool in (self.lstm_pool, self.if_pool, self.io_pool):
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.save_stats()
+
+
+def run_staged(pipeline, cfg, poll_interval, stats_path=None):
+    """Runs the staged pipeline until Ctrl-C. cfg: the `pipeline` settings section."""
+    staged = StagedPipeline(
+        pipeline,
+        queue_size=cfg.get('queue_size', 64),
+        policies={
+            "features": cfg.get('features_queue_policy', 'block'),
+            "score": cfg.get('score_queue_policy', 'coalesce'),
+            "decision": cfg.get('decision_queue_policy', 'block'),
+            "sink": cfg.get('sink_queue_policy', 'block'),
+        },
+        poll_interval=poll_interval,
+        stats_path=stats_path,
+        stats_interval=cfg.get('stats_interval', 10.0)
+    )
+    print("[*] Staged pipeline: " + ", ".join(
+        f"{n}[{q.maxsize}, {q.policy}]" for n, q in staged.queues.items()))
+
+    try:
+        asyncio.run(staged.run())
+    except KeyboardInterrupt:
+        print("\nStopping real-time pipeline...")
+    finally:
+        staged.close()
+        pipeline.close()
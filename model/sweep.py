@@ -0,0 +1,382 @@
+# ============================================================
+# sweep.py
+# Parallel hyperparameter + threshold sweep.
+#
+# 1. prepare: the training and evaluation captures are scaled
+#    once and cached as .npy files (keyed by their content
+#    hash); every job memory-maps them, LSTM windows are strided
+#    views, so N workers share one copy of the data.
+# 2. jobs: each grid point (LSTM: seq_len, layer sizes, epochs;
+#    IF: n_estimators, max_samples) is trained in a process pool
+#    and scored on the evaluation capture under every threshold
+#    rule (mean+Kstd or pQ of its normal-data scores).
+# 3. metrics against labelled incidents: incident recall,
+#    detection delay, false-positive rate and the live per-tick
+#    inference cost (NumPy LSTM / flat forest, one row per call).
+# 4. output: sweep_results.csv and pareto.csv (configurations
+#    no other one of the same model beats on recall, FPR, delay
+#    and cost at once).
+#
+# Incidents come from a label column of the evaluation capture,
+# a CSV of start,end timestamps, or a replay timeline.json.
+#
+#   python sweep.py --incidents replay_out/timeline.json
+#   python sweep.py --eval labelled.csv --label-column label \
+#       --lstm seq_len=10,20,30 units=64x32,32x16 epochs=5 \
+#       --if n_estimators=100,300 --workers 4
+# ============================================================
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from data_loader import load_array, CHUNK_SIZE
+from anomaly_inference import LSTM_FEATURES, IF_FEATURES
+from train_orchestrator import dataset_digest, DATA_PATH
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(SCRIPT_DIR, ".sweep_cache")
+OUT_DIR = os.path.join(SCRIPT_DIR, "sweep_out")
+SEED = 42
+
+LINK_LOSS = IF_FEATURES.index("if_link_loss")
+
+LSTM_GRID = {"seq_len": [10, 20, 30], "units": [(64, 32), (32, 16)], "epochs": [5]}
+IF_GRID = {"n_estimators": [100, 300], "max_samples": ["auto"]}
+LSTM_THRESHOLDS = ["mean+3std", "p99", "p99.9"]
+IF_THRESHOLDS = ["p99", "p99.5", "p99.9"]
+
+TRAIN_SPLIT = 0.8       # LSTM: first 80% of windows train, the rest set the threshold
+BATCH_SIZE = 64
+COST_ROWS = 200         # single-row calls timed for the per-tick cost
+
+
+# -------------------------------------------------------------------
+# Prepared data (memory-mapped by every job)
+# -------------------------------------------------------------------
+def prepare(train_path, eval_path, labels, cache_dir=CACHE_DIR):
+    """
+    Scales both captures once and caches them. labels: bool per evaluation
+    row. Returns the cache entry directory.
+    """
+    from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+    h = hashlib.sha256()
+    for path in (train_path, eval_path):
+        h.update(dataset_digest(path, cache_dir).encode())
+    h.update(np.packbits(labels).tobytes())
+    entry = os.path.join(cache_dir, h.hexdigest()[:16])
+    if os.path.exists(os.path.join(entry, "meta.json")):
+        return entry
+
+    kwargs = {"chunksize": CHUNK_SIZE}
+    tmp = entry + ".tmp"
+    os.makedirs(tmp, exist_ok=True)
+    arrays = {}
+    for name, columns, scaler in (("lstm", LSTM_FEATURES, MinMaxScaler()),
+                                  ("if", IF_FEATURES, StandardScaler())):
+        train = load_array(train_path, columns, **kwargs)
+        scaler.fit(train)
+        arrays[f"{name}_train"] = scaler.transform(train).astype(np.float32)
+        raw_eval = train if eval_path == train_path else load_array(eval_path, columns, **kwargs)
+        arrays[f"{name}_eval"] = scaler.transform(raw_eval).astype(np.float32)
+        if name == "if":
+            # live IF override: any link loss is an anomaly
+            arrays["if_override"] = raw_eval[:, LINK_LOSS] > 0
+    arrays["eval_ts"] = load_array(eval_path, ["timestamp"], dtype=np.float64, **kwargs)[:, 0]
+    arrays["labels"] = np.asarray(labels, dtype=bool)
+    if len(arrays["labels"]) != len(arrays["eval_ts"]):
+        raise ValueError(f"{len(arrays['labels'])} labels for {len(arrays['eval_ts'])} evaluation rows")
+
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arr))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"train": os.path.abspath(train_path), "eval": os.path.abspath(eval_path),
+                   "rows": {k: len(v) for k, v in arrays.items()}}, f, indent=2)
+    os.replace(tmp, entry)
+    return entry
+
+
+def load(entry, name):
+    return np.load(os.path.join(entry, f"{name}.npy"), mmap_mode="r")
+
+
+# -------------------------------------------------------------------
+# Labels / incidents
+# -------------------------------------------------------------------
+def labels_from_intervals(ts, intervals):
+    """Row is in an incident when start <= ts <= end for some interval."""
+    ts = np.asarray(ts, dtype=np.float64)
+    labels = np.zeros(len(ts), dtype=bool)
+    for start, end in intervals:
+        labels[(ts >= start) & (ts <= end)] = True
+    return labels
+
+
+def load_labels(eval_path, incidents=None, label_column=None):
+    ts = pd.read_csv(eval_path, usecols=["timestamp"])["timestamp"].to_numpy()
+    if label_column:
+        return pd.read_csv(eval_path, usecols=[label_column])[label_column].to_numpy() != 0
+    if incidents is None:
+        raise ValueError("no ground truth: pass --incidents or --label-column")
+    if incidents.endswith(".json"):
+        with open(incidents) as f:
+            intervals = [(i["start"], i["end"]) for i in json.load(f)]
+    else:
+        frame = pd.read_csv(incidents)
+        intervals = list(zip(frame["start"], frame["end"]))
+    return labels_from_intervals(ts, intervals)
+
+
+def incident_runs(labels):
+    """(start_row, end_row) of every run of labelled rows."""
+    padded = np.concatenate(([False], np.asarray(labels, dtype=bool), [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    return edges[0::2], edges[1::2] - 1
+
+
+def evaluate(flags, labels, ts):
+    """Incident recall, detection delay (first flag inside the incident) and row FPR."""
+    flags = np.asarray(flags, dtype=bool)
+    labels = np.asarray(labels, dtype=bool)
+    starts, ends = incident_runs(labels)
+    delays_rows, delays_s = [], []
+    for s, e in zip(starts, ends):
+        hit = np.flatnonzero(flags[s:e + 1])
+        if len(hit):
+            delays_rows.append(hit[0])
+            delays_s.append(ts[s + hit[0]] - ts[s])
+    normal = ~labels
+    return {
+        "incidents": len(starts),
+        "detected": len(delays_rows),
+        "recall": len(delays_rows) / len(starts) if len(starts) else float("nan"),
+        "delay_rows": float(np.mean(delays_rows)) if delays_rows else float("nan"),
+        "delay_s": float(np.mean(delays_s)) if delays_s else float("nan"),
+        "fpr": float(flags[normal].mean()) if normal.any() else float("nan"),
+        "flags": int(flags.sum()),
+    }
+
+
+def threshold_value(rule, scores):
+    """'mean+3std' -> mean + 3 * std, 'p99.5' -> 99.5th percentile of scores."""
+    scores = np.asarray(scores, dtype=np.float64)
+    if rule.startswith("p"):
+        return float(np.percentile(scores, float(rule[1:])))
+    if rule.startswith("mean+") and rule.endswith("std"):
+        return float(scores.mean() + float(rule[5:-3] or 1) * scores.std())
+    raise ValueError(f"unknown threshold rule {rule!r} (mean+Kstd or pQ)")
+
+
+def _single_row_cost(fn, rows):
+    t = time.perf_counter()
+    for i in range(len(rows)):
+        fn(rows[i:i + 1])
+    return (time.perf_counter() - t) / max(len(rows), 1) * 1e6
+
+
+# -------------------------------------------------------------------
+# Jobs (run in worker processes)
+# -------------------------------------------------------------------
+def run_lstm(entry, params, thresholds, threads=1):
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    except RuntimeError:
+        pass        # already initialized in this worker
+    tf.random.set_seed(SEED)
+    from lstm_final import build_lstm_model, make_dataset, create_sequences
+    from shared_artifacts import NumpyLSTM
+
+    seq_len, units, epochs = params["seq_len"], tuple(params["units"]), params["epochs"]
+    train, data_eval = load(entry, "lstm_train"), load(entry, "lstm_eval")
+    n_windows = len(train) - seq_len
+    split = int(TRAIN_SPLIT * n_windows)
+
+    t0 = time.perf_counter()
+    model = build_lstm_model(seq_len, train.shape[1], units=units)
+    model.fit(make_dataset(np.asarray(train), seq_len, BATCH_SIZE, 0, split),
+              epochs=epochs, shuffle=False, verbose=0)
+    train_s = time.perf_counter() - t0
+
+    _, y = create_sequences(train, seq_len)
+    val_pred = model.predict(make_dataset(np.asarray(train), seq_len, 1024, split), verbose=0)
+    val_err = np.linalg.norm(y[split:] - val_pred, axis=1)
+
+    X_eval, y_eval = create_sequences(data_eval, seq_len)
+    pred = model.predict(make_dataset(np.asarray(data_eval), seq_len, 1024), verbose=0)
+    errors = np.full(len(data_eval), -np.inf)
+    errors[seq_len:] = np.linalg.norm(y_eval - pred, axis=1)
+
+    # live per-tick cost: the NumPy forward pass of shared_artifacts
+    layers = [l for l in model.layers if isinstance(l, tf.keras.layers.LSTM)]
+    live = NumpyLSTM([tuple(w.astype(np.float32) for w in l.get_weights()) for l in layers],
+                     *[w.astype(np.float32) for w in model.layers[-1].get_weights()])
+    cost_us = _single_row_cost(live.predict, np.asarray(X_eval[:COST_ROWS]))
+
+    labels, ts = load(entry, "labels"), load(entry, "eval_ts")
+    results = []
+    for rule in thresholds:
+        thr = threshold_value(rule, val_err)
+        results.append({"model": "lstm", "params": _describe(params), "threshold_rule": rule,
+                        "threshold": thr, "train_s": train_s, "cost_us": cost_us,
+                        **evaluate(errors > thr, labels, ts)})
+    return results
+
+
+def run_if(entry, params, thresholds, threads=1):
+    from sklearn.ensemble import IsolationForest
+    from shared_artifacts import FlatForest
+
+    train, data_eval = load(entry, "if_train"), load(entry, "if_eval")
+    t0 = time.perf_counter()
+    forest = IsolationForest(n_estimators=params["n_estimators"], max_samples=params["max_samples"],
+                             contamination="auto", max_features=1.0, n_jobs=threads,
+                             random_state=SEED).fit(np.asarray(train))
+    train_s = time.perf_counter() - t0
+
+    train_scores = -forest.decision_function(np.asarray(train))
+    flat = FlatForest.from_sklearn(forest)
+    scores = -flat.decision_function(np.asarray(data_eval, dtype=np.float64))
+    cost_us = _single_row_cost(flat.decision_function, np.asarray(data_eval[:COST_ROWS], dtype=np.float64))
+
+    override = np.asarray(load(entry, "if_override"))
+    labels, ts = load(entry, "labels"), load(entry, "eval_ts")
+    results = []
+    for rule in thresholds:
+        thr = threshold_value(rule, train_scores)
+        results.append({"model": "if", "params": _describe(params), "threshold_rule": rule,
+                        "threshold": thr, "train_s": train_s, "cost_us": cost_us,
+                        **evaluate((scores > thr) | override, labels, ts)})
+    return results
+
+
+JOB_FUNCS = {"lstm": run_lstm, "if": run_if}
+
+
+def _describe(params):
+    return " ".join(f"{k}={'x'.join(map(str, v)) if isinstance(v, (tuple, list)) else v}"
+                    for k, v in sorted(params.items()))
+
+
+# -------------------------------------------------------------------
+# Grid / Pareto
+# -------------------------------------------------------------------
+def _value(text):
+    if "x" in text and all(p.isdigit() for p in text.split("x")):
+        return tuple(int(p) for p in text.split("x"))
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_grid(specs, default):
+    """['seq_len=10,20', 'units=64x32'] over the default grid."""
+    grid = {k: list(v) for k, v in default.items()}
+    for spec in specs or []:
+        key, _, values = spec.partition("=")
+        if key not in grid or not values:
+            raise ValueError(f"bad grid entry {spec!r} (expected one of {list(grid)} as key=v1,v2)")
+        grid[key] = [_value(v) for v in values.split(",")]
+    return grid
+
+
+def expand(grid):
+    keys = list(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+
+def pareto(frame, maximize=("recall",), minimize=("fpr", "delay_s", "cost_us")):
+    """Rows not dominated by any other row (NaN delay counts as worst)."""
+    cols = [np.nan_to_num(frame[c].to_numpy(dtype=np.float64), nan=-np.inf) for c in maximize]
+    cols += [-np.nan_to_num(frame[c].to_numpy(dtype=np.float64), nan=np.inf) for c in minimize]
+    M = np.column_stack(cols)                       # larger is better everywhere
+    ge = (M[:, None, :] >= M[None, :, :]).all(axis=2)
+    gt = (M[:, None, :] > M[None, :, :]).any(axis=2)
+    dominated = (ge & gt).any(axis=0)               # some row i dominates j
+    return ~dominated
+
+
+def run_sweep(entry, jobs, workers, threads):
+    """jobs: [(kind, params, thresholds)]. Returns the result frame."""
+    rows = []
+    ctx = mp.get_context("spawn")       # TensorFlow is not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {pool.submit(JOB_FUNCS[kind], entry, params, thresholds, threads): (kind, params)
+                   for kind, params, thresholds in jobs}
+        for future in as_completed(futures):
+            kind, params = futures[future]
+            try:
+                results = future.result()
+            except Exception as exc:
+                print(f"[!] {kind} {_describe(params)}: failed ({exc})")
+                continue
+            best = max(results, key=lambda r: (r["recall"], -r["fpr"]))
+            print(f"[*] {kind} {_describe(params)}: recall {best['recall']:.2f}, "
+                  f"fpr {best['fpr']:.4f}, {best['cost_us']:.0f} us/tick ({best['threshold_rule']})")
+            rows.extend(results)
+    frame = pd.DataFrame(rows)
+    if len(frame):
+        # one front per model family (LSTM and IF run side by side live)
+        frame["pareto"] = False
+        for _, group in frame.groupby("model"):
+            frame.loc[group.index, "pareto"] = pareto(group)
+    return frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel LSTM / IF hyperparameter + threshold sweep")
+    parser.add_argument("--data", default=DATA_PATH, help="training capture")
+    parser.add_argument("--eval", default=None, help="evaluation capture (default: --data)")
+    parser.add_argument("--incidents", default=None, help="replay timeline.json or CSV with start,end")
+    parser.add_argument("--label-column", default=None, help="nonzero = incident row in the eval capture")
+    parser.add_argument("--models", nargs="+", choices=list(JOB_FUNCS), default=list(JOB_FUNCS))
+    parser.add_argument("--lstm", nargs="*", default=[], metavar="KEY=V1,V2",
+                        help=f"LSTM grid overrides (default {LSTM_GRID})")
+    parser.add_argument("--if", dest="iforest", nargs="*", default=[], metavar="KEY=V1,V2",
+                        help=f"IF grid overrides (default {IF_GRID})")
+    parser.add_argument("--lstm-thresholds", nargs="+", default=LSTM_THRESHOLDS)
+    parser.add_argument("--if-thresholds", nargs="+", default=IF_THRESHOLDS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=1, help="math threads per worker")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--out", default=OUT_DIR)
+    args = parser.parse_args()
+
+    eval_path = args.eval or args.data
+    t0 = time.time()
+    labels = load_labels(eval_path, args.incidents, args.label_column)
+    entry = prepare(args.data, eval_path, labels, args.cache_dir)
+    print(f"[*] Prepared data: {entry} ({time.time() - t0:.1f}s, "
+          f"{len(incident_runs(labels)[0])} incidents, {int(labels.sum())} labelled rows)")
+
+    jobs = []
+    if "lstm" in args.models:
+        jobs += [("lstm", p, args.lstm_thresholds) for p in expand(parse_grid(args.lstm, LSTM_GRID))]
+    if "if" in args.models:
+        jobs += [("if", p, args.if_thresholds) for p in expand(parse_grid(args.iforest, IF_GRID))]
+    print(f"[*] {len(jobs)} configurations on {args.workers} workers")
+
+    frame = run_sweep(entry, jobs, args.workers, args.threads)
+    os.makedirs(args.out, exist_ok=True)
+    frame.to_csv(os.path.join(args.out, "sweep_results.csv"), index=False)
+    if len(frame):
+        front = frame[frame["pareto"]].sort_values(["model", "cost_us", "recall"],
+                                                   ascending=[True, True, False])
+        front.to_csv(os.path.join(args.out, "pareto.csv"), index=False)
+        print("\n========== PARETO FRONT (recall / FPR / delay vs cost) ==========")
+        print(front[["model", "params", "threshold_rule", "recall", "delay_s", "fpr",
+                     "cost_us", "train_s"]].to_string(index=False))
+    print(f"\n[*] Wrote {args.out}/sweep_results.csv, pareto.csv ({time.time() - t0:.1f}s)")
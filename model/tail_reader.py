@@ -0,0 +1,251 @@
+# ============================================================
+# tail_reader.py
+# Incremental tail-follow reader for the telemetry CSV.
+#
+# Keeps a byte offset into the file and parses only newly
+# appended bytes, so the cost per row is constant regardless of
+# how large the log has grown. Every complete row is delivered
+# exactly once, in order. Wakes on inotify (Linux) instead of
+# sleep-polling, and survives rotation (new inode) and truncation.
+# ============================================================
+
+import os
+import ctypes
+import ctypes.util
+import select
+import struct
+import time
+
+import numpy as np
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+SIGNATURE_BYTES = 64
+
+
+class _Inotify:
+    """Minimal ctypes wrapper: watches one directory, filters by file name."""
+
+    def __init__(self, directory, filename):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+        self.filename = os.fsencode(filename)
+
+    def wait(self, timeout):
+        """True if an event for our file arrived within timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+
+        relevant = False
+        try:
+            while True:
+                data = os.read(self.fd, 4096)
+                pos = 0
+                while pos < len(data):
+                    _, _, _, name_len = _EVENT_HEADER.unpack_from(data, pos)
+                    name = data[pos + _EVENT_HEADER.size: pos + _EVENT_HEADER.size + name_len].rstrip(b"\0")
+                    relevant = relevant or name == self.filename
+                    pos += _EVENT_HEADER.size + name_len
+        except BlockingIOError:
+            pass
+        return relevant
+
+    def close(self):
+        os.close(self.fd)
+
+
+class CsvTailReader:
+    """
+    Follows an append-only CSV with a header row.
+
+    read_new() returns every complete row appended since the last call as a
+    dict {column: float}; read_blocks() returns the same rows as float64
+    arrays, one (columns, array) block per file. wait() blocks until the
+    file changes (or timeout).
+    """
+
+    def __init__(self, path, from_start=False, use_inotify=True):
+        self.path = path
+        self.from_start = from_start
+        self.columns = None
+        self.f = None
+        self.inode = None
+        self.offset = 0
+        self.partial = b""
+        self.signature = b""   # last bytes consumed, to detect rewrites in place
+        self.rotations = 0
+
+        self.notifier = None
+        if use_inotify:
+            try:
+                self.notifier = _Inotify(os.path.dirname(os.path.abspath(path)) or ".",
+                                         os.path.basename(path))
+            except (OSError, AttributeError):
+                self.notifier = None   # not Linux / no inotify: fall back to polling
+
+        self._open(initial=True)
+
+    # -------------------------------------------------------------------
+    # File handling
+    # -------------------------------------------------------------------
+    def _open(self, initial=False):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+
+        self.f = f
+        self.inode = os.fstat(f.fileno()).st_ino
+        self.partial = b""
+        self.signature = b""
+        self.columns = None
+        self.offset = 0
+
+        # First open: skip existing rows unless from_start. After a rotation
+        # the new file is read from the beginning so no row is lost.
+        if initial and not self.from_start:
+            header = f.readline()
+            if header.endswith(b"\n"):
+                self.columns = header.decode().strip().split(",")
+                self.offset = f.seek(0, os.SEEK_END)
+                self.signature = os.pread(f.fileno(), min(self.offset, SIGNATURE_BYTES),
+                                          self.offset - min(self.offset, SIGNATURE_BYTES))
+                # do not resume mid-row
+                if self.offset and not self._ends_with_newline():
+                    self.partial = None
+            else:
+                self.offset = 0
+                f.seek(0)
+        return True
+
+    def _ends_with_newline(self):
+        self.f.seek(self.offset - 1)
+        last = self.f.read(1)
+        self.f.seek(self.offset)
+        return last == b"\n"
+
+    def _check_rotation(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if st.st_ino != self.inode:
+            return "rotated"
+        if st.st_size < self.offset:
+            return "truncated"
+        # truncated and re-grown past our offset between two reads
+        sig = self.signature
+        if sig and os.pread(self.f.fileno(), len(sig), self.offset - len(sig)) != sig:
+            return "truncated"
+        return False
+
+    # -------------------------------------------------------------------
+    # Reading
+    # -------------------------------------------------------------------
+    def read_new(self):
+        return [dict(zip(columns, row))
+                for columns, block in self.read_blocks() for row in block.tolist()]
+
+    def read_blocks(self):
+        if self.f is None and not self._open():
+            return []
+
+        state = self._check_rotation()
+        blocks = [self._drain()] if state != "truncated" else []
+
+        if state:
+            # Whatever was appended to the old file before the switch was
+            # drained above; now continue from the start of the new one.
+            self.f.close()
+            self.f = None
+            self.rotations += 1
+            if self._open():
+                blocks.append(self._drain())
+        return [b for b in blocks if b is not None]
+
+    def _drain(self):
+        """(columns, (n, len(columns)) float64 array) of the complete new rows, or None."""
+        self.f.seek(self.offset)
+        data = self.f.read()
+        if not data:
+            return None
+        self.offset += len(data)
+        self.signature = (self.signature + data)[-SIGNATURE_BYTES:]
+
+        if self.partial is None:
+            # started mid-row: drop the fragment up to the next newline
+            cut = data.find(b"\n")
+            if cut < 0:
+                return None
+            data = data[cut + 1:]
+            self.partial = b""
+
+        data = self.partial + data
+        lines = data.split(b"\n")
+        self.partial = lines.pop()          # incomplete trailing line (or b"")
+
+        fields = []
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if not line:
+                continue
+            if self.columns is None:
+                self.columns = line.decode().split(",")
+                continue
+            values = line.split(b",")
+            if len(values) != len(self.columns):
+                continue
+            fields.extend(values)
+        if not fields:
+            return None
+        try:
+            block = np.fromiter(map(float, fields), np.float64, len(fields))
+        except ValueError:
+            # empty / non-numeric cells -> NaN
+            block = np.fromiter(map(_to_float, fields), np.float64, len(fields))
+        return self.columns, block.reshape(-1, len(self.columns))
+
+    def wait(self, timeout):
+        if self.notifier is not None:
+            self.notifier.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+    def rows(self, timeout=1.0):
+        """Endless generator over new rows."""
+        while True:
+            batch = self.read_new()
+            if batch:
+                yield from batch
+            else:
+                self.wait(timeout)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+        if self.notifier is not None:
+            self.notifier.close()
+
+
+def _to_float(v):
+    try:
+        return float(v)
+    except ValueError:
+        return float("nan")
@@ -0,0 +1,301 @@
+# ============================================================
+# train_orchestrator.py
+# Content-addressed training cache + parallel training jobs.
+#
+# Every job (LSTM, IF) is keyed by a hash of
+#   - the training capture (content, not mtime),
+#   - the training script and the modules it imports (feature
+#     lists and hyperparameters live there),
+#   - the command-line parameters passed to the job.
+# A key already in the cache is restored into the artifact
+# directory without training. Missing keys are trained in
+# parallel child processes (so a cold start costs max(LSTM, IF)
+# instead of their sum), then stored in the cache.
+# Per-job wall time goes to training_report.json.
+#
+#   python train_orchestrator.py                 # train what is stale
+#   python train_orchestrator.py --early-stopping 10
+#   python train_orchestrator.py --force --jobs lstm
+# ============================================================
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(SCRIPT_DIR, "training_data.csv")
+CACHE_DIR = os.path.join(SCRIPT_DIR, ".train_cache")
+REPORT_PATH = os.path.join(SCRIPT_DIR, "training_report.json")
+MANIFEST = "train_manifest.json"
+
+JOBS = {
+    "lstm": {
+        "script": "lstm_final.py",
+        "sources": ["lstm_final.py", "data_loader.py", "compaction.py", "explain.py",
+                    "../monitoring_and_telemetry/feature_schema.py"],
+        "artifacts": "lstmModels",
+        "outputs": ["lstm_final_model.h5", "lstm_best_model.h5",
+                    "lstm_scaler.pkl", "lstm_threshold_info.pkl"],
+        # forecaster (lstm_final.HORIZONS = None trains none)
+        "optional": ["lstm_forecast_model.h5", "lstm_forecast_info.pkl"],
+        # keys the current script writes into its pickles (see adopt())
+        "signature": {"lstm_threshold_info.pkl": ["compaction"]},
+    },
+    "if": {
+        "script": "isolationForest.py",
+        "sources": ["isolationForest.py", "data_loader.py", "compaction.py", "explain.py",
+                    "../monitoring_and_telemetry/feature_schema.py"],
+        "artifacts": "ifmodels",
+        "outputs": ["isolation_forest_model.pkl", "if_scaler.pkl", "if_threshold_info.pkl"],
+        "signature": {"if_threshold_info.pkl": ["baseline"]},
+    },
+}
+
+
+# -------------------------------------------------------------------
+# Hashing
+# -------------------------------------------------------------------
+def file_digest(path, block=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dataset_digest(path, cache_dir=CACHE_DIR):
+    """
+    Content hash of the capture. Re-hashing a large capture is skipped while
+    its size and mtime are unchanged (the digest is remembered in the cache).
+    """
+    st = os.stat(path)
+    stamp = {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    memo_path = os.path.join(cache_dir, "dataset_digest.json")
+    try:
+        with open(memo_path) as f:
+            memo = json.load(f)
+        if memo["stamp"] == stamp:
+            return memo["digest"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = file_digest(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(memo_path, "w") as f:
+        json.dump({"stamp": stamp, "digest": digest}, f)
+    return digest
+
+
+def job_key(name, data_digest, args):
+    job = JOBS[name]
+    h = hashlib.sha256()
+    h.update(f"job={name}\ndata={data_digest}\n".encode())
+    for src in job["sources"]:
+        h.update(f"{src}={file_digest(os.path.join(SCRIPT_DIR, src))}\n".encode())
+    h.update(json.dumps(args, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+# -------------------------------------------------------------------
+# Cache
+# -------------------------------------------------------------------
+def current_key(name):
+    """Key of the artifacts currently in the job's directory (None if unknown / incomplete)."""
+    job = JOBS[name]
+    artifacts = os.path.join(SCRIPT_DIR, job["artifacts"])
+    if not all(os.path.exists(os.path.join(artifacts, out)) for out in job["outputs"]):
+        return None
+    try:
+        with open(os.path.join(artifacts, MANIFEST)) as f:
+            return json.load(f)["key"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def adopt(name, key, extra):
+    """
+    Artifacts without a manifest (trained by running the script directly)
+    are taken as the current key instead of being retrained, but only when
+    they carry everything the current script writes: the optional outputs
+    (forecaster) and the signature keys of its pickles (compaction stats,
+    IF baselines). Older artifacts, such as the models shipped with the
+    repository, count as a miss and are retrained.
+    """
+    import joblib
+
+    job = JOBS[name]
+    artifacts = os.path.join(SCRIPT_DIR, job["artifacts"])
+    if os.path.exists(os.path.join(artifacts, MANIFEST)):
+        return False
+    if not all(os.path.exists(os.path.join(artifacts, out))
+               for out in job["outputs"] + job.get("optional", [])):
+        return False
+    for out, keys in job.get("signature", {}).items():
+        try:
+            info = joblib.load(os.path.join(artifacts, out))
+        except Exception:
+            return False
+        if not isinstance(info, dict) or any(k not in info for k in keys):
+            return False
+    write_manifest(name, key, extra)
+    return True
+
+
+def write_manifest(name, key, extra):
+    path = os.path.join(SCRIPT_DIR, JOBS[name]["artifacts"], MANIFEST)
+    with open(path, "w") as f:
+        json.dump({"job": name, "key": key, **extra}, f, indent=2)
+
+
+def restore(name, key, cache_dir):
+    """Copies a cached entry into the artifact directory; False on a cache miss."""
+    job = JOBS[name]
+    entry = os.path.join(cache_dir, name, key)
+    if not all(os.path.exists(os.path.join(entry, out)) for out in job["outputs"]):
+        return False
+    artifacts = os.path.join(SCRIPT_DIR, job["artifacts"])
+    os.makedirs(artifacts, exist_ok=True)
+    for out in job["outputs"] + job.get("optional", []):
+        if os.path.exists(os.path.join(entry, out)):
+            shutil.copy2(os.path.join(entry, out), os.path.join(artifacts, out))
+    shutil.copy2(os.path.join(entry, MANIFEST), os.path.join(artifacts, MANIFEST))
+    return True
+
+
+def store(name, key, cache_dir, keep):
+    job = JOBS[name]
+    entry = os.path.join(cache_dir, name, key)
+    tmp = entry + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    artifacts = os.path.join(SCRIPT_DIR, job["artifacts"])
+    for out in job["outputs"] + job.get("optional", []) + [MANIFEST]:
+        if os.path.exists(os.path.join(artifacts, out)):
+            shutil.copy2(os.path.join(artifacts, out), os.path.join(tmp, out))
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+
+    # keep the newest `keep` entries per job
+    job_dir = os.path.join(cache_dir, name)
+    entries = sorted((e for e in os.listdir(job_dir) if not e.endswith(".tmp")),
+                     key=lambda e: os.path.getmtime(os.path.join(job_dir, e)))
+    for old in entries[:-keep] if keep else []:
+        shutil.rmtree(os.path.join(job_dir, old), ignore_errors=True)
+
+
+# -------------------------------------------------------------------
+# Jobs
+# -------------------------------------------------------------------
+def job_args(name, opts):
+    if name == "lstm":
+        args = {}
+        if opts.epochs is not None:
+            args["epochs"] = opts.epochs
+        if opts.early_stopping:
+            args["early_stopping"] = opts.early_stopping
+        return args
+    return {}
+
+
+def command(name, args, data):
+    # the capture path is not part of the key (its content digest is)
+    cmd = [sys.executable, JOBS[name]["script"], "--data", os.path.abspath(data)]
+    for k, v in sorted(args.items()):
+        cmd += [f"--{k.replace('_', '-')}", str(v)]
+    return cmd
+
+
+def run(opts):
+    os.makedirs(opts.cache_dir, exist_ok=True)
+    log_dir = os.path.join(opts.cache_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    t0 = time.time()
+    data_digest = dataset_digest(opts.data, opts.cache_dir)
+    print(f"[*] Dataset {os.path.basename(opts.data)}: sha256 {data_digest[:16]} "
+          f"({time.time() - t0:.2f}s)")
+
+    report = {"started": t0, "dataset": data_digest, "jobs": {}}
+    running = {}
+    finished = {}
+    for name in opts.jobs:
+        args = job_args(name, opts)
+        key = job_key(name, data_digest, args)
+        entry = {"key": key, "args": args}
+        report["jobs"][name] = entry
+
+        if not opts.force and current_key(name) == key:
+            entry.update(status="up_to_date", wall_s=0.0)
+            print(f"[*] {name}: up to date ({key})")
+            continue
+        if not opts.force and restore(name, key, opts.cache_dir):
+            entry.update(status="cache_hit", wall_s=0.0)
+            print(f"[*] {name}: restored from cache ({key})")
+            continue
+        if not opts.force and adopt(name, key, {"args": args, "dataset": data_digest,
+                                                "adopted": time.time()}):
+            entry.update(status="adopted", wall_s=0.0)
+            print(f"[*] {name}: adopted existing artifacts without a manifest ({key})")
+            continue
+
+        log_path = os.path.join(log_dir, f"{name}-{key}.log")
+        log = open(log_path, "w")
+        print(f"[*] {name}: training ({key}), log: {log_path}")
+        proc = subprocess.Popen(command(name, args, opts.data), cwd=SCRIPT_DIR, stdout=log,
+                                stderr=subprocess.STDOUT)
+        started = time.time()
+        running[name] = (proc, log, log_path, started)
+        if opts.serial:
+            proc.wait()
+            finished[name] = (proc.returncode, time.time() - started)
+
+    # wall time per job is taken when that job exits, not in wait order
+    while len(finished) < len(running):
+        for name, (proc, _, _, started) in running.items():
+            if name not in finished and proc.poll() is not None:
+                finished[name] = (proc.returncode, time.time() - started)
+        time.sleep(0.1)
+
+    failed = []
+    for name, (proc, log, log_path, started) in running.items():
+        log.close()
+        code, wall_s = finished[name]
+        entry = report["jobs"][name]
+        entry["wall_s"] = wall_s
+        if code != 0:
+            entry["status"] = "failed"
+            failed.append(name)
+            print(f"[!] {name}: training failed (exit {code}), see {log_path}")
+            continue
+        entry["status"] = "trained"
+        write_manifest(name, entry["key"], {"args": entry["args"], "dataset": data_digest,
+                                            "wall_s": entry["wall_s"], "trained": time.time()})
+        store(name, entry["key"], opts.cache_dir, opts.keep)
+        print(f"[*] {name}: trained in {entry['wall_s']:.1f}s")
+
+    report["wall_s"] = time.time() - t0
+    report["sum_job_s"] = sum(j.get("wall_s", 0.0) for j in report["jobs"].values())
+    with open(opts.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[*] Total wall time {report['wall_s']:.1f}s (jobs sum {report['sum_job_s']:.1f}s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cached, parallel LSTM + Isolation Forest training")
+    parser.add_argument("--jobs", nargs="+", choices=list(JOBS), default=list(JOBS))
+    parser.add_argument("--data", default=DATA_PATH, help="capture the training scripts read")
+    parser.add_argument("--epochs", type=int, default=None, help="LSTM epochs (default: lstm_final.EPOCHS)")
+    parser.add_argument("--early-stopping", type=int, default=None, metavar="PATIENCE",
+                        help="LSTM early stopping patience on val_loss")
+    parser.add_argument("--force", action="store_true", help="retrain even on a cache hit")
+    parser.add_argument("--serial", action="store_true", help="train one job at a time")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--keep", type=int, default=5, help="cache entries kept per job")
+    parser.add_argument("--report", default=REPORT_PATH)
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,222 @@
+"""
+Feature engine: derived telemetry features from raw counter snapshots.
+
+A raw snapshot is one float64 vector in RAW_FIELDS order (what the agent
+samples per poll: gauges plus cumulative controller / interface counters).
+From consecutive snapshots the engine derives the METRICS vector of
+feature_schema:
+
+- pkt_in, pkt_out, flow_mod, bw: counter delta / time delta, clamped at 0
+- link_loss: 1 when the port-status counter moved or rtt > 50 ms
+- zscore_avg: cpu against the mean / std of the last `window` cpu values
+  (current included); 0 until Z_MIN_HISTORY samples or when std is 0
+- ratio_pkt_flow: pkt_in / (flow_mod + 1e-5)
+- flows_sec, table_occ, churn: not measured yet (0)
+
+The first snapshot only seeds the deltas and a snapshot with the same
+timestamp as the previous one is skipped (no output, deltas keep their
+base).
+
+Two modes share the same array kernels, so their results are bit-identical:
+
+    engine = FeatureEngine(window=50)
+    metrics = engine.update(raw)              # live: one snapshot, O(window)
+    index, metrics = compute(raws, window=50) # offline: whole capture
+
+FeatureEngine(streams=n) updates n streams sampled together (one snapshot
+row per stream, e.g. the switches of load_generator.py) in one call.
+update() keeps the cpu history in a mirrored ring (each value written at i
+and i + window), so the window is always one chronological slice and
+nothing is reallocated per sample. compute() derives
+all rates in one pass and reduces the z-score windows in chunks of
+contiguous rows with the same NumPy reductions.
+
+Rebuild a training capture from raw counters:
+    python feature_engine.py build logs/raw_counters.csv logs/training_data.csv
+"""
+
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from feature_schema import METRICS, RECORD_FIELDS, feature_rows
+
+RAW_FIELDS = ['timestamp', 'cpu', 'mem', 'rtt', 'packet_count', 'packet_out_count',
+              'flow_mod_count', 'port_status_count', 'byte_count']
+RAW = {f: i for i, f in enumerate(RAW_FIELDS)}
+
+UNMEASURED = ['flows_sec', 'table_occ', 'churn']
+
+Z_MIN_HISTORY = 5
+LINK_LOSS_RTT = 50
+RATIO_EPS = 1e-5
+CHUNK_ROWS = 65536
+
+_M = {m: i for i, m in enumerate(METRICS)}
+_T, _CPU, _RTT = RAW['timestamp'], RAW['cpu'], RAW['rtt']
+_GAUGE_SRC = slice(RAW['cpu'], RAW['rtt'] + 1)
+_GAUGE_DST = slice(_M['cpu'], _M['rtt'] + 1)
+# counters are contiguous in RAW_FIELDS; pkt_in..flow_mod contiguous in METRICS
+_COUNTERS = slice(RAW['packet_count'], RAW['byte_count'] + 1)
+_D_PKT = slice(0, 3)
+_D_PORT = RAW['port_status_count'] - RAW['packet_count']
+_D_BYTE = RAW['byte_count'] - RAW['packet_count']
+_PKT_DST = slice(_M['pkt_in'], _M['flow_mod'] + 1)
+_UNMEASURED_DST = np.array([_M[m] for m in UNMEASURED])
+
+
+def _derive(cur, prev, out):
+    """All metrics except zscore_avg for (n, RAW_FIELDS) snapshot pairs into (n, METRICS)."""
+    dt = cur[:, _T] - prev[:, _T]
+    delta = (cur[:, _COUNTERS] - prev[:, _COUNTERS]) / dt[:, None]
+    rates = np.where(delta > 0, delta, 0.0)
+    out[:, _GAUGE_DST] = cur[:, _GAUGE_SRC]
+    out[:, _PKT_DST] = rates[:, _D_PKT]
+    out[:, _M['bw']] = rates[:, _D_BYTE]
+    out[:, _UNMEASURED_DST] = 0.0
+    out[:, _M['link_loss']] = (delta[:, _D_PORT] > 0) | (cur[:, _RTT] > LINK_LOSS_RTT)
+    out[:, _M['ratio_pkt_flow']] = out[:, _M['pkt_in']] / (out[:, _M['flow_mod']] + RATIO_EPS)
+    return out
+
+
+def _zscore(windows, cpu, out):
+    """
+    z of cpu against each C-contiguous (n, k) window row (current value
+    last). Same operations as np.mean / np.std of a 1-D history (row sum,
+    divide, squared deviations, row sum, divide, sqrt), with the row sum
+    shared between mean and std.
+    """
+    k = windows.shape[1]
+    if k < Z_MIN_HISTORY:
+        out[:] = 0.0
+        return out
+    mean = np.add.reduce(windows, axis=1, keepdims=True)
+    mean /= k
+    dev = windows - mean
+    np.multiply(dev, dev, out=dev)
+    std = np.add.reduce(dev, axis=1)
+    std /= k
+    np.sqrt(std, out=std)
+    nonzero = std != 0
+    np.divide(cpu - mean[:, 0], std, out=out, where=nonzero)
+    out[~nonzero] = 0.0
+    return out
+
+
+class FeatureEngine:
+    """
+    Incremental mode: one raw snapshot in, one METRICS vector out (or, with
+    streams=n, an (n, RAW_FIELDS) snapshot in, (n, METRICS) out; the streams
+    share the snapshot timestamp).
+    """
+
+    def __init__(self, window=50, streams=1):
+        self.window = window
+        self.streams = streams
+        self.prev = np.empty((streams, len(RAW_FIELDS)))
+        self.seeded = False
+        self.count = 0                                  # samples in the cpu history
+        self._cpu = np.empty((streams, 2 * window))     # mirrored ring, see module doc
+        self._out = np.empty((streams, len(METRICS)))
+        self._z = self._out[:, _M['zscore_avg']]
+
+    def update(self, snapshot):
+        """
+        METRICS for a RAW_FIELDS snapshot, or None (first snapshot, same
+        timestamp as the previous one). The result is reused by the next
+        call.
+        """
+        snapshot = np.asarray(snapshot, dtype=np.float64)
+        cur = snapshot.reshape(self.streams, -1)
+        if not self.seeded:
+            self.prev[:] = cur
+            self.seeded = True
+            return None
+        if cur[0, _T] == self.prev[0, _T]:
+            return None
+
+        _derive(cur, self.prev, self._out)
+        self.prev[:] = cur
+
+        w = self.window
+        i = self.count % w
+        self._cpu[:, i] = self._cpu[:, i + w] = cur[:, _CPU]
+        self.count += 1
+        window = self._cpu[:, i + 1:i + 1 + w] if self.count >= w else self._cpu[:, :self.count]
+        if self.streams > 1:
+            window = np.ascontiguousarray(window)     # one row per stream
+        _zscore(window, cur[:, _CPU], self._z)
+        return self._out[0] if snapshot.ndim == 1 else self._out
+
+    def reset(self):
+        self.seeded = False
+        self.count = 0
+
+
+def compute(snapshots, window=50):
+    """
+    Batch mode over an (n, RAW_FIELDS) array of consecutive snapshots.
+    Returns (index, metrics): rows of `snapshots` that produce features and
+    their (m, METRICS) vectors, bit-identical to feeding the rows one by one
+    to a fresh FeatureEngine.
+    """
+    raw = np.asarray(snapshots, dtype=np.float64)
+    n = len(raw)
+    if n < 2:
+        return np.empty(0, dtype=np.intp), np.empty((0, len(METRICS)))
+
+    # a snapshot is skipped iff its timestamp equals the previous row's; the
+    # deltas of the others are taken against the last row that was not
+    # skipped (the seed row 0 included)
+    t = raw[:, _T]
+    keep = np.empty(n, dtype=bool)
+    keep[0] = False
+    np.not_equal(t[1:], t[:-1], out=keep[1:])
+    index = np.flatnonzero(keep)
+    base = np.flatnonzero(np.concatenate(([True], keep[1:])))
+    prev = base[np.searchsorted(base, index) - 1]
+
+    metrics = np.empty((len(index), len(METRICS)))
+    _derive(raw[index], raw[prev], metrics)
+
+    cpu = raw[index, _CPU]
+    z = np.empty(len(index))
+    # warm-up: history shorter than the window
+    head = min(window - 1, len(index))
+    for j in range(head):
+        _zscore(cpu[None, :j + 1], cpu[j:j + 1], z[j:j + 1])
+    if len(index) >= window:
+        windows = sliding_window_view(cpu, window)
+        for s in range(0, len(windows), CHUNK_ROWS):
+            rows = np.ascontiguousarray(windows[s:s + CHUNK_ROWS])
+            j = s + window - 1
+            _zscore(rows, cpu[j:j + len(rows)], z[j:j + len(rows)])
+    metrics[:, _M['zscore_avg']] = z
+    return index, metrics
+
+
+def build(raw_path, out_path, window=50):
+    """Training capture (RECORD_FIELDS CSV) from a raw counter capture."""
+    import pandas as pd
+
+    # round_trip: the same doubles the agent wrote (repr), not the fast parser's
+    raw = pd.read_csv(raw_path, usecols=RAW_FIELDS, dtype=np.float64,
+                      float_precision="round_trip")[RAW_FIELDS].to_numpy()
+    index, metrics = compute(raw, window)
+    records = feature_rows(raw[index, _T], metrics)
+    pd.DataFrame(records, columns=RECORD_FIELDS).to_csv(out_path, index=False)
+    return len(raw), len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feature engine utilities")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="derive a training capture from raw counter snapshots")
+    p_build.add_argument("raw_path")
+    p_build.add_argument("out_path")
+    p_build.add_argument("--window", type=int, default=50,
+                         help="z-score window (normalization.window_size)")
+    args = parser.parse_args()
+
+    n_raw, n_out = build(args.raw_path, args.out_path, args.window)
+    print(f"[*] {n_raw} raw snapshots -> {n_out} feature records: {args.out_path}")
@@ -0,0 +1,306 @@
+"""
+Shared-memory ring buffer transport for feature records.
+
+Single producer (telemetry agent), any number of consumers (ML pipeline,
+CSV logger, ...). Records are fixed-size float64 vectors stored in a
+memory-mapped file (by default under /dev/shm, i.e. RAM). No locks:
+
+- Every slot carries a sequence word. The writer marks it odd (2n+1)
+  while writing record n, then even (2n+2) once the values are complete,
+  and only then advances the global write sequence.
+- Readers keep their own next-sequence. If the writer has lapped a reader
+  by more than the capacity, the lost records are counted as an overrun
+  and the reader skips ahead.
+- poll() hands out a NumPy *view* of the ring (zero-copy); validate()
+  afterwards confirms none of those slots was overwritten meanwhile.
+
+CSV logging becomes an optional side consumer:
+    python feature_ring.py csv-sink logs/training_data.csv
+"""
+
+import os
+import mmap
+import time
+import argparse
+import numpy as np
+
+# Record layout: same column order as the telemetry CSV (feature_schema)
+from feature_schema import INDEX, RECORD_FIELDS, record_fields, to_records
+
+DEFAULT_PATH = "/dev/shm/sdn_features.ring"
+MAGIC = int.from_bytes(b"SDNRING1", "little")
+HEADER_WORDS = 8             # magic, capacity, width, write_seq, reserved...
+H_MAGIC, H_CAPACITY, H_WIDTH, H_WRITE_SEQ = 0, 1, 2, 3
+
+
+def _ring_size(capacity, width):
+    return 8 * (HEADER_WORDS + capacity + capacity * width)
+
+
+class _RingMap:
+    """Maps the ring file and exposes header / sequence / data arrays."""
+
+    def __init__(self, path, capacity=None, width=None, create=False):
+        self.path = path
+
+        if create:
+            size = _ring_size(capacity, width)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                existing = os.fstat(fd).st_size
+                fresh = existing != size
+                if fresh:
+                    os.ftruncate(fd, size)
+                self.mm = mmap.mmap(fd, size)
+                st = os.fstat(fd)
+            finally:
+                os.close(fd)
+        else:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                self.mm = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+                st = os.fstat(fd)
+            finally:
+                os.close(fd)
+        # identity of the mapped file, see stale()
+        self.inode, self.size = st.st_ino, st.st_size
+
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.uint64, buffer=self.mm)
+
+        if create:
+            hdr = self.header
+            if fresh or hdr[H_MAGIC] != MAGIC or hdr[H_CAPACITY] != capacity or hdr[H_WIDTH] != width:
+                hdr[H_WRITE_SEQ] = 0
+                hdr[H_CAPACITY] = capacity
+                hdr[H_WIDTH] = width
+                hdr[H_MAGIC] = MAGIC
+        elif self.header[H_MAGIC] != MAGIC:
+            raise ValueError(f"{path} is not a feature ring")
+
+        self.capacity = int(self.header[H_CAPACITY])
+        self.width = int(self.header[H_WIDTH])
+        offset = 8 * HEADER_WORDS
+        self.seqs = np.ndarray((self.capacity,), dtype=np.uint64, buffer=self.mm, offset=offset)
+        offset += 8 * self.capacity
+        self.data = np.ndarray((self.capacity, self.width), dtype=np.float64,
+                               buffer=self.mm, offset=offset)
+
+    def stale(self):
+        """
+        True once the file is no longer the one mapped: replaced (inode),
+        resized in place by a writer with another capacity / width (size),
+        or re-initialized with another layout (header). Touching the old
+        mapping past a shrunk file's end would raise SIGBUS.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        if st.st_ino != self.inode or st.st_size != self.size:
+            return True
+        return (self.header[H_CAPACITY] != self.capacity or self.header[H_WIDTH] != self.width
+                or self.header[H_MAGIC] != MAGIC)
+
+    def close(self):
+        # drop the views before unmapping
+        self.header = self.seqs = self.data = None
+        self.mm.close()
+
+
+class FeatureRingWriter:
+
+    def __init__(self, path=DEFAULT_PATH, capacity=4096, width=len(RECORD_FIELDS)):
+        self.ring = _RingMap(path, capacity, width, create=True)
+        # Resumes after an agent restart: sequence numbers keep increasing
+        self.seq = int(self.ring.header[H_WRITE_SEQ])
+
+    def publish(self, values):
+        ring = self.ring
+        n = self.seq
+        slot = n % ring.capacity
+
+        ring.seqs[slot] = 2 * n + 1          # writing
+        ring.data[slot] = values
+        ring.seqs[slot] = 2 * n + 2          # complete
+        self.seq = n + 1
+        ring.header[H_WRITE_SEQ] = self.seq
+        return n
+
+    def close(self):
+        self.ring.close()
+
+
+class FeatureRingReader:
+
+    def __init__(self, path=DEFAULT_PATH, from_start=False):
+        self.path = path
+        self.ring = None
+        self.from_start = from_start
+        self.next_seq = 0
+        self.overruns = 0        # records lost because the writer lapped us
+        self.torn = 0            # records invalidated while being read
+        self._idle = 0
+
+    def _attach(self):
+        if self.ring is not None:
+            if not self.ring.stale():
+                return True
+            # writer recreated the ring (other capacity / width, new file):
+            # remap and read the new ring from its oldest record
+            self.close()
+            if not self._map():
+                return False
+            self.next_seq = max(0, int(self.ring.header[H_WRITE_SEQ]) - self.ring.capacity)
+            return True
+        if not self._map():
+            return False
+        write_seq = int(self.ring.header[H_WRITE_SEQ])
+        self.next_seq = max(0, write_seq - self.ring.capacity) if self.from_start else write_seq
+        return True
+
+    def _map(self):
+        try:
+            self.ring = _RingMap(self.path)
+        except (FileNotFoundError, ValueError):
+            return False
+        return True
+
+    @property
+    def capacity(self):
+        return self.ring.capacity if self.ring else 0
+
+    def pending(self):
+        if not self._attach():
+            return 0
+        return int(self.ring.header[H_WRITE_SEQ]) - self.next_seq
+
+    def poll(self, max_records=None):
+        """
+        Returns (first_seq, view) for the next contiguous run of published
+        records, or (next_seq, None). The view aliases shared memory: consume
+        it, then call validate(first_seq, len(view)).
+        """
+        if not self._attach():
+            return self.next_seq, None
+        ring = self.ring
+
+        write_seq = int(ring.header[H_WRITE_SEQ])
+        if write_seq < self.next_seq:
+            # writer restarted with a fresh ring
+            self.next_seq = 0
+        if write_seq - self.next_seq > ring.capacity:
+            lost = write_seq - ring.capacity - self.next_seq
+            self.overruns += lost
+            self.next_seq += lost
+
+        available = write_seq - self.next_seq
+        if available <= 0:
+            return self.next_seq, None
+
+        start = self.next_seq % ring.capacity
+        count = min(available, ring.capacity - start)   # stop at the wrap
+        if max_records is not None:
+            count = min(count, max_records)
+
+        first = self.next_seq
+        expected = 2 * np.arange(first, first + count, dtype=np.uint64) + 2
+        valid = ring.seqs[start:start + count] == expected
+        if not valid.all():
+            # overwritten between reading write_seq and here: the lapped
+            # slots are the oldest ones, i.e. a prefix of this run
+            bad = int(np.argmax(valid)) if valid.any() else count
+            self.torn += bad
+            self.next_seq += bad
+            return self.poll(max_records)
+
+        self.next_seq += count
+        return first, ring.data[start:start + count]
+
+    def validate(self, first_seq, count):
+        """True if records [first_seq, first_seq+count) were not overwritten while in use."""
+        ring = self.ring
+        start = first_seq % ring.capacity
+        expected = 2 * np.arange(first_seq, first_seq + count, dtype=np.uint64) + 2
+        ok = bool((ring.seqs[start:start + count] == expected).all())
+        if not ok:
+            self.torn += count
+        return ok
+
+    def read(self, max_records=None):
+        """Convenience: validated copies of new records as an (n, width) array."""
+        first, view = self.poll(max_records)
+        if view is None:
+            return np.empty((0, self.ring.width if self.ring else len(RECORD_FIELDS)))
+        out = view.copy()
+        if not self.validate(first, len(out)):
+            return np.empty((0, out.shape[1]))
+        return out
+
+    def wait(self, timeout):
+        """Spin-sleep until new records arrive (backs off from 0.2 ms to 5 ms)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.pending() > 0:
+                self._idle = 0
+                return True
+            time.sleep(min(0.0002 * (2 ** min(self._idle, 5)), 0.005))
+            self._idle += 1
+        return False
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def view_to_records(view):
+    """Copies a poll() view out of shared memory as (n, feature_schema.WIDTH) records."""
+    return to_records(view, record_fields(view.shape[1]))
+
+
+# ---------------------------------------------------------------
+# Side consumer: append ring records to the CSV log
+# ---------------------------------------------------------------
+def csv_sink(ring_path, csv_path):
+    reader = FeatureRingReader(ring_path)
+    new_file = not os.path.exists(csv_path)
+
+    print(f"[*] Logging {ring_path} -> {csv_path}")
+    header = None
+    reported = 0
+    with open(csv_path, "a") as f:
+        while True:
+            first, view = reader.poll()
+            if view is None:
+                reader.wait(1.0)
+                continue
+            fields = record_fields(view.shape[1])
+            if header is None:
+                header = fields
+                if new_file:
+                    f.write(",".join(header) + "\n")
+            rows = view
+            if fields != header:
+                # ring recreated with another layout: keep the file's columns
+                rows = to_records(view, fields)[:, [INDEX[c] for c in header]]
+            lines = "".join(",".join(repr(float(v)) for v in rec) + "\n" for rec in rows)
+            if reader.validate(first, len(view)):
+                f.write(lines)
+                f.flush()
+            if reader.overruns > reported:
+                reported = reader.overruns
+                print(f"[-] CSV sink overrun: {reader.overruns} records lost so far")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feature ring utilities")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_sink = sub.add_parser("csv-sink", help="append ring records to a CSV file")
+    p_sink.add_argument("csv_path")
+    p_sink.add_argument("--ring", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    try:
+        csv_sink(args.ring, args.csv_path)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,135 @@
+"""
+Feature record schema shared by the telemetry agent, the ML pipeline and
+the training scripts.
+
+A record is one flat float64 vector with a fixed field order:
+
+    timestamp | 8 LSTM features | 12 IF features    (RECORD_FIELDS: CSV / ring columns)
+    | t_event, t_controller, t_collect, t_publish   (TRACE_FIELDS, NaN untraced)
+    | stream_id, t_ingest                           (set by the pipeline)
+
+The LSTM and IF model inputs are fixed slices of it (LSTM, IF), i.e.
+zero-copy views, so the pipeline never rebuilds dicts or lists per tick.
+Batches are (n, WIDTH) arrays; named() views them as a structured array
+(RECORD_DTYPE) for access by field name. Every model feature is one of the
+base METRICS, so producers fill a record from a metric vector with one
+gather (feature_rows).
+
+Trainers read LSTM_FEATURES / IF_FEATURES from here and inference checks
+model bundles against them: the feature order cannot drift between the
+agent, training and inference.
+"""
+
+import numpy as np
+
+from latency_trace import TRACE_FIELDS
+
+# Base metrics measured or derived by the agent (one value per sample)
+METRICS = [
+    'cpu', 'mem', 'rtt', 'pkt_in', 'pkt_out', 'flow_mod', 'flows_sec', 'bw',
+    'table_occ', 'link_loss', 'churn', 'zscore_avg', 'ratio_pkt_flow'
+]
+
+LSTM_METRICS = ['cpu', 'mem', 'rtt', 'pkt_in', 'pkt_out', 'flow_mod', 'flows_sec', 'bw']
+IF_METRICS = ['cpu', 'mem', 'rtt', 'pkt_in', 'pkt_out', 'flow_mod', 'table_occ',
+              'link_loss', 'bw', 'churn', 'zscore_avg', 'ratio_pkt_flow']
+
+LSTM_FEATURES = ['lstm_' + m for m in LSTM_METRICS]
+IF_FEATURES = ['if_' + m for m in IF_METRICS]
+
+# Column order of the telemetry CSV and of feature ring records
+RECORD_FIELDS = ['timestamp'] + LSTM_FEATURES + IF_FEATURES
+
+# Filled in by the pipeline (stream_id: CSV column of multi-switch feeds)
+PIPELINE_FIELDS = ['stream_id', 't_ingest']
+
+FIELDS = RECORD_FIELDS + TRACE_FIELDS + PIPELINE_FIELDS
+
+# Ring / CSV layouts, told apart by width: agent records, optionally with
+# trace fields and / or a stream_id column (multi-switch feeds such as
+# load_generator.py stream)
+STREAM_RECORD_FIELDS = RECORD_FIELDS + ['stream_id']
+LAYOUTS = [RECORD_FIELDS, RECORD_FIELDS + TRACE_FIELDS,
+           STREAM_RECORD_FIELDS, RECORD_FIELDS + TRACE_FIELDS + ['stream_id']]
+WIDTH = len(FIELDS)
+RECORD_DTYPE = np.dtype([(f, np.float64) for f in FIELDS])
+INDEX = {f: i for i, f in enumerate(FIELDS)}
+
+TIMESTAMP = INDEX['timestamp']
+LSTM = slice(INDEX[LSTM_FEATURES[0]], INDEX[LSTM_FEATURES[-1]] + 1)
+IF = slice(INDEX[IF_FEATURES[0]], INDEX[IF_FEATURES[-1]] + 1)
+FEATURES = slice(LSTM.start, IF.stop)
+TRACE = slice(INDEX[TRACE_FIELDS[0]], INDEX[TRACE_FIELDS[-1]] + 1)
+STREAM_ID = INDEX['stream_id']
+T_INGEST = INDEX['t_ingest']
+
+# record[FEATURES] = metrics[FEATURE_SOURCE]
+FEATURE_SOURCE = np.array([METRICS.index(m) for m in LSTM_METRICS + IF_METRICS])
+
+
+def record_fields(width):
+    """Column names for a ring / CSV of the given width (one of LAYOUTS)."""
+    for layout in LAYOUTS:
+        if len(layout) == width:
+            return layout
+    return RECORD_FIELDS
+
+
+def feature_rows(timestamps, metrics, out=None):
+    """
+    RECORD_FIELDS rows from (n, len(METRICS)) metric vectors (or one vector).
+    out: preallocated rows, at least len(RECORD_FIELDS) wide (extra fields
+    are left alone).
+    """
+    metrics = np.asarray(metrics, dtype=np.float64)
+    if out is None:
+        out = np.empty(metrics.shape[:-1] + (len(RECORD_FIELDS),))
+    out[..., TIMESTAMP] = timestamps
+    np.take(metrics, FEATURE_SOURCE, axis=-1, out=out[..., FEATURES])
+    return out
+
+
+_BLANK = np.full(WIDTH, np.nan)
+_BLANK[STREAM_ID] = 0.0
+
+
+def empty_records(n):
+    """(n, WIDTH) records: missing fields NaN, stream 0."""
+    records = np.empty((n, WIDTH))
+    records[:] = _BLANK
+    return records
+
+
+_column_maps = {}
+
+
+def _column_map(columns):
+    mapping = _column_maps.get(columns)
+    if mapping is None:
+        src = [i for i, c in enumerate(columns) if c in INDEX]
+        dst = [INDEX[columns[i]] for i in src]
+        if src == dst:
+            # leading FIELDS (ring records): one contiguous copy
+            mapping = (slice(0, len(src)), slice(0, len(src)))
+        else:
+            mapping = (np.array(src, dtype=np.intp), np.array(dst, dtype=np.intp))
+        _column_maps[columns] = mapping
+    return mapping
+
+
+def to_records(values, columns):
+    """
+    (n, WIDTH) records from an (n, len(columns)) array with the given column
+    names (ring view, parsed CSV block). Unknown columns are dropped.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    src, dst = _column_map(tuple(columns))
+    records = empty_records(len(values))
+    records[:, dst] = values[:, src]
+    return records
+
+
+def named(records):
+    """Structured (RECORD_DTYPE) view of contiguous records, e.g. named(r)['if_bw']."""
+    records = np.ascontiguousarray(records)
+    return records.view(RECORD_DTYPE).reshape(records.shape[:-1])
@@ -0,0 +1,149 @@
+"""
+End-to-end detection latency tracing.
+
+Every sample carries wall-clock timestamps (time.time(), same host) from
+each hop it passes through:
+
+    t_event       first packet-in / port-status since the previous snapshot (controller)
+    t_controller  counter snapshot taken by the controller REST handler
+    t_collect     agent received the snapshot
+    t_publish     agent published the row (ring / CSV)
+    t_ingest      pipeline read the row
+    t_infer_start / t_infer_end   model scoring
+    t_decision    decision engine result
+
+The agent adds the first four as extra columns (TRACE_FIELDS); the pipeline
+stamps the rest and feeds LatencyTracer, which keeps one log-bucketed
+histogram per hop and exports them as JSON.
+"""
+
+import os
+import json
+import math
+import time
+
+# Extra columns written by the agent (CSV and ring records)
+TRACE_FIELDS = ['t_event', 't_controller', 't_collect', 't_publish']
+
+# (hop name, from timestamp, to timestamp)
+HOPS = [
+    ("controller_wait", "t_event", "t_controller"),
+    ("agent_fetch", "t_controller", "t_collect"),
+    ("agent_process", "t_collect", "t_publish"),
+    ("transport", "t_publish", "t_ingest"),
+    ("pipeline_queue", "t_ingest", "t_infer_start"),
+    ("inference", "t_infer_start", "t_infer_end"),
+    ("decision", "t_infer_end", "t_decision"),
+]
+
+
+class LogHistogram:
+    """
+    Fixed-memory latency histogram: bucket k covers
+    [min_s * 2^(k/per_octave), min_s * 2^((k+1)/per_octave)), i.e. ~9% wide
+    buckets with the default 8 per octave, from 1 us to ~2 min.
+    """
+
+    def __init__(self, min_s=1e-6, max_s=120.0, per_octave=8):
+        self.min_s = min_s
+        self.per_octave = per_octave
+        self.n_buckets = int(math.ceil(math.log2(max_s / min_s) * per_octave)) + 1
+        self.counts = [0] * self.n_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds != seconds:      # NaN: hop not traced for this sample
+            return
+        seconds = max(seconds, 0.0)
+        if seconds <= self.min_s:
+            k = 0
+        else:
+            k = min(int(math.log2(seconds / self.min_s) * self.per_octave), self.n_buckets - 1)
+        self.counts[k] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def upper_bound(self, k):
+        return self.min_s * 2 ** ((k + 1) / self.per_octave)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        target = q * self.count
+        seen = 0
+        for k, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(self.upper_bound(k), self.max)
+        return self.max
+
+    def fraction_below(self, seconds):
+        if self.count == 0:
+            return math.nan
+        below = sum(c for k, c in enumerate(self.counts) if self.upper_bound(k) <= seconds)
+        return below / self.count
+
+    def snapshot(self):
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000,
+            "p50_ms": self.quantile(0.50) * 1000,
+            "p90_ms": self.quantile(0.90) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+            # sparse buckets: upper bound (ms) -> count
+            "buckets": {f"{self.upper_bound(k) * 1000:.4g}": c
+                        for k, c in enumerate(self.counts) if c},
+        }
+
+
+class LatencyTracer:
+
+    def __init__(self, slo_ms=None, export_path=None, export_interval=10.0):
+        self.hops = {name: LogHistogram() for name, _, _ in HOPS}
+        # origin = controller event if one happened this tick, else the snapshot
+        self.end_to_end = LogHistogram()
+        self.slo_ms = slo_ms
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self._last_export = time.time()
+
+    def record(self, trace):
+        """trace: dict of the timestamps above (missing / NaN hops are skipped)."""
+        for name, start, end in HOPS:
+            a, b = trace.get(start), trace.get(end)
+            if a is not None and b is not None:
+                self.hops[name].add(b - a)
+
+        origin = trace.get("t_event")
+        if origin is None or origin != origin:
+            origin = trace.get("t_controller")
+        if origin is not None and trace.get("t_decision") is not None:
+            self.end_to_end.add(trace["t_decision"] - origin)
+
+        if self.export_path and time.time() - self._last_export >= self.export_interval:
+            self.export()
+
+    def snapshot(self):
+        e2e = self.end_to_end.snapshot()
+        if self.slo_ms is not None and self.end_to_end.count:
+            e2e["slo_ms"] = self.slo_ms
+            e2e["within_slo"] = self.end_to_end.fraction_below(self.slo_ms / 1000.0)
+        return {
+            "updated": time.time(),
+            "end_to_end": e2e,
+            "hops": {name: h.snapshot() for name, h in self.hops.items()},
+        }
+
+    def export(self, path=None):
+        path = path or self.export_path
+        self._last_export = time.time()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
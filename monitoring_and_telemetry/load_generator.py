@@ -0,0 +1,421 @@
+"""
+Synthetic multi-switch telemetry load generator.
+
+Two parts, both driven by the same vectorized SwitchFleet (thousands of
+simulated switches spread over N controllers, per-switch counter growth,
+scripted incidents):
+
+1. controller: local HTTP stand-in for the Ryu app's /stats/sh_features.
+   Controller k listens on port + k and returns the aggregated counters of
+   its switches in the same JSON shape as controller_apps/sh_controller.py
+   (plus /stats/sh_features/switches with per-switch counters). Point the
+   telemetry agent at it instead of Mininet + Ryu:
+
+       python load_generator.py controller --controllers 1 --switches 2000 \\
+           --incident dos:60:30:0.1 --incident link_flap:150:20:0.02
+
+2. stream: writes feature records (the agent's 21 columns plus stream_id,
+   the switch index) for every switch straight into the pipeline's
+   transport, bypassing the agent:
+
+       python load_generator.py stream --switches 5000 --sink ring --speed 0
+       python load_generator.py stream --switches 200 --sink csv --out logs/load.csv
+
+Default rates and gauges are calibrated to model/training_data.csv
+(normal traffic: ~30 packet-in/s, cpu ~4 % rising towards ~65 % at
+~14000 packet-in/s, mem ~49 %, rtt 0.005 ms, no flow-mods, no interface
+bytes), so an incident-free stream scores as normal.
+
+Incident spec: kind:start_s:duration_s[:fraction[:magnitude]]
+    dos          packet-in / packet-out rate x magnitude (default 40)
+    link_flap    magnitude port-status events per second per switch (default 1)
+    memory_leak  controller memory grows by magnitude MB/s (default 4); the
+                 HTTP stand-in really allocates it, so psutil sees it
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from feature_ring import FeatureRingWriter, RECORD_FIELDS, DEFAULT_PATH
+from feature_schema import STREAM_RECORD_FIELDS, feature_rows
+from feature_engine import FeatureEngine, RAW, RAW_FIELDS
+
+# Gauges of the simulated controller (training_data.csv calibration, see above)
+BASE_CPU = 4.0
+CPU_PER_PKT_IN = 0.0045      # % per packet-in/s of the controller's mean switch
+BASE_MEM = 49.0
+BASE_RTT = 0.005
+
+INCIDENT_DEFAULTS = {"dos": 40.0, "link_flap": 1.0, "memory_leak": 4.0}
+
+# counter columns of SwitchFleet.counters: the counter fields of
+# feature_engine.RAW_FIELDS, in the same order
+PKT_IN, PKT_OUT, FLOW_MOD, PORT_STATUS, BYTES = range(5)
+COUNTERS = slice(RAW['packet_count'], RAW['byte_count'] + 1)
+# CSV output: epoch timestamps need all 17 digits (sub-second ticks must not
+# collapse into repeated samples), features stay compact
+CSV_FMT = ["%.17g"] + ["%.10g"] * (len(STREAM_RECORD_FIELDS) - 1)
+
+
+class Incident:
+
+    def __init__(self, kind, start, duration, fraction=0.05, magnitude=None):
+        if kind not in INCIDENT_DEFAULTS:
+            raise ValueError(f"unknown incident kind {kind!r} (expected one of {list(INCIDENT_DEFAULTS)})")
+        self.kind = kind
+        self.start = start
+        self.duration = duration
+        self.fraction = fraction
+        self.magnitude = INCIDENT_DEFAULTS[kind] if magnitude is None else magnitude
+        self.mask = None        # affected switches, drawn by the fleet
+
+    @classmethod
+    def parse(cls, spec):
+        parts = spec.split(":")
+        if len(parts) < 3:
+            raise ValueError(f"bad incident spec {spec!r} (kind:start:duration[:fraction[:magnitude]])")
+        kind, start, duration = parts[0], float(parts[1]), float(parts[2])
+        fraction = float(parts[3]) if len(parts) > 3 else 0.05
+        magnitude = float(parts[4]) if len(parts) > 4 else None
+        return cls(kind, start, duration, fraction, magnitude)
+
+    def active(self, t):
+        return self.start <= t < self.start + self.duration
+
+    def __repr__(self):
+        return f"{self.kind}@{self.start:g}s+{self.duration:g}s ({self.fraction:.0%}, x{self.magnitude:g})"
+
+
+class SwitchFleet:
+    """
+    Counter state of n_switches switches (round-robin over n_controllers).
+    advance(t) integrates per-switch rates (lognormal jitter, incidents)
+    up to simulated time t; all work is vectorized over switches.
+    """
+
+    def __init__(self, n_switches, n_controllers=1, incidents=(), base_pkt_in=30.0,
+                 base_flow_mod=0.0, base_bytes=0.0, jitter=0.2, seed=0):
+        self.n = n_switches
+        self.n_controllers = n_controllers
+        self.incidents = list(incidents)
+        self.jitter = jitter
+        self.rng = np.random.default_rng(seed)
+
+        self.controller_of = np.arange(n_switches) % n_controllers
+        # heterogeneous switches: per-switch base rates
+        spread = self.rng.lognormal(0.0, 0.5, size=n_switches)
+        self.base = np.zeros((n_switches, 5))
+        self.base[:, PKT_IN] = base_pkt_in * spread
+        self.base[:, PKT_OUT] = base_pkt_in * spread
+        self.base[:, FLOW_MOD] = base_flow_mod * spread
+        self.base[:, BYTES] = base_bytes * spread
+
+        for inc in self.incidents:
+            inc.mask = self.rng.random(n_switches) < inc.fraction
+            if not inc.mask.any():
+                inc.mask[self.rng.integers(n_switches)] = True
+
+        self.counters = np.zeros((n_switches, 5))
+        self.leak_mb = np.zeros(n_controllers)     # memory_leak incidents, per controller
+        self.first_event = np.full(n_controllers, np.nan)
+        self.t = 0.0
+        self.lock = threading.Lock()
+
+    def advance(self, t):
+        dt = t - self.t
+        if dt <= 0:
+            return np.zeros((self.n, 5)), 0.0
+
+        rates = self.base * self.rng.lognormal(0.0, self.jitter, size=(self.n, 1))
+        leaking = np.zeros(self.n_controllers, dtype=bool)
+        for inc in self.incidents:
+            if not inc.active(t):
+                continue
+            if inc.kind == "dos":
+                rates[inc.mask, PKT_IN] *= inc.magnitude
+                rates[inc.mask, PKT_OUT] *= inc.magnitude
+            elif inc.kind == "link_flap":
+                rates[inc.mask, PORT_STATUS] += inc.magnitude
+            elif inc.kind == "memory_leak":
+                hit = np.unique(self.controller_of[inc.mask])
+                self.leak_mb[hit] += inc.magnitude * dt
+                leaking[hit] = True
+        # leaked memory is released when the incident ends (module restart)
+        self.leak_mb[~leaking] = 0.0
+
+        # Poisson counts per interval keep small rates realistic
+        delta = self.rng.poisson(rates * dt).astype(np.float64)
+        delta[:, BYTES] = rates[:, BYTES] * dt
+        self.counters += delta
+
+        # earliest packet-in / port-status in this interval, per controller
+        events = delta[:, PKT_IN] + delta[:, PORT_STATUS]
+        per_ctrl = np.bincount(self.controller_of, weights=events, minlength=self.n_controllers)
+        first = self.t + dt / (per_ctrl + 1.0)
+        self.first_event = np.where(np.isnan(self.first_event) & (per_ctrl > 0), first, self.first_event)
+
+        self.t = t
+        return delta, dt
+
+    def controller_snapshot(self, c):
+        sel = self.controller_of == c
+        totals = self.counters[sel].sum(axis=0)
+        first_event = self.first_event[c]
+        self.first_event[c] = np.nan
+        return {
+            "packet_in": int(totals[PKT_IN]),
+            "packet_out": int(totals[PKT_OUT]),
+            "flow_mod": int(totals[FLOW_MOD]),
+            "port_status": int(totals[PORT_STATUS]),
+            "switches": int(sel.sum()),
+            "first_event": None if np.isnan(first_event) else float(first_event),
+        }
+
+    def switch_snapshot(self, c):
+        ids = np.flatnonzero(self.controller_of == c)
+        cnt = self.counters[ids].astype(np.int64)
+        return [{"dpid": int(i) + 1, "packet_in": int(r[PKT_IN]), "packet_out": int(r[PKT_OUT]),
+                 "flow_mod": int(r[FLOW_MOD]), "port_status": int(r[PORT_STATUS]),
+                 "byte_count": int(r[BYTES])} for i, r in zip(ids, cnt)]
+
+
+# ---------------------------------------------------------------
+# Part 1: HTTP controller stand-in
+# ---------------------------------------------------------------
+class ControllerStandIn:
+
+    def __init__(self, fleet, host="127.0.0.1", port=8080, leak_cap_mb=1024):
+        self.fleet = fleet
+        self.host = host
+        self.port = port
+        self.leak_cap_mb = leak_cap_mb
+        self.started = time.time()
+        self.servers = []
+        self._leak = []              # real allocations for memory_leak incidents
+
+    def _now(self):
+        return time.time() - self.started
+
+    def _handler(self, controller):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                fleet = standin.fleet
+                with fleet.lock:
+                    fleet.advance(standin._now())
+                    standin._apply_leak()
+                    if self.path.rstrip("/") == "/stats/sh_features":
+                        snap = fleet.controller_snapshot(controller)
+                        body = {
+                            "packet_in": snap["packet_in"],
+                            "packet_out": snap["packet_out"],
+                            "flow_mod": snap["flow_mod"],
+                            "port_status": snap["port_status"],
+                            "uptime": standin._now(),
+                            "snapshot_ts": time.time(),
+                            "first_event_ts": None if snap["first_event"] is None
+                            else standin.started + snap["first_event"],
+                        }
+                    elif self.path.rstrip("/") == "/stats/sh_features/switches":
+                        body = fleet.switch_snapshot(controller)
+                    else:
+                        self.send_error(404)
+                        return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        return Handler
+
+    def _apply_leak(self):
+        # hold roughly as much memory as the leaking controllers report
+        target_mb = min(float(self.fleet.leak_mb.sum()), self.leak_cap_mb)
+        while len(self._leak) < int(target_mb):
+            block = bytearray(1 << 20)
+            block[::4096] = b"\x01" * 256     # touch every page so it is resident
+            self._leak.append(block)
+        del self._leak[int(target_mb):]
+
+    def serve_forever(self):
+        threads = []
+        for c in range(self.fleet.n_controllers):
+            server = ThreadingHTTPServer((self.host, self.port + c), self._handler(c))
+            self.servers.append(server)
+            th = threading.Thread(target=server.serve_forever, daemon=True)
+            th.start()
+            threads.append(th)
+            print(f"[*] Controller {c}: http://{self.host}:{self.port + c}/stats/sh_features "
+                  f"({int((self.fleet.controller_of == c).sum())} switches)")
+        try:
+            while True:
+                time.sleep(1.0)
+        finally:
+            for server in self.servers:
+                server.shutdown()
+
+
+# ---------------------------------------------------------------
+# Part 2: direct feature-stream generator
+# ---------------------------------------------------------------
+class FeatureStream:
+    """
+    Turns fleet counters into per-switch feature rows. Simulated gauges and
+    the cumulative counters form one raw snapshot per switch; the derived
+    features come from feature_engine (one stream per switch), i.e. the
+    agent's own code.
+    """
+
+    def __init__(self, fleet, window_size=50, seed=1):
+        self.fleet = fleet
+        self.rng = np.random.default_rng(seed)
+        self.engine = FeatureEngine(window=window_size, streams=fleet.n)
+        self.raw = np.zeros((fleet.n, len(RAW_FIELDS)))
+        # seed: the counters at simulated time fleet.t
+        self.raw[:, RAW['timestamp']] = fleet.t
+        self.raw[:, COUNTERS] = fleet.counters
+        self.engine.update(self.raw)
+        self.per_controller = np.maximum(np.bincount(fleet.controller_of,
+                                                     minlength=fleet.n_controllers), 1)
+
+    def tick(self, t, wall_ts):
+        """Advances to simulated time t; returns (n_switches, 21) feature rows."""
+        fleet = self.fleet
+        delta, dt = fleet.advance(t)
+        if dt <= 0:
+            return np.empty((0, len(RECORD_FIELDS)))
+        rate = delta / dt
+        n = fleet.n
+
+        # controller load follows the mean packet-in rate of its switches
+        # (one training row = one controller's counters)
+        ctrl_pkt_in = np.bincount(fleet.controller_of, weights=rate[:, PKT_IN],
+                                  minlength=fleet.n_controllers) / self.per_controller
+        cpu = np.clip(BASE_CPU + CPU_PER_PKT_IN * ctrl_pkt_in[fleet.controller_of]
+                      + self.rng.normal(0.0, 1.0, n), 0.0, 100.0)
+        mem = np.clip(BASE_MEM + fleet.leak_mb[fleet.controller_of] / 64.0
+                      + self.rng.normal(0.0, 0.5, n), 0.0, 100.0)
+        rtt = np.abs(BASE_RTT + self.rng.normal(0.0, 0.0001, n))
+
+        raw = self.raw
+        raw[:, RAW['timestamp']] = fleet.t
+        raw[:, RAW['cpu']] = cpu
+        raw[:, RAW['mem']] = mem
+        raw[:, RAW['rtt']] = rtt
+        raw[:, COUNTERS] = fleet.counters
+        return feature_rows(wall_ts, self.engine.update(raw))
+
+
+def run_stream(fleet, sink, tick=1.0, speed=1.0, duration=None, out=None, ring_path=DEFAULT_PATH,
+               ring_capacity=1 << 16):
+    """
+    Emits one row per switch every `tick` simulated seconds. speed: simulated
+    seconds per wall second (0 = as fast as possible).
+    """
+    stream = FeatureStream(fleet)
+    writer = None
+    csv_file = None
+    if sink == "ring":
+        # stream_id travels with every record (sharded pipeline routing)
+        writer = FeatureRingWriter(ring_path, capacity=ring_capacity, width=len(STREAM_RECORD_FIELDS))
+    elif sink == "csv":
+        new = not os.path.exists(out)
+        csv_file = open(out, "a")
+        if new:
+            csv_file.write(",".join(STREAM_RECORD_FIELDS) + "\n")
+
+    ids = np.arange(fleet.n, dtype=np.float64)
+    start = time.time()
+    t = 0.0
+    rows = 0
+    last_report = start
+    try:
+        while duration is None or t < duration:
+            t += tick
+            if speed > 0:
+                delay = start + t / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            batch = stream.tick(t, time.time())
+            records = np.column_stack([batch, ids[:len(batch)]])
+
+            if writer is not None:
+                for rec in records:
+                    writer.publish(rec)
+            elif csv_file is not None:
+                np.savetxt(csv_file, records, delimiter=",", fmt=CSV_FMT)
+                csv_file.flush()
+            rows += len(batch)
+
+            now = time.time()
+            if now - last_report >= 5.0:
+                active = [repr(i) for i in fleet.incidents if i.active(t)]
+                print(f"[*] sim t={t:.0f}s rows={rows} ({rows / (now - start):.0f} rows/s)"
+                      + (f" incidents: {', '.join(active)}" if active else ""))
+                last_report = now
+    finally:
+        if writer is not None:
+            writer.close()
+        if csv_file is not None:
+            csv_file.close()
+
+    elapsed = time.time() - start
+    print(f"[*] Generated {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic multi-switch telemetry load generator")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_ctrl = sub.add_parser("controller", help="HTTP stand-in for /stats/sh_features")
+    p_ctrl.add_argument("--host", default="127.0.0.1")
+    p_ctrl.add_argument("--port", type=int, default=8080, help="controller k listens on port + k")
+    p_ctrl.add_argument("--leak-cap-mb", type=int, default=1024)
+
+    p_stream = sub.add_parser("stream", help="feature records straight into the ring / a CSV")
+    p_stream.add_argument("--sink", choices=["ring", "csv", "null"], default="ring")
+    p_stream.add_argument("--ring", default=DEFAULT_PATH)
+    p_stream.add_argument("--ring-capacity", type=int, default=1 << 16)
+    p_stream.add_argument("--out", default="logs/load_features.csv")
+    p_stream.add_argument("--tick", type=float, default=1.0, help="simulated seconds between samples")
+    p_stream.add_argument("--speed", type=float, default=1.0, help="simulated s per wall s (0 = max)")
+    p_stream.add_argument("--duration", type=float, default=None, help="simulated seconds")
+
+    for p in (p_ctrl, p_stream):
+        p.add_argument("--switches", type=int, default=100)
+        p.add_argument("--controllers", type=int, default=1)
+        p.add_argument("--incident", action="append", default=[],
+                       help="kind:start:duration[:fraction[:magnitude]] (repeatable)")
+        p.add_argument("--pkt-in-rate", type=float, default=30.0, help="mean packet-in/s per switch")
+        p.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    incidents = [Incident.parse(s) for s in args.incident]
+    fleet = SwitchFleet(args.switches, args.controllers, incidents,
+                        base_pkt_in=args.pkt_in_rate, seed=args.seed)
+    for inc in incidents:
+        print(f"[*] Incident scheduled: {inc!r}")
+
+    try:
+        if args.cmd == "controller":
+            ControllerStandIn(fleet, args.host, args.port, args.leak_cap_mb).serve_forever()
+        else:
+            run_stream(fleet, args.sink, tick=args.tick, speed=args.speed, duration=args.duration,
+                       out=args.out, ring_path=args.ring, ring_capacity=args.ring_capacity)
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -3,10 +3,12 @@ import psutil
 import requests
 import yaml
 import numpy as np
-import pandas as pd
-from collections import deque
 from prometheus_client import start_http_server, Gauge
 import os
+from feature_ring import FeatureRingWriter
+from feature_schema import METRICS, RECORD_FIELDS, TRACE, feature_rows
+from feature_engine import FeatureEngine, RAW_FIELDS
+from latency_trace import TRACE_FIELDS
 
 # --- CONFIG LOADER ---
 with open("config/settings.yaml", "r") as f:
@@ -18,35 +20,59 @@ P_MEM = Gauge('sdn_controller_mem', 'Controller Memory Usage')
 P_PKT_IN = Gauge('sdn_packet_in_rate', 'Packet In Rate')
 P_BW = Gauge('sdn_bandwidth', 'Bandwidth Usage')
 
+# positions in the METRICS vector returned by the feature engine
+CPU, MEM, PKT_IN, FLOW_MOD = (METRICS.index(m) for m in ('cpu', 'mem', 'pkt_in', 'flow_mod'))
+
 class TelemetryAgent:
     def __init__(self):
-        self.prev_stats = {}
-        self.history = deque(maxlen=config['normalization']['window_size'])
+        # Derived features (rates, link loss, z-score, ratio) from raw counter
+        # snapshots: same code path as offline rebuilds (feature_engine.py build)
+        self.features = FeatureEngine(window=config['normalization']['window_size'])
+        self.raw = np.zeros(len(RAW_FIELDS))
+        self.raw_csv_path = config['telemetry'].get('raw_csv_path') or None
+        if self.raw_csv_path and not os.path.exists(self.raw_csv_path):
+            with open(self.raw_csv_path, 'w') as f:
+                f.write(",".join(RAW_FIELDS) + "\n")
         self.controller_url = f"http://{config['controller']['ip']}:{config['controller']['rest_port']}/stats/sh_features"
+
+        # Latency tracing: per-hop timestamps travel with every row
+        self.trace = config['telemetry'].get('trace_enabled', False)
+
+        # One record reused for every sample (feature_schema layout)
+        self.fields = RECORD_FIELDS + TRACE_FIELDS if self.trace else RECORD_FIELDS
+        self.record = np.zeros(len(self.fields))
         
         # Initialize CSV logging
         if config['telemetry']['csv_enabled']:
             self.init_csv()
 
+        # Shared-memory ring for the ML pipeline (zero-copy, no CSV parsing)
+        self.ring = None
+        if config['telemetry'].get('ring_enabled', False):
+            self.ring = FeatureRingWriter(config['telemetry']['ring_path'],
+                                          capacity=config['telemetry']['ring_capacity'],
+                                          width=len(self.fields))
+            print(f"[*] Publishing features to ring: {config['telemetry']['ring_path']}")
+
     def init_csv(self):
-        columns = [
-            'timestamp',
-            # LSTM Features (8)
-            'lstm_cpu', 'lstm_mem', 'lstm_rtt', 'lstm_pkt_in', 
-            'lstm_pkt_out', 'lstm_flow_mod', 'lstm_flows_sec', 'lstm_bw',
-            # Isolation Forest Features (12)
-            'if_cpu', 'if_mem', 'if_rtt', 'if_pkt_in', 'if_pkt_out',
-            'if_flow_mod', 'if_table_occ', 'if_link_loss', 'if_bw',
-            'if_churn', 'if_zscore_avg', 'if_ratio_pkt_flow'
-        ]
+        # timestamp, LSTM features (8), Isolation Forest features (12)
+        columns = list(self.fields)
         
         # FIX: Check if file exists. If yes, skip creating headers (Append Mode).
         if not os.path.exists(config['telemetry']['csv_path']):
-            df = pd.DataFrame(columns=columns)
-            df.to_csv(config['telemetry']['csv_path'], index=False)
+            with open(config['telemetry']['csv_path'], 'w') as f:
+                f.write(",".join(columns) + "\n")
             print("[*] Created new CSV log file.")
         else:
             print("[*] Appending to existing CSV log file.")
+            # Keep the existing header: trace columns are only added to new files
+            with open(config['telemetry']['csv_path'], 'r') as f:
+                existing = f.readline().strip().split(',')
+            if self.trace and existing != columns:
+                print("[-] Existing CSV has no trace columns; latency trace goes to the ring only.")
+                columns = existing
+        # record positions of the CSV columns (header order of an existing file)
+        self.csv_index = [self.fields.index(c) for c in columns]
     
     def get_system_metrics(self):
         return {
@@ -100,6 +126,7 @@ class TelemetryAgent:
             response = requests.get(self.controller_url, timeout=2)
             if response.status_code == 200:
                 data = response.json()
+                t_collect = time.time()
                 
                 # Get Real Bandwidth (Bytes)
                 current_bytes = self.get_total_bandwidth()
@@ -114,7 +141,11 @@ class TelemetryAgent:
                     'port_status_count': data.get('port_status', 0), # NEW
                     'byte_count': current_bytes, 
                     'flow_count': 0, 
-                    'rtt': current_rtt 
+                    'rtt': current_rtt,
+                    # Latency trace (controller snapshot / first event / agent receive)
+                    't_controller': data.get('snapshot_ts', t_collect),
+                    't_event': data.get('first_event_ts'),
+                    't_collect': t_collect
                 }
         except Exception as e:
             # print(f"[-] Controller Connection Failed: {e}")
@@ -122,59 +153,6 @@ class TelemetryAgent:
         
         return None
 
-    def calculate_rates(self, current, timestamp):
-        if not self.prev_stats:
-            self.prev_stats = {'data': current, 'time': timestamp}
-            return None
-
-        time_diff = timestamp - self.prev_stats['time']
-        if time_diff == 0: return None
-
-        prev = self.prev_stats['data']
-        
-        # --- CALCULATE RATES (The Core Logic) ---
-        pkt_in_rate = (current['packet_count'] - prev.get('packet_count', 0)) / time_diff
-        pkt_out_rate = (current['packet_out_count'] - prev.get('packet_out_count', 0)) / time_diff
-        flow_mod_rate = (current['flow_mod_count'] - prev.get('flow_mod_count', 0)) / time_diff
-        
-        # Bandwidth Rate (Bytes per second)
-        bw_rate = (current['byte_count'] - prev.get('byte_count', 0)) / time_diff
-        
-        # Port Status Rate
-        port_status_rate = (current.get('port_status_count', 0) - prev.get('port_status_count', 0)) / time_diff
-        
-        # Link Loss Proxy (If bandwidth drops suddenly or RTT spikes, we infer loss)
-        link_loss = 0
-        # If port status changes (link down/up) OR RTT is huge
-        if port_status_rate > 0 or current['rtt'] > 50: 
-            link_loss = 1
-        
-        metrics = {
-            'cpu': current['cpu'],
-            'mem': current['mem'],
-            'rtt': current['rtt'],
-            'pkt_in_rate': max(0, pkt_in_rate),
-            'pkt_out_rate': max(0, pkt_out_rate),
-            'flow_mod_rate': max(0, flow_mod_rate),
-            'flows_sec': 0, 
-            'bandwidth': max(0, bw_rate),
-            'table_occupancy': 0,
-            'link_loss': link_loss,
-            'churn_rate': 0
-        }
-
-        self.prev_stats = {'data': current, 'time': timestamp}
-        self.history.append(metrics)
-        return metrics
-
-    def compute_z_score_avg(self, metrics):
-        if len(self.history) < 5: return 0
-        cpu_hist = [m['cpu'] for m in self.history]
-        mean = np.mean(cpu_hist)
-        std = np.std(cpu_hist)
-        if std == 0: return 0
-        return (metrics['cpu'] - mean) / std
-
     def run(self):
         print(f"[*] Telemetry Agent v1.0 - Listening on {config['telemetry']['prometheus_port']}")
         start_http_server(config['telemetry']['prometheus_port'])
@@ -186,39 +164,41 @@ class TelemetryAgent:
                 net_data = self.get_network_metrics()
                 
                 if net_data:
-                    raw_data = {**sys_data, **net_data}
-                    processed = self.calculate_rates(raw_data, ts)
-                    
-                    if processed:
-                        # Prepare Export Data
-                        z_score = self.compute_z_score_avg(processed)
-                        ratio_pkt_flow = processed['pkt_in_rate'] / (processed['flow_mod_rate'] + 1e-5)
-
-                        # CSV Row Construction
-                        row = {
-                            'timestamp': ts,
-                            'lstm_cpu': processed['cpu'], 'lstm_mem': processed['mem'],
-                            'lstm_rtt': processed['rtt'], 'lstm_pkt_in': processed['pkt_in_rate'],
-                            'lstm_pkt_out': processed['pkt_out_rate'], 'lstm_flow_mod': processed['flow_mod_rate'],
-                            'lstm_flows_sec': processed['flows_sec'], 'lstm_bw': processed['bandwidth'],
-                            'if_cpu': processed['cpu'], 'if_mem': processed['mem'],
-                            'if_rtt': processed['rtt'], 'if_pkt_in': processed['pkt_in_rate'],
-                            'if_pkt_out': processed['pkt_out_rate'], 'if_flow_mod': processed['flow_mod_rate'],
-                            'if_table_occ': processed['table_occupancy'], 'if_link_loss': processed['link_loss'],
-                            'if_bw': processed['bandwidth'], 'if_churn': processed['churn_rate'],
-                            'if_zscore_avg': z_score, 'if_ratio_pkt_flow': ratio_pkt_flow
-                        }
+                    raw_data = {**sys_data, **net_data, 'timestamp': ts}
+                    self.raw[:] = [raw_data[f] for f in RAW_FIELDS]
+
+                    # Raw capture: every snapshot, so features can be rebuilt offline
+                    if self.raw_csv_path:
+                        with open(self.raw_csv_path, 'a') as f:
+                            f.write(",".join(map(repr, self.raw.tolist())) + "\n")
+
+                    metrics = self.features.update(self.raw)
+
+                    if metrics is not None:
+                        # Record Construction (LSTM + IF features gathered from the metrics)
+                        record = self.record
+                        feature_rows(ts, metrics, out=record)
+
+                        if self.trace:
+                            t_event = net_data['t_event']
+                            record[TRACE] = (float('nan') if t_event is None else t_event,
+                                             net_data['t_controller'], net_data['t_collect'], time.time())
 
                         # Update Prometheus
-                        P_CPU.set(processed['cpu'])
-                        P_MEM.set(processed['mem'])
-                        P_PKT_IN.set(processed['pkt_in_rate'])
+                        P_CPU.set(metrics[CPU])
+                        P_MEM.set(metrics[MEM])
+                        P_PKT_IN.set(metrics[PKT_IN])
                         
+                        # Publish to ring first: lowest-latency consumer
+                        if self.ring is not None:
+                            self.ring.publish(record)
+
                         # Write CSV
                         if config['telemetry']['csv_enabled']:
-                            pd.DataFrame([row]).to_csv(config['telemetry']['csv_path'], mode='a', header=False, index=False)
+                            with open(config['telemetry']['csv_path'], 'a') as f:
+                                f.write(",".join(map(repr, record[self.csv_index].tolist())) + "\n")
 
-                        print(f"[Live] CPU: {processed['cpu']}% | Pkt-In Rate: {processed['pkt_in_rate']:.2f}/s | Flow-Mod: {processed['flow_mod_rate']:.2f}")
+                        print(f"[Live] CPU: {metrics[CPU]}% | Pkt-In Rate: {metrics[PKT_IN]:.2f}/s | Flow-Mod: {metrics[FLOW_MOD]:.2f}")
 
                 time.sleep(config['controller']['poll_interval'])
 
@@ -88,29 +88,21 @@ else
 fi
 
 # CHECK & TRAIN MODELS
+# The orchestrator keys each model by a hash of the dataset, training code and
+# parameters: up-to-date models are kept, cached ones restored, and stale ones
+# retrained (LSTM and IF in parallel). Wall times: model/training_report.json
 echo "[*] Checking Trained Models..."
-if [ ! -f "$MODEL_DIR/lstmModels/lstm_final_model.h5" ] || [ ! -f "$MODEL_DIR/ifmodels/isolation_forest_model.pkl" ]; then
-    echo "[*] Trained models not found. Starting Training..."
-    
-    # Train LSTM
-    echo "    Training LSTM..."
-    cd "$MODEL_DIR" || exit
-    if ! "$MODEL_PYTHON" lstm_final.py; then
-        echo "[!] LSTM Training Failed."
-        exit 1
-    fi
-    
-    # Train Isolation Forest
-    echo "    Training Isolation Forest..."
-    if ! "$MODEL_PYTHON" isolationForest.py; then
-        echo "[!] Isolation Forest Training Failed."
-        exit 1
-    fi
-    
-    cd ..
-    echo "[*] Training Complete."
-else
-    echo "[*] Models already trained."
+if ! (cd "$MODEL_DIR" && "$MODEL_PYTHON" train_orchestrator.py); then
+    echo "[!] Model Training Failed (logs in model/.train_cache/logs)."
+    exit 1
+fi
+
+# EXPORT SHARED (MEMORY-MAPPED) MODEL ARTIFACTS
+# Re-export whenever a trained model is newer than the shared copy.
+SHARED_META="$MODEL_DIR/sharedModels/meta.json"
+if [ ! -f "$SHARED_META" ] || [ "$MODEL_DIR/lstmModels/lstm_best_model.h5" -nt "$SHARED_META" ] || [ "$MODEL_DIR/ifmodels/isolation_forest_model.pkl" -nt "$SHARED_META" ]; then
+    echo "[*] Exporting shared model artifacts..."
+    (cd "$MODEL_DIR" && "$MODEL_PYTHON" shared_artifacts.py) || echo "[-] Shared export failed. Pipeline will load private model copies."
 fi
 
 # ----------------------------------------------------